@@ -10,14 +10,11 @@ import json
 import logging
 import os
 import sys
+import time
 from datetime import datetime, timezone
-import random
-import ast
 
-import boto3
-from botocore.config import Config
-from langchain.chains import LLMChain
-from langchain.llms.bedrock import Bedrock
+from aws_helper import AwsHelper, MetricsHelper
+from tracing import startSpan, tracedHandler
 
 LOGGER = logging.Logger("Content-generation", level=logging.DEBUG)
 HANDLER = logging.StreamHandler(sys.stdout)
@@ -29,7 +26,9 @@ LOGGER.addHandler(HANDLER)
 #        HELPER
 #########################
 BEDROCK_ROLE_ARN = os.environ["BEDROCK_ROLE_ARN"]
-BEDROCK_CONFIG = Config(connect_timeout=60, read_timeout=60, retries={"max_attempts": 10})
+BEDROCK_CONFIG = {"connect_timeout": 60, "read_timeout": 60, "retries": {"max_attempts": 10}}
+# Next to this module, so the path also resolves when the consolidated router imports it
+MODEL_CONFIGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_configs")
 
 MODELS_MAPPING = {
     "Bedrock: Amazon Titan": "amazon.titan-tg1-large",
@@ -45,19 +44,17 @@ MODELS_MAPPING = {
 def create_bedrock_client():
     if BEDROCK_ROLE_ARN != "None":
         LOGGER.info("Using cross-account bedrock client.")
-        role_arn = None
+        role_arn = BEDROCK_ROLE_ARN
 
         LOGGER.info(f"BEDROCK_ROLE_ARN: {BEDROCK_ROLE_ARN}")
 
         # Check if it's a non-empty string and not "None"
-        if isinstance(role_arn, str) and role_arn != "None":
-            role_arn = os.environ["BEDROCK_ROLE_ARN"]
-        else:
+        if not isinstance(role_arn, str) or not role_arn.strip():
             raise ValueError("Cross-account arn is not empty but not a string!'")
 
         LOGGER.info(f"Using ARN: {role_arn}")
 
-        sts_connection = boto3.client("sts")
+        sts_connection = AwsHelper().get_client("sts")
         acct_bedrock = sts_connection.assume_role(RoleArn=role_arn, RoleSessionName="cross_account_bedrock")
 
         access_key = acct_bedrock["Credentials"]["AccessKeyId"]
@@ -67,22 +64,25 @@ def create_bedrock_client():
 
         REGION = os.environ["BEDROCK_REGION"]
 
-        # create service client using the assumed role credentials
-        bedrock_client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=REGION,
-            endpoint_url=f"https://bedrock.{REGION}.amazonaws.com",
+        # create service client using the assumed role credentials, dropping clients of expired credentials
+        AwsHelper.evict("bedrock-runtime", REGION)
+        bedrock_client = AwsHelper().get_client(
+            "bedrock-runtime",
+            awsRegion=REGION,
             config=BEDROCK_CONFIG,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            aws_session_token=session_token,
+            credentials={
+                "aws_access_key_id": access_key,
+                "aws_secret_access_key": secret_key,
+                "aws_session_token": session_token,
+            },
+            endpoint_url=f"https://bedrock.{REGION}.amazonaws.com",
         )
 
     else:
         LOGGER.info("Using bedrock client from same account.")
-        bedrock_client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=os.environ["BEDROCK_REGION"],
+        bedrock_client = AwsHelper().get_client(
+            "bedrock-runtime",
+            awsRegion=os.environ["BEDROCK_REGION"],
             config=BEDROCK_CONFIG,
         )
         expiration = None
@@ -91,7 +91,27 @@ def create_bedrock_client():
     return bedrock_client, expiration
 
 
+def load_model_configs():
+    """
+    Fixed parameters of every model, keyed by model id
+    """
+    model_configs = {}
+    for file_name in os.listdir(MODEL_CONFIGS_DIR):
+        if file_name.endswith(".json"):
+            with open(os.path.join(MODEL_CONFIGS_DIR, file_name)) as f:
+                model_configs[file_name[: -len(".json")]] = json.load(f)
+    return model_configs
+
+
+# Init phase: runs once per execution environment, ahead of traffic under provisioned concurrency,
+# so the first request does not pay for the assume-role, the client or the model configs
+INIT_START = time.perf_counter()
 BEDROCK_CLIENT, EXPIRATION = create_bedrock_client()
+MODEL_CONFIGS = load_model_configs()
+LOGGER.info(
+    f"Initialized in {(time.perf_counter() - INIT_START) * 1000:.0f} ms "
+    f"({os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE', 'on-demand')})"
+)
 
 
 def verify_bedrock_client():
@@ -123,11 +143,13 @@ def generate_message(bedrock_runtime, model_id, system_prompt, messages, max_tok
 #########################
 
 
+@tracedHandler
 def lambda_handler(event, context):
     """
     Lambda handler
     """
     LOGGER.info("Starting execution of lambda_handler()")
+    MetricsHelper.recordColdStart(context)
 
     ### PREPARATIONS
     # Convert the 'body' string to a dictionary
@@ -143,8 +165,7 @@ def lambda_handler(event, context):
     MODEL_ID = MODELS_MAPPING[model_params_value["model_id"]]
     LOGGER.info(f"MODEL_ID: {MODEL_ID}")
 
-    with open(f"model_configs/{MODEL_ID}.json") as f:
-        fixed_params = json.load(f)
+    fixed_params = MODEL_CONFIGS[MODEL_ID]
 
     # load variable model params
     amazon_flag = False
@@ -186,7 +207,8 @@ def lambda_handler(event, context):
     if not verify_bedrock_client():
         LOGGER.info("Bedrock client expired, will refresh token.")
         global BEDROCK_CLIENT, EXPIRATION
-        BEDROCK_CLIENT, EXPIRATION = create_bedrock_client()
+        with startSpan("bedrock.refresh_client", crossAccount=EXPIRATION is not None):
+            BEDROCK_CLIENT, EXPIRATION = create_bedrock_client()
 
     accept = "application/json"
     contentType = "application/json"
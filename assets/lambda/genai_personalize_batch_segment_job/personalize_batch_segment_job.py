@@ -13,9 +13,13 @@ import sys
 import uuid
 from datetime import datetime, timezone
 
-import boto3
 import tempfile
-from botocore.exceptions import ClientError
+from urllib.parse import unquote_plus
+
+from aws_helper import AwsHelper, S3Helper
+from tracing import tracedHandler
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import BotoCoreError, ClientError
 
 
 LOGGER = logging.Logger("Content-generation", level=logging.DEBUG)
@@ -31,18 +35,212 @@ LOGGER.addHandler(HANDLER)
 bucket_name = os.environ["BUCKET_NAME"]
 role_arn = os.environ["PERSONALIZE_ROLE_ARN"]
 solution_version_arn = os.environ["SOLUTION_VERSION_ARN"]
+# Upper bound on shards per group, keep at or below the account's concurrent batch segment job quota
+MAX_SHARDS = int(os.environ.get("MAX_SHARDS", "5"))
+
+TERMINAL_FAILURE_STATUSES = ["CREATE FAILED"]
+# Seconds after which a group whose shard jobs are not all submitted is reported as failed
+SUBMISSION_TIMEOUT = 15 * 60
+
+# Outputs of single jobs and merged groups, watched by the segment snapshot Lambda
+OUTPUT_PREFIX = "personalize-output"
+# Outputs of the individual shard jobs, kept apart so that only merged outputs trigger a snapshot
+SHARD_OUTPUT_PREFIX = "personalize-shard-output"
+# Errors of a submission, upload_file raises S3UploadFailedError rather than a ClientError
+SUBMISSION_ERRORS = (ClientError, BotoCoreError, S3UploadFailedError)
+
+
+def split_into_shards(item_id_list, num_shards):
+    """
+    Split the item IDs into at most num_shards contiguous, non-empty shards
+    """
+    num_shards = max(1, min(num_shards, MAX_SHARDS, len(item_id_list)))
+    shard_size, remainder = divmod(len(item_id_list), num_shards)
+    shards = []
+    start = 0
+    for i in range(num_shards):
+        end = start + shard_size + (1 if i < remainder else 0)
+        shards.append(item_id_list[start:end])
+        start = end
+    return shards
+
+
+def upload_job_input(s3, job_name, item_id_list):
+    """
+    Upload the JSON lines input file of a batch segment job and return its S3 URI
+    """
+    json_string = "\n".join([json.dumps({"itemId": item_id}) for item_id in item_id_list])
+    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".json") as temp_file:
+        temp_file.write(json_string)
+        temp_file.flush()
+
+        # Upload the file to the specified S3 location
+        s3.upload_file(temp_file.name, bucket_name, f"personalize-input/{job_name}.json")
+
+    return f"s3://{bucket_name}/personalize-input/{job_name}.json"
+
+
+def create_job(personalize, s3, job_name, item_id_list, num_results, output_prefix=OUTPUT_PREFIX):
+    """
+    Create a single batch segment job for the given item IDs
+    """
+    s3_input = upload_job_input(s3, job_name, item_id_list)
+    s3_output = f"s3://{bucket_name}/{output_prefix}/{job_name}/"
+
+    return personalize.create_batch_segment_job(
+        jobName=job_name,
+        solutionVersionArn=solution_version_arn,
+        numResults=num_results,
+        jobInput={"s3DataSource": {"path": s3_input}},
+        jobOutput={"s3DataDestination": {"path": s3_output}},
+        roleArn=role_arn,
+    )
+
+
+def manifest_key(group_id):
+    return f"personalize-input/{group_id}.manifest.json"
+
+
+def merged_output_key(group_id):
+    # Same layout as a single job named group_id so the segment can be read like any other job output
+    return f"{OUTPUT_PREFIX}/{group_id}/{group_id}.json.out"
+
+
+def shard_output_key(job_name):
+    return f"{SHARD_OUTPUT_PREFIX}/{job_name}/{job_name}.json.out"
+
+
+def object_exists(s3, key):
+    try:
+        s3.head_object(Bucket=bucket_name, Key=key)
+        return True
+    except ClientError:
+        return False
+
+
+def create_sharded_jobs(personalize, s3, item_id_list, num_results, num_shards):
+    """
+    Submit one batch segment job per shard under a shared group id and persist the group manifest
+
+    The manifest is rewritten after every job created, so a submission failing partway through still
+    records the jobs it started and its submissionError, and the group reports CREATE FAILED instead of being lost
+    """
+    group_id = str(uuid.uuid4())
+    shards = split_into_shards(item_id_list, num_shards)
+
+    manifest = {
+        "groupId": group_id,
+        "numResults": num_results,
+        "numShards": len(shards),
+        "creationDateTime": datetime.now(timezone.utc).isoformat(),
+        "jobs": [],
+    }
+    for i, shard in enumerate(shards):
+        job_name = f"{group_id}-shard-{i}"
+        try:
+            response = create_job(personalize, s3, job_name, shard, num_results, output_prefix=SHARD_OUTPUT_PREFIX)
+        except SUBMISSION_ERRORS as e:
+            LOGGER.error(f"Shard {i} of group {group_id} could not be submitted: {e}")
+            manifest["submissionError"] = str(e)
+            s3.put_object(Bucket=bucket_name, Key=manifest_key(group_id), Body=json.dumps(manifest))
+            return manifest
+        manifest["jobs"].append({"jobName": job_name, "batchSegmentJobArn": response["batchSegmentJobArn"]})
+        s3.put_object(Bucket=bucket_name, Key=manifest_key(group_id), Body=json.dumps(manifest))
+
+    return manifest
+
+
+def iter_merged_records(jobs):
+    """
+    Stream the records of all shard outputs, deduplicating the users of each item
+
+    Shards hold disjoint item ids, so records are concatenated without holding a whole output in memory
+    """
+    for job in jobs:
+        for record in S3Helper.iterJSONLinesFromS3(bucket_name, shard_output_key(job["jobName"])):
+            # dict keeps insertion order, so users stay ranked as returned by Personalize
+            users = list(dict.fromkeys(record["output"]["usersList"]))
+            yield {"input": {"itemId": record["input"]["itemId"]}, "output": {"usersList": users}}
+
+
+def merge_group(s3, group_id):
+    """
+    Merge the shard outputs of a group once all of them are written, returns whether the merged output exists
+    """
+    if object_exists(s3, merged_output_key(group_id)):
+        return True
+    manifest = json.loads(s3.get_object(Bucket=bucket_name, Key=manifest_key(group_id))["Body"].read())
+    if "submissionError" in manifest or len(manifest["jobs"]) < manifest["numShards"]:
+        return False
+    if not all(object_exists(s3, shard_output_key(job["jobName"])) for job in manifest["jobs"]):
+        return False
+
+    LOGGER.info(f"Merging outputs of {len(manifest['jobs'])} shards for group {group_id}")
+    # shards finishing together may both merge, they write the same output
+    S3Helper.writeJSONLinesStream(iter_merged_records(manifest["jobs"]), bucket_name, merged_output_key(group_id))
+    return True
+
+
+def describe_sharded_jobs(personalize, s3, group_id):
+    """
+    Describe all jobs of a shard group, merging their outputs once every shard is ACTIVE
+    """
+    manifest = json.loads(s3.get_object(Bucket=bucket_name, Key=manifest_key(group_id))["Body"].read())
+
+    statuses = []
+    for job in manifest["jobs"]:
+        response = personalize.describe_batch_segment_job(batchSegmentJobArn=job["batchSegmentJobArn"])
+        job["status"] = response["batchSegmentJob"]["status"]
+        statuses.append(job["status"])
+
+    # jobs of a submission that failed partway through are listed, they are never merged
+    failure_reason = manifest.get("submissionError")
+    submitted = len(manifest["jobs"]) >= manifest.get("numShards", len(manifest["jobs"]))
+    if not submitted and not failure_reason:
+        submission_age = datetime.now(timezone.utc) - datetime.fromisoformat(manifest["creationDateTime"])
+        if submission_age.total_seconds() > SUBMISSION_TIMEOUT:
+            # the submitting Lambda stopped without recording an error, e.g. it timed out
+            failure_reason = f"Only {len(manifest['jobs'])} of {manifest['numShards']} shard jobs were submitted"
+
+    if failure_reason:
+        status = "CREATE FAILED"
+    elif not submitted:
+        status = "CREATE IN_PROGRESS"
+    elif any(status in TERMINAL_FAILURE_STATUSES for status in statuses):
+        status = "CREATE FAILED"
+    elif all(status == "ACTIVE" for status in statuses) and object_exists(s3, merged_output_key(group_id)):
+        status = "ACTIVE"
+    else:
+        # shard jobs running, or their outputs being merged by merge_handler
+        status = "CREATE IN_PROGRESS"
+
+    # Mirror the describe_batch_segment_job response so callers can treat a group like a single job
+    return {
+        "batchSegmentJob": {
+            "jobName": group_id,
+            "status": status,
+            "creationDateTime": manifest["creationDateTime"],
+            "numResults": manifest["numResults"],
+            "jobOutput": {"s3DataDestination": {"path": f"s3://{bucket_name}/{OUTPUT_PREFIX}/{group_id}/"}},
+            "shards": manifest["jobs"],
+            **({"failureReason": failure_reason} if failure_reason else {}),
+        }
+    }
+
+
 #########################
 #        HANDLER
 #########################
 
 
+@tracedHandler
 def lambda_handler(event, context):
     print(event)
     # Get the HTTP method from the event object
     http_method = event["requestContext"]["http"]["method"]
 
     # Create personalize client
-    personalize = boto3.client(service_name="personalize")
+    personalize = AwsHelper().get_client("personalize")
 
     # Check if the request is a POST request
     if http_method == "POST":
@@ -50,45 +248,35 @@ def lambda_handler(event, context):
         event = json.loads(event["body"])
         item_ids = event["item-ids"]
 
-        # generate job name
-        job_name = str(uuid.uuid4())
-
-        ### Upload input file to s3 with list of itemIDs
-
-        # Split the string by commas to get a list of item IDs
-        item_id_list = item_ids.split(",")
-        # Create a JSON string with the desired format
-        json_string = "\n".join([json.dumps({"itemId": item_id}) for item_id in item_id_list])
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".json") as temp_file:
-            temp_file.write(json_string)
-            temp_file.flush()
+        # Number of concurrent jobs to split the items across, 1 keeps the single job behaviour
+        num_shards = int(event.get("num-shards", 1))
 
-            # Upload the file to the specified S3 location
-            s3 = boto3.client("s3")
-            s3.upload_file(temp_file.name, bucket_name, f"personalize-input/{job_name}.json")
-
-        s3_input = f"s3://{bucket_name}/personalize-input/{job_name}.json"
-        s3_output = f"s3://{bucket_name}/personalize-output/{job_name}/"
+        # Split the string by commas to get a list of item IDs, dropping duplicates
+        item_id_list = list(dict.fromkeys(item_ids.split(",")))
         num_results = event["num-results"]
 
+        s3 = AwsHelper().get_client("s3")
+
         try:
-            create_batch_segment_response = personalize.create_batch_segment_job(
-                jobName=job_name,
-                solutionVersionArn=solution_version_arn,
-                numResults=num_results,
-                jobInput={"s3DataSource": {"path": s3_input}},
-                jobOutput={"s3DataDestination": {"path": s3_output}},
-                roleArn=role_arn,
-            )
-
-            # Return the batch segment response as a JSON response
+            if num_shards > 1 and len(item_id_list) > 1:
+                create_batch_segment_response = create_sharded_jobs(
+                    personalize, s3, item_id_list, num_results, num_shards
+                )
+            else:
+                # generate job name
+                job_name = str(uuid.uuid4())
+                create_batch_segment_response = create_job(personalize, s3, job_name, item_id_list, num_results)
+            # lets the portal bound the number of concurrent jobs it offers
+            create_batch_segment_response["maxShards"] = MAX_SHARDS
+
+            # Return the batch segment response as a JSON response, a partial submission keeps its groupId
             return {
-                "statusCode": 200,
+                "statusCode": 500 if "submissionError" in create_batch_segment_response else 200,
                 "body": json.dumps(create_batch_segment_response),
                 "headers": {"Content-Type": "application/json"},
             }
 
-        except ClientError as e:
+        except SUBMISSION_ERRORS as e:
             # Handle any errors that occur
             print(e)
             return {
@@ -100,24 +288,29 @@ def lambda_handler(event, context):
     elif http_method == "GET":
         # Extract the job ARN from the event
         event = json.loads(event["body"])
-        job_arn = event["job-arn"]
-        if not job_arn:
+        job_arn = event.get("job-arn")
+        group_id = event.get("group-id")
+        if not job_arn and not group_id:
             return {
                 "statusCode": 400,
-                "body": "job-arn parameter is required for GET request",
+                "body": "job-arn or group-id parameter is required for GET request",
                 "headers": {"Content-Type": "application/json"},
             }
 
         try:
-            # Call describe-batch-segment-job to get the job details
-            response = personalize.describe_batch_segment_job(batchSegmentJobArn=job_arn)
+            if group_id:
+                # Track all shard jobs of the group collectively
+                response = describe_sharded_jobs(personalize, AwsHelper().get_client("s3"), group_id)
+            else:
+                # Call describe-batch-segment-job to get the job details
+                response = personalize.describe_batch_segment_job(batchSegmentJobArn=job_arn)
             return {
                 "statusCode": 200,
                 "body": json.dumps(response, default=datetime_handler),
                 "headers": {"Content-Type": "application/json"},
             }
 
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
             # Handle any errors that occur
             print(e)
             return {
@@ -131,6 +324,19 @@ def lambda_handler(event, context):
         return {"statusCode": 400, "body": "Unsupported HTTP method", "headers": {"Content-Type": "application/json"}}
 
 
+@tracedHandler
+def merge_handler(event, context):
+    """
+    S3 event handler merging the outputs of a shard group once its last shard output is written
+    """
+    s3 = AwsHelper().get_client("s3")
+    for record in event["Records"]:
+        key = unquote_plus(record["s3"]["object"]["key"])
+        # personalize-shard-output/<group id>-shard-<i>/<group id>-shard-<i>.json.out
+        group_id = key.split("/")[1].rsplit("-shard-", 1)[0]
+        merge_group(s3, group_id)
+
+
 def datetime_handler(x):
     if isinstance(x, datetime):
         return x.isoformat()
@@ -6,11 +6,15 @@ Lambda that interacts with Amazon Personalize to fetch all Batch segment jobs
 #   LIBRARIES & LOGGER
 #########################
 
+import base64
 import json
 import datetime
 import logging
+import os
 import sys
-import boto3
+import time
+from aws_helper import AwsHelper
+from tracing import tracedHandler
 from botocore.exceptions import ClientError
 
 LOGGER = logging.Logger("Content-generation", level=logging.DEBUG)
@@ -18,56 +22,254 @@ HANDLER = logging.StreamHandler(sys.stdout)
 HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
 LOGGER.addHandler(HANDLER)
 
+#########################
+#        HELPER
+#########################
+
+BUCKET_NAME = os.environ["BUCKET_NAME"]
+# Persisted job index, only jobs that are not in a terminal status get described again
+INDEX_KEY = "personalize-index/batch-segment-jobs.json"
+TERMINAL_STATUSES = ["ACTIVE", "CREATE FAILED"]
+# Re-list the whole job history at most this often, incremental refreshes only list new jobs
+FULL_REFRESH_SECONDS = int(os.environ.get("FULL_REFRESH_SECONDS", "3600"))
+SORT_KEYS = ["creationDateTime", "lastUpdatedDateTime", "status", "jobName"]
+MAX_RESULTS = 100
+INDEXED_FIELDS = [
+    "batchSegmentJobArn",
+    "jobName",
+    "status",
+    "creationDateTime",
+    "lastUpdatedDateTime",
+    "failureReason",
+    "solutionVersionArn",
+]
+
+
+def to_index_entry(job):
+    """
+    Keep the indexed fields of a job summary or description, with dates as ISO strings
+    """
+    return {
+        field: json.loads(json.dumps(job[field], default=datetime_handler)) for field in INDEXED_FIELDS if field in job
+    }
+
+
+def load_index(s3):
+    """
+    Persisted job index and the ETag it was read with, None when there is no index yet
+    """
+    try:
+        response = s3.get_object(Bucket=BUCKET_NAME, Key=INDEX_KEY)
+        return json.loads(response["Body"].read()), response["ETag"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        return {"jobs": {}, "lastFullRefresh": 0}, None
+
+
+def save_index(s3, index, etag):
+    """
+    Write the index unless another request replaced it since it was read with etag
+    """
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3.put_object(Bucket=BUCKET_NAME, Key=INDEX_KEY, Body=json.dumps(index), **condition)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise
+        # the concurrent request refreshed the index too, the next one picks up anything this one saw
+        LOGGER.info("Job index changed concurrently, not overwriting it")
+
+
+def creation_time(job):
+    return datetime.datetime.fromisoformat(job["creationDateTime"])
+
+
+def list_jobs(personalize, jobs, full_refresh):
+    """
+    Add the listed job summaries to the indexed jobs, returns the ARNs listed
+
+    Stops at the first page holding no job created after the newest indexed job, unless on a full refresh.
+    """
+    newest_indexed = max((creation_time(job) for job in jobs.values()), default=None)
+    listed = set()
+    next_token = None
+    while True:
+        kwargs = {"maxResults": MAX_RESULTS}
+        if next_token:
+            kwargs["nextToken"] = next_token
+        response = personalize.list_batch_segment_jobs(**kwargs)
+
+        page_has_new = False
+        for summary in response.get("batchSegmentJobs", []):
+            job_arn = summary["batchSegmentJobArn"]
+            jobs[job_arn] = {**jobs.get(job_arn, {}), **to_index_entry(summary)}
+            listed.add(job_arn)
+            page_has_new = page_has_new or newest_indexed is None or creation_time(jobs[job_arn]) > newest_indexed
+
+        next_token = response.get("nextToken")
+        if not next_token or (not page_has_new and not full_refresh):
+            return listed
+
+
+def refresh_index(personalize, index, full_refresh=False):
+    """
+    Incrementally update the job index, returns whether it changed
+
+    New jobs are picked up by listing pages until a page holds no job created after the newest indexed
+    job (or through the whole history on a full refresh), then the remaining non-terminal jobs are
+    described. The listing order is not guaranteed, so the periodic full refresh catches stragglers.
+    """
+    jobs = index["jobs"]
+    full_refresh = full_refresh or not jobs or time.time() - index["lastFullRefresh"] > FULL_REFRESH_SECONDS
+    before = json.dumps(jobs, sort_keys=True)
+
+    refreshed = list_jobs(personalize, jobs, full_refresh)
+    for job_arn, job in jobs.items():
+        if job_arn in refreshed or job["status"] in TERMINAL_STATUSES:
+            continue
+        try:
+            description = personalize.describe_batch_segment_job(batchSegmentJobArn=job_arn)["batchSegmentJob"]
+            jobs[job_arn] = {**job, **to_index_entry(description)}
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ResourceNotFoundException":
+                raise
+            jobs[job_arn] = {**job, "status": "CREATE FAILED", "failureReason": "Job no longer exists"}
+
+    changed = full_refresh or json.dumps(jobs, sort_keys=True) != before
+    if full_refresh:
+        index["lastFullRefresh"] = time.time()
+    if changed:
+        index["updatedAt"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    return changed
+
+
+def parse_bool(value, name):
+    """
+    JSON booleans and "true" / "false" strings, anything else is rejected
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise ValueError(f"{name} must be true or false")
+
+
+def encode_token(sort_by, ascending, position):
+    return base64.urlsafe_b64encode(json.dumps([sort_by, ascending, *position]).encode()).decode()
+
+
+def decode_token(token, sort_by, ascending):
+    """
+    Position of the last job of the previous page, for the same sort only
+    """
+    try:
+        token_sort_by, token_ascending, *position = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid next-token") from None
+    if (token_sort_by, token_ascending) != (sort_by, ascending) or len(position) != 2:
+        raise ValueError("next-token does not match sort-by and ascending")
+    return tuple(position)
+
+
+def query_index(index, params):
+    """
+    Filter, sort and paginate the indexed jobs
+
+    next-token is a keyset cursor, the sort value and ARN of the last job returned, so jobs indexed
+    between two pages do not shift the following pages
+    """
+    jobs = list(index["jobs"].values())
+
+    statuses = params.get("status")
+    if statuses:
+        statuses = [statuses] if isinstance(statuses, str) else statuses
+        jobs = [job for job in jobs if job["status"] in statuses]
+
+    name_contains = params.get("name-contains")
+    if name_contains:
+        jobs = [job for job in jobs if name_contains in job["jobName"]]
+
+    sort_by = params.get("sort-by", "creationDateTime")
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"sort-by must be one of {SORT_KEYS}")
+    ascending = parse_bool(params.get("ascending", False), "ascending")
+
+    def position(job):
+        # the ARN breaks ties, so every job has a distinct position
+        return (str(job.get(sort_by) or ""), job["batchSegmentJobArn"])
+
+    jobs.sort(key=position, reverse=not ascending)
+    total_count = len(jobs)
+
+    max_results = min(int(params.get("max-results", MAX_RESULTS)), MAX_RESULTS)
+    if max_results < 1:
+        raise ValueError("max-results must be at least 1")
+    if params.get("next-token"):
+        after = decode_token(params["next-token"], sort_by, ascending)
+        jobs = [job for job in jobs if (position(job) > after if ascending else position(job) < after)]
+    page = jobs[:max_results]
+
+    return {
+        "batchSegmentJobs": page,
+        "nextToken": encode_token(sort_by, ascending, position(page[-1])) if len(jobs) > max_results else None,
+        "totalCount": total_count,
+        "indexUpdatedAt": index.get("updatedAt"),
+    }
+
+
 #########################
 #        HANDLER
 #########################
 
+
+@tracedHandler
 def lambda_handler(event, context):
-    
     # Get the HTTP method from the event object
-    http_method = event['requestContext']['http']['method']
-    
+    http_method = event["requestContext"]["http"]["method"]
+
     # Create personalize client
-    personalize = boto3.client(service_name='personalize')
+    personalize = AwsHelper().get_client("personalize")
 
     # Check if the request is a GET request
-    if http_method == 'GET':
+    if http_method == "GET":
+        params = json.loads(event.get("body") or "{}")
+        s3 = AwsHelper().get_client("s3")
         try:
-            # Call the list_batch_segment_jobs method
-            response = personalize.list_batch_segment_jobs()
+            index, etag = load_index(s3)
+            # Only first pages refresh the index, continuation pages resume after their cursor
+            if not params.get("next-token") and refresh_index(
+                personalize, index, full_refresh=params.get("refresh") == "full"
+            ):
+                save_index(s3, index, etag)
+
+            response = query_index(index, params)
 
             # Return the list of batch segment jobs as a JSON response
             return {
-                'statusCode': 200,
-                'body': json.dumps(response,default=datetime_handler),
-                'headers': {
-                    'Content-Type': 'application/json'
-                }
+                "statusCode": 200,
+                "body": json.dumps(response, default=datetime_handler),
+                "headers": {"Content-Type": "application/json"},
             }
 
+        except ValueError as e:
+            return {"statusCode": 400, "body": str(e), "headers": {"Content-Type": "application/json"}}
+
         except ClientError as e:
             # Handle any errors that occur
-            
+            print(e)
             return {
-                'statusCode': 500,
-                'body': 'An error occurred while fetching the batch segment jobs',
-                'headers': {
-                    'Content-Type': 'application/json'
-                }
+                "statusCode": 500,
+                "body": "An error occurred while fetching the batch segment jobs",
+                "headers": {"Content-Type": "application/json"},
             }
 
     else:
         # Return an error response for unsupported HTTP methods
-        return {
-            'statusCode': 400,
-            'body': 'Unsupported HTTP method',
-            'headers': {
-                'Content-Type': 'application/json'
-            }
-        }
+        return {"statusCode": 400, "body": "Unsupported HTTP method", "headers": {"Content-Type": "application/json"}}
 
 
 def datetime_handler(x):
     if isinstance(x, datetime.datetime):
         return x.isoformat()
-    raise TypeError("Unknown type")
\ No newline at end of file
+    raise TypeError("Unknown type")
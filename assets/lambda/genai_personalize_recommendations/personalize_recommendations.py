@@ -0,0 +1,214 @@
+"""
+Lambda that serves real-time Amazon Personalize recommendations for a handful of users through APIGateway
+"""
+
+#########################
+#   LIBRARIES & LOGGER
+#########################
+
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+
+from aws_helper import AwsHelper
+from tracing import tracedHandler
+from botocore.exceptions import ClientError
+
+LOGGER = logging.Logger("Content-generation", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+
+#########################
+#        HELPER
+#########################
+
+BUCKET_NAME = os.environ["BUCKET_NAME"]
+# "None" when no campaign is deployed, recommendations then come from the latest batch segment output
+CAMPAIGN_ARN = os.environ.get("CAMPAIGN_ARN", "None")
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "300"))
+# "local" serves recommendations from LOCAL_RECOMMENDATIONS_PATH instead of Amazon Personalize
+PERSONALIZE_RUNTIME = os.environ.get("PERSONALIZE_RUNTIME", "aws")
+LOCAL_RECOMMENDATIONS_PATH = os.environ.get("LOCAL_RECOMMENDATIONS_PATH", "recommendations.json")
+# Entries kept per warm container, the least recently used ones are evicted first
+MAX_CACHED_RECOMMENDATIONS = int(os.environ.get("MAX_CACHED_RECOMMENDATIONS", "10000"))
+MAX_USERS = 25
+BATCH_OUTPUT_PREFIX = "personalize-output/"
+# personalize-output/<job>/<job>.json.out, written by single jobs and by the merge of a shard group
+MERGED_OUTPUT_KEY = re.compile(rf"^{BATCH_OUTPUT_PREFIX}(?P<job>[^/]+)/(?P=job)\.json\.out$")
+
+# Warm invocations reuse these caches
+# (user id, number of results) -> (expiry, recommended items)
+RECOMMENDATIONS_CACHE = OrderedDict()
+# latest batch output -> (expiry, S3 key, user id -> recommended items)
+BATCH_INDEX_CACHE = OrderedDict()
+
+
+class LocalPersonalizeRuntime:
+    """
+    Local stand-in for the personalize-runtime client, serving recommendations from a JSON file
+    of the form {"<user id>": ["<item id>", ...]}
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.recommendations = json.load(f)
+
+    def get_recommendations(self, campaignArn, userId, numResults=25, **kwargs):
+        items = self.recommendations.get(userId, [])[:numResults]
+        return {"itemList": [{"itemId": item_id, "score": 1.0 / (rank + 1)} for rank, item_id in enumerate(items)]}
+
+
+def create_personalize_runtime():
+    if PERSONALIZE_RUNTIME == "local":
+        LOGGER.info(f"Using local Personalize stand-in from {LOCAL_RECOMMENDATIONS_PATH}")
+        return LocalPersonalizeRuntime(LOCAL_RECOMMENDATIONS_PATH)
+    return AwsHelper().get_client("personalize-runtime")
+
+
+def get_cached(cache, key):
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        cache.move_to_end(key)
+        return entry[1]
+    cache.pop(key, None)
+    return None
+
+
+def put_cached(cache, key, value):
+    cache[key] = (time.time() + CACHE_TTL_SECONDS, value)
+    cache.move_to_end(key)
+    while len(cache) > MAX_CACHED_RECOMMENDATIONS:
+        cache.popitem(last=False)
+
+
+def recommend_from_campaign(personalize_runtime, user_id, num_results):
+    """
+    Real-time recommendations from the deployed campaign
+    """
+    response = personalize_runtime.get_recommendations(campaignArn=CAMPAIGN_ARN, userId=user_id, numResults=num_results)
+    return [{"itemId": item["itemId"], "score": item.get("score")} for item in response["itemList"]]
+
+
+def is_merged_output(key):
+    """
+    Whether a key is the complete output of a job or shard group, not the partial output of one shard
+    """
+    match = MERGED_OUTPUT_KEY.match(key)
+    # shard jobs submitted before their outputs moved out of personalize-output/ still live there
+    return match is not None and "-shard-" not in match.group("job")
+
+
+def latest_batch_output_key(s3):
+    """
+    Key of the most recent batch segment output
+    """
+    latest = None
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=BATCH_OUTPUT_PREFIX):
+        for obj in page.get("Contents", []):
+            if is_merged_output(obj["Key"]) and (latest is None or obj["LastModified"] > latest["LastModified"]):
+                latest = obj
+    return latest["Key"] if latest else None
+
+
+def batch_user_index(s3):
+    """
+    Invert the latest batch segment output into user id -> items the user was segmented for
+    """
+    cached = get_cached(BATCH_INDEX_CACHE, "latest")
+    if cached is not None:
+        return cached
+
+    key = latest_batch_output_key(s3)
+    index = {}
+    if key is not None:
+        output = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+        for line in output["Body"].iter_lines():
+            if not line:
+                continue
+            record = json.loads(line)
+            item_id = record["input"]["itemId"]
+            users = record["output"]["usersList"]
+            for rank, user_id in enumerate(users):
+                # Users ranked higher in an item's segment get a higher score for that item
+                index.setdefault(user_id, []).append({"itemId": item_id, "score": 1.0 - rank / len(users)})
+        for items in index.values():
+            items.sort(key=lambda item: item["score"], reverse=True)
+
+    put_cached(BATCH_INDEX_CACHE, "latest", (key, index))
+    return key, index
+
+
+#########################
+#        HANDLER
+#########################
+
+
+@tracedHandler
+def lambda_handler(event, context):
+    # Get the HTTP method from the event object
+    http_method = event["requestContext"]["http"]["method"]
+
+    # Check if the request is a POST request
+    if http_method == "POST":
+        # parse event
+        event = json.loads(event["body"])
+        user_ids = event["user-ids"]
+        if isinstance(user_ids, str):
+            user_ids = [user_id.strip() for user_id in user_ids.split(",") if user_id.strip()]
+        num_results = int(event.get("num-results", 5))
+
+        if not user_ids or len(user_ids) > MAX_USERS:
+            return {
+                "statusCode": 400,
+                "body": f"Between 1 and {MAX_USERS} user-ids are required",
+                "headers": {"Content-Type": "application/json"},
+            }
+
+        use_campaign = CAMPAIGN_ARN != "None" or PERSONALIZE_RUNTIME == "local"
+        source = "campaign" if use_campaign else "batch"
+
+        try:
+            recommendations = {}
+            cached_users = []
+            if use_campaign:
+                personalize_runtime = create_personalize_runtime()
+                for user_id in user_ids:
+                    items = get_cached(RECOMMENDATIONS_CACHE, (user_id, num_results))
+                    if items is None:
+                        items = recommend_from_campaign(personalize_runtime, user_id, num_results)
+                        put_cached(RECOMMENDATIONS_CACHE, (user_id, num_results), items)
+                    else:
+                        cached_users.append(user_id)
+                    recommendations[user_id] = items
+            else:
+                # No campaign deployed, fall back to the latest batch segment output
+                source_key, index = batch_user_index(AwsHelper().get_client("s3"))
+                source = f"batch:{source_key}"
+                for user_id in user_ids:
+                    recommendations[user_id] = index.get(user_id, [])[:num_results]
+
+            return {
+                "statusCode": 200,
+                "body": json.dumps({"recommendations": recommendations, "source": source, "cachedUsers": cached_users}),
+                "headers": {"Content-Type": "application/json"},
+            }
+
+        except ClientError as e:
+            # Handle any errors that occur
+            print(e)
+            return {
+                "statusCode": 500,
+                "body": "An error occurred while fetching the recommendations",
+                "headers": {"Content-Type": "application/json"},
+            }
+
+    else:
+        # Return an error response for unsupported HTTP methods
+        return {"statusCode": 400, "body": "Unsupported HTTP method", "headers": {"Content-Type": "application/json"}}
@@ -0,0 +1,141 @@
+"""
+Lambda that materializes Amazon Personalize batch segment outputs into ready-to-load segment snapshots
+"""
+
+#########################
+#   LIBRARIES & LOGGER
+#########################
+
+import io
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+
+import pandas as pd
+from aws_helper import AwsHelper
+from tracing import tracedHandler
+from botocore.exceptions import ClientError
+
+LOGGER = logging.Logger("Content-generation", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+
+#########################
+#        HELPER
+#########################
+
+BUCKET_NAME = os.environ["BUCKET_NAME"]
+# User profiles joined onto the recommended users
+USER_DATA_KEY = os.environ.get("USER_DATA_KEY", "demo-data/df_segment_data.csv")
+SNAPSHOT_PREFIX = "personalize-segments"
+
+
+def snapshot_keys(job_name):
+    """
+    S3 keys of the segment snapshot and its statistics for a batch segment job
+    """
+    return f"{SNAPSHOT_PREFIX}/{job_name}/segment.parquet", f"{SNAPSHOT_PREFIX}/{job_name}/stats.json"
+
+
+def parse_segment_output(body):
+    """
+    Parse the JSON lines output of a batch segment job into (itemId, userId) rows
+    """
+    data = []
+    for line in body.iter_lines():
+        if not line:
+            continue
+        item = json.loads(line)
+        item_id = item["input"]["itemId"]
+        for user_id in item["output"]["usersList"]:
+            data.append({"itemId": item_id, "userId": user_id})
+    return pd.DataFrame(data, columns=["itemId", "userId"])
+
+
+def column_statistics(df):
+    """
+    Per column statistics stored next to the snapshot
+    """
+    stats = {}
+    for col in df.columns:
+        series = df[col]
+        col_stats = {
+            "dtype": str(series.dtype),
+            "nullCount": int(series.isna().sum()),
+            "distinctCount": int(series.nunique(dropna=True)),
+        }
+        if pd.api.types.is_numeric_dtype(series) and series.notna().any():
+            col_stats["min"] = float(series.min())
+            col_stats["max"] = float(series.max())
+            col_stats["mean"] = float(series.mean())
+        stats[col] = col_stats
+    return stats
+
+
+def materialize_segment(s3, key):
+    """
+    Join the batch segment output with user profiles and write the segment snapshot
+    """
+    # personalize-output/<job name>/<input file>.json.out
+    job_name = key.split("/")[1]
+
+    output = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    df_recommended_segments = parse_segment_output(output["Body"])
+
+    user_data = pd.read_csv(s3.get_object(Bucket=BUCKET_NAME, Key=USER_DATA_KEY)["Body"])
+    # Convert both columns to the same data type before joining
+    df_recommended_segments["userId"] = df_recommended_segments["userId"].astype(str)
+    user_data["User.UserId"] = user_data["User.UserId"].astype(str)
+    combined_df = df_recommended_segments.merge(user_data, left_on="userId", right_on="User.UserId", how="left")
+
+    segment_key, stats_key = snapshot_keys(job_name)
+
+    buffer = io.BytesIO()
+    combined_df.to_parquet(buffer, index=False)
+    s3.put_object(Bucket=BUCKET_NAME, Key=segment_key, Body=buffer.getvalue())
+
+    stats = {
+        "jobName": job_name,
+        "source": f"s3://{BUCKET_NAME}/{key}",
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "rowCount": len(combined_df),
+        "columnCount": len(combined_df.columns),
+        "columns": column_statistics(combined_df),
+    }
+    s3.put_object(Bucket=BUCKET_NAME, Key=stats_key, Body=json.dumps(stats))
+
+    LOGGER.info(f"Materialized segment {job_name} with {len(combined_df)} rows to s3://{BUCKET_NAME}/{segment_key}")
+    return stats
+
+
+#########################
+#        HANDLER
+#########################
+
+
+@tracedHandler
+def lambda_handler(event, context):
+    """
+    Triggered by S3 object creation under personalize-output/
+    """
+    s3 = AwsHelper().get_client("s3")
+
+    snapshots = []
+    for record in event["Records"]:
+        key = unquote_plus(record["s3"]["object"]["key"])
+        if not key.endswith(".json.out"):
+            LOGGER.info(f"Skipping {key}")
+            continue
+
+        try:
+            snapshots.append(materialize_segment(s3, key))
+        except ClientError as e:
+            # Handle any errors that occur, View Segment falls back to reading the raw output
+            LOGGER.error(f"An error occurred while materializing {key}: {e}")
+
+    return {"statusCode": 200, "body": json.dumps(snapshots)}
@@ -12,7 +12,8 @@ import os
 import sys
 import datetime
 
-import boto3
+from aws_helper import AwsHelper
+from tracing import tracedHandler
 from botocore.exceptions import ClientError
 
 
@@ -29,12 +30,74 @@ LOGGER.addHandler(HANDLER)
 PINPOINT_PROJECT_ID = os.environ["PINPOINT_PROJECT_ID"]
 PINPOINT_EXPORT_ROLE_ARN = os.environ["PINPOINT_EXPORT_ROLE_ARN"]
 S3_BUCKET_NAME = os.environ["BUCKET_NAME"]
+# Seconds a completed export of an unchanged segment is handed out again instead of exporting anew
+EXPORT_REUSE_WINDOW = int(os.environ.get("EXPORT_REUSE_WINDOW", "3600"))
+PAGE_SIZE = "100"
+# Export jobs of the project looked through for the segment, newest pages first
+MAX_EXPORT_JOB_PAGES = 5
+
+
+def parse_date(value):
+    """
+    Pinpoint ISO 8601 timestamp as an aware datetime
+    """
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def latest_export_job(client, segment_id, s3_url_prefix):
+    """
+    Most recent export job of a segment to our prefix, None if it was never exported
+    """
+    latest = None
+    token = None
+    for _ in range(MAX_EXPORT_JOB_PAGES):
+        kwargs = {"ApplicationId": PINPOINT_PROJECT_ID, "PageSize": PAGE_SIZE}
+        if token:
+            kwargs["Token"] = token
+        response = client.get_export_jobs(**kwargs)["ExportJobsResponse"]
+        for job in response.get("Item", []):
+            definition = job.get("Definition", {})
+            if definition.get("SegmentId") != segment_id or definition.get("S3UrlPrefix") != s3_url_prefix:
+                continue
+            if latest is None or parse_date(job["CreationDate"]) > parse_date(latest["CreationDate"]):
+                latest = job
+        token = response.get("NextToken")
+        if not token:
+            break
+    return latest
+
+
+def reusable_export_job(client, segment_id, s3_url_prefix):
+    """
+    Export job whose files still match the segment, None when a new export is needed
+
+    The latest export is reused when it is still running, or when it completed within
+    EXPORT_REUSE_WINDOW and after the segment was last modified. Only the latest export qualifies,
+    as the S3 Lambda picks the newest files under the prefix.
+    """
+    job = latest_export_job(client, segment_id, s3_url_prefix)
+    if job is None or job["JobStatus"] in ("FAILED", "FAILING"):
+        return None
+    if job["JobStatus"] != "COMPLETED":
+        return job
+
+    segment = client.get_segment(ApplicationId=PINPOINT_PROJECT_ID, SegmentId=segment_id)["SegmentResponse"]
+    segment_modified = parse_date(segment.get("LastModifiedDate") or segment["CreationDate"])
+    completed = parse_date(job.get("CompletionDate") or job["CreationDate"])
+    age = (datetime.datetime.now(datetime.timezone.utc) - completed).total_seconds()
+    if age > EXPORT_REUSE_WINDOW or completed < segment_modified:
+        return None
+    if job["Definition"].get("SegmentVersion") not in (None, segment.get("Version")):
+        return None
+    return job
+
 
 #########################
 #        HANDLER
 #########################
 
 
+@tracedHandler
 def lambda_handler(event, context):
     # Get the HTTP method from the event object
     http_method = event['requestContext']['http']['method']
@@ -49,7 +112,7 @@ def lambda_handler(event, context):
         export_job_id = event["job-id"]
         
         # Create a Pinpoint client
-        client = boto3.client('pinpoint')
+        client = AwsHelper().get_client('pinpoint')
 
         try:
             # Perform the get-segments operation
@@ -86,23 +149,33 @@ def lambda_handler(event, context):
         print("Pinpoint Create Export Job Event")
         print(event)
         # Create a Pinpoint client
-        client = boto3.client('pinpoint')
+        client = AwsHelper().get_client('pinpoint')
         # parse event
         event = json.loads(event["body"])
         segment_id = event["segment-id"]
+        s3_url_prefix = f"s3://{S3_BUCKET_NAME}/exported-segments/{segment_id}/"
         try:
-            # Perform the create-export-job operation
-            response = client.create_export_job(
-                ApplicationId=PINPOINT_PROJECT_ID,
-                ExportJobRequest={
-                    'RoleArn': PINPOINT_EXPORT_ROLE_ARN,
-                    'S3UrlPrefix': f"s3://{S3_BUCKET_NAME}/exported-segments/{segment_id}/",
-                    'SegmentId': segment_id
-                }
-            )
-            # Extract the job status
-
-            export_job_response = response['ExportJobResponse']
+            # Hand out the previous export when the segment did not change since
+            export_job_response = None
+            if not event.get("force-new"):
+                export_job_response = reusable_export_job(client, segment_id, s3_url_prefix)
+
+            if export_job_response is not None:
+                LOGGER.info(f"Reusing export job {export_job_response['Id']} of segment {segment_id}")
+                export_job_response["Reused"] = True
+            else:
+                # Perform the create-export-job operation
+                response = client.create_export_job(
+                    ApplicationId=PINPOINT_PROJECT_ID,
+                    ExportJobRequest={
+                        'RoleArn': PINPOINT_EXPORT_ROLE_ARN,
+                        'S3UrlPrefix': s3_url_prefix,
+                        'SegmentId': segment_id
+                    }
+                )
+                # Extract the job status
+                export_job_response = response['ExportJobResponse']
+                export_job_response["Reused"] = False
 
             # Return the export job response as a JSON response
             return {
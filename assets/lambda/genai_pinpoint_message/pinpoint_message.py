@@ -12,7 +12,8 @@ import os
 import sys
 from datetime import datetime, timezone
 
-import boto3
+from aws_helper import AwsHelper
+from tracing import tracedHandler
 from botocore.exceptions import ClientError
 
 
@@ -36,6 +37,7 @@ SMS_IDENTITY = os.environ["SMS_IDENTITY"]
 #########################
 
 
+@tracedHandler
 def lambda_handler(event, context):
     # Get the HTTP method from the event object
     http_method = event["requestContext"]["http"]["method"]
@@ -52,7 +54,7 @@ def lambda_handler(event, context):
         message_body_html = event["message-body-html"]
         message_body_text = event["message-body-text"]
         # Create a Pinpoint client
-        client = boto3.client("pinpoint")
+        client = AwsHelper().get_client("pinpoint")
 
         # Common parts of the MessageRequest payload
         message_request = {"Addresses": {address: {"ChannelType": channel}}}
@@ -10,9 +10,11 @@ import json
 import logging
 import os
 import sys
+import time
 from datetime import datetime, timezone
 
-import boto3
+from aws_helper import AwsHelper
+from tracing import tracedHandler
 from botocore.exceptions import ClientError
 
 
@@ -27,12 +29,59 @@ LOGGER.addHandler(HANDLER)
 #########################
 
 PINPOINT_PROJECT_ID = os.environ["PINPOINT_PROJECT_ID"]
+PAGE_SIZE = "100"
+# Seconds a warm container serves the segment list of a project without listing it again
+SEGMENT_CACHE_TTL = int(os.environ.get("SEGMENT_CACHE_TTL", "30"))
+# Project id -> {"segments", "version", "listedAt"}
+_SEGMENT_CACHE = {}
+
+
+def list_segments(client, project_id):
+    """
+    All segments of a project, following NextToken through every page
+    """
+    segments = []
+    token = None
+    while True:
+        kwargs = {"ApplicationId": project_id, "PageSize": PAGE_SIZE}
+        if token:
+            kwargs["Token"] = token
+        response = client.get_segments(**kwargs)["SegmentsResponse"]
+        segments += response.get("Item", [])
+        token = response.get("NextToken")
+        if not token:
+            return segments
+
+
+def segments_version(segments):
+    """
+    Version of a segment list, changes when a segment is created, modified or deleted
+    """
+    last_modified = max(
+        (segment.get("LastModifiedDate") or segment.get("CreationDate", "") for segment in segments),
+        default="",
+    )
+    return f"{last_modified}|{len(segments)}"
+
+
+def get_cached_segments(client, project_id):
+    """
+    Segment list of a project, revalidated against Pinpoint once SEGMENT_CACHE_TTL has passed
+    """
+    entry = _SEGMENT_CACHE.get(project_id)
+    if entry is None or time.time() - entry["listedAt"] > SEGMENT_CACHE_TTL:
+        segments = list_segments(client, project_id)
+        entry = {"segments": segments, "version": segments_version(segments), "listedAt": time.time()}
+        _SEGMENT_CACHE[project_id] = entry
+    return entry
+
 
 #########################
 #        HANDLER
 #########################
 
 
+@tracedHandler
 def lambda_handler(event, context):
     # Get the HTTP method from the event object
     http_method = event['requestContext']['http']['method']
@@ -44,21 +93,27 @@ def lambda_handler(event, context):
         pinpoint_project_id = os.environ['PINPOINT_PROJECT_ID']
         
         # Create a Pinpoint client
-        client = boto3.client('pinpoint')
+        client = AwsHelper().get_client('pinpoint')
+        # Version of the segment list the caller already holds, if any
+        known_version = json.loads(event.get("body") or "{}").get("version")
 
         try:
-            # Perform the get-segments operation
-            response = client.get_segments(
-                ApplicationId=pinpoint_project_id
-            )
-            
-            # Extract the segments
-            segments = response['SegmentsResponse']['Item']
+            # Fetch every page of segments, served from the warm container cache when still fresh
+            entry = get_cached_segments(client, pinpoint_project_id)
+
+            body = {
+                "ProjectId": pinpoint_project_id,
+                "Version": entry["version"],
+                "NotModified": entry["version"] == known_version,
+            }
+            # The caller keeps its copy when nothing changed
+            if not body["NotModified"]:
+                body["Segments"] = entry["segments"]
 
             # Return the segments as a JSON response
             return {
                 'statusCode': 200,
-                'body': json.dumps(segments),
+                'body': json.dumps(body),
                 'headers': {
                     'Content-Type': 'application/json'
                 }
@@ -0,0 +1,88 @@
+"""
+Lambda serving every portal API route from one function (lambda.deployment_mode: consolidated)
+
+Dispatches on the API Gateway routeKey to the handler of the per-route Lambda. Route modules are
+imported on their first call only, so a cold start pays for the route it serves, and all routes
+share the warm boto3 clients of the AwsHelper registry and the module-level caches.
+"""
+
+#########################
+#   LIBRARIES & LOGGER
+#########################
+
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+from aws_helper import MetricsHelper
+from tracing import tracedHandler
+
+LOGGER = logging.Logger("Router", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+
+#########################
+#        HELPER
+#########################
+
+# routeKey -> module of the per-route Lambda, relative to the assets/lambda directory
+ROUTES = {
+    "POST /content/bedrock": "bedrock_content_generation_lambda.bedrock_content_generation_lambda",
+    "GET /pinpoint/segment": "genai_pinpoint_segment.pinpoint_segment",
+    "GET /pinpoint/job": "genai_pinpoint_job.pinpoint_job",
+    "POST /pinpoint/job": "genai_pinpoint_job.pinpoint_job",
+    "POST /pinpoint/message": "genai_pinpoint_message.pinpoint_message",
+    "GET /s3": "genai_s3.s3_fetch",
+    "GET /personalize/batch-segment-job": "genai_personalize_batch_segment_job.personalize_batch_segment_job",
+    "POST /personalize/batch-segment-job": "genai_personalize_batch_segment_job.personalize_batch_segment_job",
+    "GET /personalize/batch-segment-jobs": "genai_personalize_batch_segment_jobs.personalize_batch_segment_jobs",
+    "POST /personalize/recommendations": "genai_personalize_recommendations.personalize_recommendations",
+}
+
+# Routes imported during the init phase, e.g. "POST /content/bedrock" under provisioned concurrency
+PRELOAD_ROUTES = [route.strip() for route in os.environ.get("ROUTER_PRELOAD_ROUTES", "").split(",") if route.strip()]
+
+# module -> lambda_handler, filled as routes are first called
+_HANDLERS = {}
+
+
+def get_handler(module_name):
+    """
+    Handler of a route module, imported once per execution environment
+    """
+    if module_name not in _HANDLERS:
+        start = time.perf_counter()
+        _HANDLERS[module_name] = importlib.import_module(module_name).lambda_handler
+        LOGGER.info(f"Imported {module_name} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return _HANDLERS[module_name]
+
+
+for preload_route in PRELOAD_ROUTES:
+    get_handler(ROUTES[preload_route])
+
+
+#########################
+#        HANDLER
+#########################
+
+
+@tracedHandler
+def lambda_handler(event, context):
+    cold_start = MetricsHelper.recordColdStart(context)
+
+    route_key = event.get("routeKey")
+    module_name = ROUTES.get(route_key)
+    LOGGER.info(f"Routing {route_key} (cold start: {cold_start})")
+    if module_name is None:
+        return {
+            "statusCode": 404,
+            "body": json.dumps(f"Unknown route {route_key}"),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+    return get_handler(module_name)(event, context)
@@ -12,7 +12,8 @@ import os
 import sys
 import datetime
 
-import boto3
+from aws_helper import AwsHelper
+from tracing import tracedHandler
 from botocore.exceptions import ClientError
 
 
@@ -32,13 +33,14 @@ LOGGER.addHandler(HANDLER)
 #        HANDLER
 #########################
 
+@tracedHandler
 def lambda_handler(event, context):
     # Get the HTTP method from the event object
     http_method = event['requestContext']['http']['method']
     # Check if the request is a GET request
     if http_method == 'GET':
         # Initialize the S3 client
-        s3_client = boto3.client('s3')
+        s3_client = AwsHelper().get_client('s3')
         # parse event
         event = json.loads(event["body"])
         # Get S3 url prefix and total number of pieces from the event
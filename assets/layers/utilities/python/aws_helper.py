@@ -1,13 +1,107 @@
+import codecs
 import csv
 import io
 import json
+import logging
 import os
+import queue
+import sys
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 import boto3
 from boto3.dynamodb.conditions import Key
 from botocore.client import Config
 
+from tracing import instrumentClient
+
+LOGGER = logging.Logger("AWS-Helper", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+# Connection pool size of every cached client, raise it for highly concurrent callers
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "50"))
+DEFAULT_CONFIG = {"retries": {"max_attempts": 6}, "max_pool_connections": MAX_POOL_CONNECTIONS}
+
+# Process-wide registry, clients are thread-safe and shared by all threads
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+# Resources are not thread-safe, so they are cached per thread
+_RESOURCES = threading.local()
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most size elements
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_DONE = object()
+
+
+def _offer(results, stopped, value):
+    """
+    Put value on the bounded results queue, a blocked producer gives up once the consumer is gone
+    """
+    while not stopped.is_set():
+        try:
+            results.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def iterConcurrently(producers, maxWorkers=8, maxBuffered=None):
+    """
+    Drain several generators on worker threads, yielding their values as they arrive
+
+    At most maxBuffered values (default 2 * maxWorkers) wait for the consumer, producers block beyond
+    that, so they only run ahead of a slow consumer by a bounded amount. Closing the generator early,
+    e.g. breaking out of the loop, stops the producers after their current value instead of draining them.
+    """
+    results = queue.Queue(maxsize=maxBuffered or 2 * maxWorkers)
+    stopped = threading.Event()
+
+    def drain(producer):
+        try:
+            for value in producer:
+                if not _offer(results, stopped, value) or stopped.is_set():
+                    return
+        except Exception as e:
+            _offer(results, stopped, e)
+        finally:
+            _offer(results, stopped, _DONE)
+
+    executor = ThreadPoolExecutor(max_workers=maxWorkers)
+    try:
+        for producer in producers:
+            executor.submit(drain, producer)
+
+        pending = len(producers)
+        while pending:
+            value = results.get()
+            if value is _DONE:
+                pending -= 1
+            elif isinstance(value, Exception):
+                raise value
+            else:
+                yield value
+    finally:
+        stopped.set()
+        # producers not started yet are dropped, the running ones exit without being waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+
 
 class SQSHelper:
     @staticmethod
@@ -17,20 +111,263 @@ class SQSHelper:
 
         return client.send_message(QueueUrl=qUrl, MessageBody=message)
 
+    @staticmethod
+    def postMessages(qUrl, jsonMessages, awsRegion=None):
+        """
+        Send many messages through batched send_message_batch calls, returns the entries that failed
+        """
+        with SQSBatchProducer(qUrl, awsRegion=awsRegion) as producer:
+            for jsonMessage in jsonMessages:
+                producer.send(jsonMessage)
+        return producer.failed
 
-class DynamoDBHelper:
     @staticmethod
-    def getItems(tableName, key, value):
-        items = None
+    def consumeMessages(qUrl, **consumerKwargs):
+        """
+        Iterate over messages with a long-polling consumer, see SQSConsumer
+        """
+        return iter(SQSConsumer(qUrl, **consumerKwargs))
+
+
+class SQSBatchProducer:
+    """
+    Buffered producer packing messages into send_message_batch calls
+
+    A batch is sent once it holds 10 entries (or would exceed 256 KiB), or when its oldest message
+    has waited maxWaitSeconds. Up to maxInFlight batches are sent concurrently, send() blocks
+    when all of them are busy. Entries failing with a server-side error are retried.
+    """
+
+    MAX_BATCH_ENTRIES = 10
+    MAX_BATCH_BYTES = 256 * 1024
+    MAX_RETRIES = 3
+
+    def __init__(self, qUrl, maxWaitSeconds=0.5, maxInFlight=4, awsRegion=None):
+        self.client = AwsHelper().get_client("sqs", awsRegion)
+        self.qUrl = qUrl
+        self.maxWaitSeconds = maxWaitSeconds
+        self.failed = []
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._bufferBytes = 0
+        self._oldest = None
+        self._inFlight = threading.BoundedSemaphore(maxInFlight)
+        self._executor = ThreadPoolExecutor(max_workers=maxInFlight)
+        self._futures = []
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flushOnTimeout, daemon=True)
+        self._timer.start()
+
+    def send(self, jsonMessage, **entryKwargs):
+        """
+        Buffer a message, entryKwargs are extra batch entry fields such as MessageGroupId or DelaySeconds
+        """
+        entry = {"MessageBody": json.dumps(jsonMessage), **entryKwargs}
+        entrySize = len(entry["MessageBody"].encode("utf-8"))
+        batches = []
+        with self._lock:
+            if self._buffer and self._bufferBytes + entrySize > SQSBatchProducer.MAX_BATCH_BYTES:
+                batches.append(self._takeBatch())
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(entry)
+            self._bufferBytes += entrySize
+            if len(self._buffer) >= SQSBatchProducer.MAX_BATCH_ENTRIES:
+                batches.append(self._takeBatch())
+        for batch in batches:
+            self._submit(batch)
+
+    def _takeBatch(self):
+        batch = self._buffer
+        self._buffer = []
+        self._bufferBytes = 0
+        return batch
+
+    def _submit(self, batch):
+        self._inFlight.acquire()
+        future = self._executor.submit(self._sendBatch, batch)
+        future.add_done_callback(lambda _: self._inFlight.release())
+        # kept until flush() collects its result, so errors of finished batches are not lost
+        with self._lock:
+            self._futures.append(future)
+
+    def _sendBatch(self, batch):
+        for attempt in range(SQSBatchProducer.MAX_RETRIES + 1):
+            entries = [{"Id": str(i), **entry} for i, entry in enumerate(batch)]
+            response = self.client.send_message_batch(QueueUrl=self.qUrl, Entries=entries)
+            failed = response.get("Failed", [])
+            retryable = [batch[int(failure["Id"])] for failure in failed if not failure["SenderFault"]]
+            with self._lock:
+                self.failed += [failure for failure in failed if failure["SenderFault"]]
+            if not retryable:
+                return
+            batch = retryable
+            time.sleep(0.1 * 2**attempt)
+        with self._lock:
+            self.failed += [{"SenderFault": False, "Message": "Retries exhausted", "Entry": entry} for entry in batch]
+
+    def _flushOnTimeout(self):
+        while not self._closed.wait(self.maxWaitSeconds / 2):
+            batch = None
+            with self._lock:
+                if self._buffer and time.monotonic() - self._oldest >= self.maxWaitSeconds:
+                    batch = self._takeBatch()
+            if batch:
+                self._submit(batch)
+
+    def flush(self):
+        """
+        Send the buffered messages and wait for all in-flight batches
+
+        Raises the first error of a send_message_batch call since the previous flush, once every
+        batch has completed
+        """
+        with self._lock:
+            batch = self._takeBatch()
+        if batch:
+            self._submit(batch)
+        with self._lock:
+            futures, self._futures = self._futures, []
+        errors = [future.exception() for future in futures]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        self._closed.set()
+        self._timer.join()
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+        return False
+
+
+class SQSConsumer:
+    """
+    Long-polling consumer iterating over messages
+
+    A message is deleted once the loop body processing it completes (deletes are sent in batches of 10).
+    While messages of a received batch wait to be processed, their visibility timeout is extended
+    so they are not redelivered to another consumer. Messages whose processing raised are left
+    for redelivery.
+    """
+
+    MAX_BATCH_ENTRIES = 10
+
+    def __init__(
+        self, qUrl, waitTimeSeconds=20, maxMessages=10, visibilityTimeout=60, stopWhenEmpty=False, awsRegion=None
+    ):
+        self.client = AwsHelper().get_client("sqs", awsRegion)
+        self.qUrl = qUrl
+        self.waitTimeSeconds = waitTimeSeconds
+        self.maxMessages = min(maxMessages, SQSConsumer.MAX_BATCH_ENTRIES)
+        self.visibilityTimeout = visibilityTimeout
+        self.stopWhenEmpty = stopWhenEmpty
+
+        self._lock = threading.Lock()
+        self._received = {}
+        self._processed = []
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def __iter__(self):
+        heartbeat = threading.Thread(target=self._extendVisibility, daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stopped.is_set():
+                response = self.client.receive_message(
+                    QueueUrl=self.qUrl,
+                    MaxNumberOfMessages=self.maxMessages,
+                    WaitTimeSeconds=self.waitTimeSeconds,
+                    VisibilityTimeout=self.visibilityTimeout,
+                    AttributeNames=["All"],
+                    MessageAttributeNames=["All"],
+                )
+                messages = response.get("Messages", [])
+                if not messages:
+                    if self.stopWhenEmpty:
+                        return
+                    continue
+
+                with self._lock:
+                    self._received.update({message["ReceiptHandle"]: message for message in messages})
+                for message in messages:
+                    yield message
+                    self._acknowledge(message)
+        finally:
+            self._stopped.set()
+            heartbeat.join()
+            self._deleteProcessed()
+
+    def _acknowledge(self, message):
+        with self._lock:
+            self._received.pop(message["ReceiptHandle"], None)
+            self._processed.append(message["ReceiptHandle"])
+            full = len(self._processed) >= SQSConsumer.MAX_BATCH_ENTRIES
+        if full:
+            self._deleteProcessed()
+
+    def _deleteProcessed(self):
+        with self._lock:
+            receiptHandles = self._processed
+            self._processed = []
+        for batch in chunked(receiptHandles, SQSConsumer.MAX_BATCH_ENTRIES):
+            self.client.delete_message_batch(
+                QueueUrl=self.qUrl,
+                Entries=[{"Id": str(i), "ReceiptHandle": receiptHandle} for i, receiptHandle in enumerate(batch)],
+            )
+
+    def _extendVisibility(self):
+        while not self._stopped.wait(self.visibilityTimeout / 2):
+            with self._lock:
+                receiptHandles = list(self._received)
+            for batch in chunked(receiptHandles, SQSConsumer.MAX_BATCH_ENTRIES):
+                self.client.change_message_visibility_batch(
+                    QueueUrl=self.qUrl,
+                    Entries=[
+                        {"Id": str(i), "ReceiptHandle": receiptHandle, "VisibilityTimeout": self.visibilityTimeout}
+                        for i, receiptHandle in enumerate(batch)
+                    ],
+                )
+
 
+class DynamoDBHelper:
+    # BatchWriteItem accepts at most 25 requests per call
+    BATCH_WRITE_SIZE = 25
+    BATCH_WRITE_MAX_RETRIES = 8
+
+    @staticmethod
+    def queryItems(tableName, key, value, **queryKwargs):
+        """
+        Yield all items with key = value, following LastEvaluatedKey across pages
+        """
         ddb = AwsHelper().get_resource("dynamodb")
         table = ddb.Table(tableName)
 
+        queryKwargs["KeyConditionExpression"] = Key(key).eq(value)
+        while True:
+            queryResult = table.query(**queryKwargs)
+            yield from queryResult.get("Items", [])
+            if "LastEvaluatedKey" not in queryResult:
+                return
+            queryKwargs["ExclusiveStartKey"] = queryResult["LastEvaluatedKey"]
+
+    @staticmethod
+    def getItems(tableName, key, value):
+        items = None
+
         if key is not None and value is not None:
-            filter = Key(key).eq(value)
-            queryResult = table.query(KeyConditionExpression=filter)
-            if queryResult and "Items" in queryResult:
-                items = queryResult["Items"]
+            items = list(DynamoDBHelper.queryItems(tableName, key, value))
 
         return items
 
@@ -44,40 +381,213 @@ class DynamoDBHelper:
         return ddbResponse
 
     @staticmethod
-    def deleteItems(tableName, key, value, sk):
-        items = DynamoDBHelper.getItems(tableName, key, value)
-        if items:
-            ddb = AwsHelper().get_resource("dynamodb")
-            table = ddb.Table(tableName)
-            for item in items:
-                print("Deleting...")
-                print("{} : {}".format(key, item[key]))
-                print("{} : {}".format(sk, item[sk]))
-                table.delete_item(Key={key: value, sk: item[sk]})
-                print("Deleted...")
+    def _batchWrite(tableName, writeRequests):
+        """
+        Write up to 25 requests, retrying unprocessed items with exponential backoff
+        """
+        client = AwsHelper().get_resource("dynamodb").meta.client
+        requestItems = {tableName: writeRequests}
+        for attempt in range(DynamoDBHelper.BATCH_WRITE_MAX_RETRIES + 1):
+            response = client.batch_write_item(RequestItems=requestItems)
+            requestItems = response.get("UnprocessedItems")
+            if not requestItems:
+                return
+            time.sleep(min(0.05 * 2**attempt, 5))
+        raise RuntimeError(f"{len(requestItems[tableName])} items still unprocessed in {tableName}")
+
+    @staticmethod
+    def batchWrite(tableName, writeRequests, maxWorkers=8):
+        """
+        Issue write requests ({"PutRequest": ...} / {"DeleteRequest": ...}) in concurrent batches of 25
+        """
+        count = 0
+        with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            futures = []
+            for batch in chunked(writeRequests, DynamoDBHelper.BATCH_WRITE_SIZE):
+                # Bound the number of batches in flight so large inputs are streamed
+                if len(futures) >= 2 * maxWorkers:
+                    futures.pop(0).result()
+                futures.append(executor.submit(DynamoDBHelper._batchWrite, tableName, batch))
+                count += len(batch)
+            for future in futures:
+                future.result()
+        return count
+
+    @staticmethod
+    def insertItems(tableName, items, maxWorkers=8):
+        """
+        Bulk insert items, returns the number of items written
+        """
+        return DynamoDBHelper.batchWrite(
+            tableName, ({"PutRequest": {"Item": item}} for item in items), maxWorkers=maxWorkers
+        )
+
+    @staticmethod
+    def deleteItems(tableName, key, value, sk, maxWorkers=8):
+        items = DynamoDBHelper.queryItems(
+            tableName,
+            key,
+            value,
+            ProjectionExpression="#pk, #sk",
+            ExpressionAttributeNames={"#pk": key, "#sk": sk},
+        )
+        deleted = DynamoDBHelper.batchWrite(
+            tableName,
+            ({"DeleteRequest": {"Key": {key: value, sk: item[sk]}}} for item in items),
+            maxWorkers=maxWorkers,
+        )
+        LOGGER.info(f"Deleted {deleted} items with {key} : {value}")
+        return deleted
+
+    @staticmethod
+    def _scanSegment(tableName, segment, totalSegments, scanKwargs):
+        ddb = AwsHelper().get_resource("dynamodb")
+        table = ddb.Table(tableName)
+
+        scanKwargs = {**scanKwargs, "Segment": segment, "TotalSegments": totalSegments}
+        while True:
+            scanResult = table.scan(**scanKwargs)
+            yield scanResult.get("Items", [])
+            if "LastEvaluatedKey" not in scanResult:
+                return
+            scanKwargs["ExclusiveStartKey"] = scanResult["LastEvaluatedKey"]
+
+    @staticmethod
+    def scanItems(tableName, totalSegments=8, **scanKwargs):
+        """
+        Parallel segmented scan, yielding items as each segment's pages arrive
+        """
+        producers = [
+            DynamoDBHelper._scanSegment(tableName, segment, totalSegments, scanKwargs)
+            for segment in range(totalSegments)
+        ]
+        for items in iterConcurrently(producers, maxWorkers=totalSegments):
+            yield from items
 
 
 class AwsHelper:
-    def get_client(self, name, awsRegion=None):
-        config = Config(retries=dict(max_attempts=6))
-        if awsRegion:
-            return boto3.client(name, region_name=awsRegion, config=config)
-        else:
-            return boto3.client(name, config=config)
+    """
+    Process-wide boto3 client/resource registry keyed by (service, region, credentials, config)
+
+    Clients are created once per key and reused across calls and warm Lambda invocations,
+    so endpoint resolution and the connection pool are only paid on the first call.
+    """
 
-    def get_resource(self, name, awsRegion=None):
-        config = Config(retries=dict(max_attempts=6))
+    @staticmethod
+    def _registry_key(name, awsRegion, credentials, config, kwargs):
+        return (
+            name,
+            awsRegion,
+            tuple(sorted((credentials or {}).items())),
+            json.dumps(config or {}, sort_keys=True),
+            tuple(sorted(kwargs.items())),
+        )
 
+    @staticmethod
+    def _build_kwargs(awsRegion, credentials, config, kwargs):
+        build_kwargs = {"config": Config(**{**DEFAULT_CONFIG, **(config or {})}), **(credentials or {}), **kwargs}
         if awsRegion:
-            return boto3.resource(name, region_name=awsRegion, config=config)
-        else:
-            return boto3.resource(name, config=config)
+            build_kwargs["region_name"] = awsRegion
+        return build_kwargs
+
+    def get_client(self, name, awsRegion=None, credentials=None, config=None, **kwargs):
+        """
+        Get a cached client, credentials are boto3 credential kwargs and config botocore Config kwargs
+        """
+        key = AwsHelper._registry_key(name, awsRegion, credentials, config, kwargs)
+        client = _CLIENTS.get(key)
+        if client is None:
+            with _CLIENTS_LOCK:
+                client = _CLIENTS.get(key)
+                if client is None:
+                    client = boto3.client(name, **AwsHelper._build_kwargs(awsRegion, credentials, config, kwargs))
+                    instrumentClient(client)
+                    _CLIENTS[key] = client
+        return client
+
+    def get_resource(self, name, awsRegion=None, credentials=None, config=None, **kwargs):
+        """
+        Get a resource cached for the calling thread
+        """
+        key = AwsHelper._registry_key(name, awsRegion, credentials, config, kwargs)
+        resources = getattr(_RESOURCES, "resources", None)
+        if resources is None:
+            resources = _RESOURCES.resources = {}
+        resource = resources.get(key)
+        if resource is None:
+            resource = boto3.resource(name, **AwsHelper._build_kwargs(awsRegion, credentials, config, kwargs))
+            instrumentClient(resource.meta.client)
+            resources[key] = resource
+        return resource
+
+    @staticmethod
+    def evict(name, awsRegion=None):
+        """
+        Drop cached clients of a service, e.g. once their temporary credentials expired
+        """
+        with _CLIENTS_LOCK:
+            for key in [key for key in _CLIENTS if key[0] == name and key[1] == awsRegion]:
+                del _CLIENTS[key]
+
+
+class MetricsHelper:
+    """
+    CloudWatch metrics written as Embedded Metric Format log lines, so no API call on the request path
+    """
+
+    NAMESPACE = os.environ.get("METRICS_NAMESPACE", "GenAIMarketer")
+    _coldStart = True
+    _lastRequest = (None, False)
+
+    @staticmethod
+    def putMetric(name, value, unit="Count", dimensions=None, namespace=None):
+        dimensions = dimensions or {}
+        print(
+            json.dumps(
+                {
+                    "_aws": {
+                        "Timestamp": int(time.time() * 1000),
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": namespace or MetricsHelper.NAMESPACE,
+                                "Dimensions": [list(dimensions)],
+                                "Metrics": [{"Name": name, "Unit": unit}],
+                            }
+                        ],
+                    },
+                    name: value,
+                    **dimensions,
+                }
+            )
+        )
+
+    @staticmethod
+    def recordColdStart(context=None):
+        """
+        ColdStart metric, 1 on the first invocation of an on-demand execution environment and 0 otherwise,
+        so its average is the cold-start share. Environments initialised by provisioned concurrency never count.
+        Recorded once per request id when a routed handler calls it again with the same context
+        """
+        requestId = getattr(context, "aws_request_id", None)
+        if requestId is not None and MetricsHelper._lastRequest[0] == requestId:
+            return MetricsHelper._lastRequest[1]
+        coldStart = (
+            MetricsHelper._coldStart and os.environ.get("AWS_LAMBDA_INITIALIZATION_TYPE") != "provisioned-concurrency"
+        )
+        MetricsHelper._coldStart = False
+        MetricsHelper._lastRequest = (requestId, coldStart)
+        MetricsHelper.putMetric(
+            "ColdStart",
+            int(coldStart),
+            dimensions={"FunctionName": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")},
+        )
+        return coldStart
 
 
 class S3Helper:
     @staticmethod
     def getS3BucketRegion(bucketName):
-        client = boto3.client("s3")
+        client = AwsHelper().get_client("s3")
         response = client.get_bucket_location(Bucket=bucketName)
         awsRegion = response["LocationConstraint"]
         return awsRegion
@@ -107,15 +617,63 @@ class S3Helper:
             else:
                 hasMoreContent = False
 
-            for doc in listObjectsResponse["Contents"]:
-                docName = doc["Key"]
-                docExt = FileHelper.getFileExtenstion(docName)
-                docExtLower = docExt.lower()
-                if docExtLower in allowedFileTypes:
-                    files.append(docName)
+            files += S3Helper.filterByExtension(
+                [doc["Key"] for doc in listObjectsResponse.get("Contents", [])], allowedFileTypes
+            )
+            currentPage += 1
 
         return files
 
+    @staticmethod
+    def filterByExtension(fileNames, allowedFileTypes):
+        """
+        Keep the file names with an allowed extension, matching all suffixes in a single endswith call
+        """
+        suffixes = tuple("." + fileType.lower() for fileType in allowedFileTypes)
+        return [fileName for fileName in fileNames if fileName.lower().endswith(suffixes)]
+
+    @staticmethod
+    def _listPages(s3client, bucketName, prefix, delimiter=None):
+        listKwargs = {"Bucket": bucketName, "Prefix": prefix}
+        if delimiter:
+            listKwargs["Delimiter"] = delimiter
+        while True:
+            listObjectsResponse = s3client.list_objects_v2(**listKwargs)
+            yield listObjectsResponse
+            if not listObjectsResponse["IsTruncated"]:
+                return
+            listKwargs["ContinuationToken"] = listObjectsResponse["NextContinuationToken"]
+
+    @staticmethod
+    def _listShard(s3client, bucketName, prefix, allowedFileTypes):
+        for listObjectsResponse in S3Helper._listPages(s3client, bucketName, prefix):
+            yield S3Helper.filterByExtension(
+                [doc["Key"] for doc in listObjectsResponse.get("Contents", [])], allowedFileTypes
+            )
+
+    @staticmethod
+    def iterFileNames(bucketName, prefix, allowedFileTypes, delimiter="/", maxWorkers=8, awsRegion=None):
+        """
+        Lazily yield all file names under prefix with an allowed extension
+
+        The key space is split on the common prefixes below prefix (one level of delimiter) and
+        each shard is listed on its own thread, so names are yielded as soon as any shard returns a page.
+        """
+        s3client = AwsHelper().get_client("s3", awsRegion)
+
+        shardPrefixes = []
+        for listObjectsResponse in S3Helper._listPages(s3client, bucketName, prefix, delimiter):
+            yield from S3Helper.filterByExtension(
+                [doc["Key"] for doc in listObjectsResponse.get("Contents", [])], allowedFileTypes
+            )
+            shardPrefixes += [commonPrefix["Prefix"] for commonPrefix in listObjectsResponse.get("CommonPrefixes", [])]
+
+        shards = [
+            S3Helper._listShard(s3client, bucketName, shardPrefix, allowedFileTypes) for shardPrefix in shardPrefixes
+        ]
+        for fileNames in iterConcurrently(shards, maxWorkers=maxWorkers):
+            yield from fileNames
+
     @staticmethod
     def writeToS3(content, bucketName, s3FileName, awsRegion=None):
         s3 = AwsHelper().get_resource("s3", awsRegion)
@@ -153,6 +711,134 @@ class S3Helper:
             writer.writerow(item)
         S3Helper.writeToS3(csv_file.getvalue(), bucketName, s3FileName)
 
+    @staticmethod
+    def writeCSVStream(fieldNames, csvData, bucketName, s3FileName, awsRegion=None):
+        """
+        Streaming counterpart of writeCSV, rows are uploaded as they are produced
+        """
+        with S3MultipartWriter(bucketName, s3FileName, awsRegion=awsRegion) as s3File:
+            writer = csv.writer(s3File)
+            writer.writerow(fieldNames)
+            for item in csvData:
+                writer.writerow(item)
+        return s3File.bytesWritten
+
+    @staticmethod
+    def writeJSONLinesStream(records, bucketName, s3FileName, awsRegion=None):
+        """
+        Stream records to S3 as JSON lines
+        """
+        with S3MultipartWriter(bucketName, s3FileName, awsRegion=awsRegion) as s3File:
+            for record in records:
+                s3File.write(json.dumps(record, default=str) + "\n")
+        return s3File.bytesWritten
+
+    @staticmethod
+    def iterLinesFromS3(bucketName, s3FileName, chunkSize=8 * 1024 * 1024, awsRegion=None):
+        """
+        Yield the decoded lines of an object, reading it through ranged GETs of chunkSize bytes
+
+        Every range is read conditionally on the ETag of the first request, an object overwritten
+        during the read fails with PreconditionFailed instead of mixing two versions.
+        """
+        client = AwsHelper().get_client("s3", awsRegion)
+        head = client.head_object(Bucket=bucketName, Key=s3FileName)
+        size, etag = head["ContentLength"], head["ETag"]
+
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        remainder = ""
+        for start in range(0, size, chunkSize):
+            end = min(start + chunkSize, size) - 1
+            response = client.get_object(Bucket=bucketName, Key=s3FileName, Range=f"bytes={start}-{end}", IfMatch=etag)
+            lines = (remainder + decoder.decode(response["Body"].read(), final=end == size - 1)).split("\n")
+            # the last piece may be an incomplete line continuing in the next range
+            remainder = lines.pop()
+            for line in lines:
+                yield line.rstrip("\r")
+        if remainder:
+            yield remainder.rstrip("\r")
+
+    @staticmethod
+    def iterJSONLinesFromS3(bucketName, s3FileName, chunkSize=8 * 1024 * 1024, awsRegion=None):
+        for line in S3Helper.iterLinesFromS3(bucketName, s3FileName, chunkSize, awsRegion):
+            if line:
+                yield json.loads(line)
+
+
+class S3MultipartWriter:
+    """
+    File-like writer that streams to S3, uploading a multipart part whenever partSize bytes are buffered
+
+    Peak memory is bounded by partSize whatever the object size. Objects smaller than one part are
+    written with a single put. Use as a context manager so a failed write aborts the upload.
+    """
+
+    # S3 rejects non-final parts smaller than 5 MiB
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, bucketName, s3FileName, partSize=8 * 1024 * 1024, awsRegion=None):
+        self.client = AwsHelper().get_client("s3", awsRegion)
+        self.bucketName = bucketName
+        self.s3FileName = s3FileName
+        self.partSize = max(partSize, S3MultipartWriter.MIN_PART_SIZE)
+        self.buffer = bytearray()
+        self.parts = []
+        self.uploadId = None
+        self.bytesWritten = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.buffer += data
+        self.bytesWritten += len(data)
+        if len(self.buffer) >= self.partSize:
+            self._uploadPart()
+        return len(data)
+
+    def _uploadPart(self):
+        if self.uploadId is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucketName, Key=self.s3FileName)
+            self.uploadId = response["UploadId"]
+        partNumber = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucketName,
+            Key=self.s3FileName,
+            UploadId=self.uploadId,
+            PartNumber=partNumber,
+            Body=bytes(self.buffer),
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": partNumber})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.uploadId is None:
+            self.client.put_object(Bucket=self.bucketName, Key=self.s3FileName, Body=bytes(self.buffer))
+        else:
+            if self.buffer:
+                self._uploadPart()
+            self.client.complete_multipart_upload(
+                Bucket=self.bucketName,
+                Key=self.s3FileName,
+                UploadId=self.uploadId,
+                MultipartUpload={"Parts": self.parts},
+            )
+        self.buffer = bytearray()
+
+    def abort(self):
+        if self.uploadId is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucketName, Key=self.s3FileName, UploadId=self.uploadId)
+        self.buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        if excType is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
 
 class FileHelper:
     @staticmethod
@@ -0,0 +1,294 @@
+"""
+Lightweight distributed tracing for the Lambda handlers, propagated with W3C traceparent headers
+
+tracedHandler continues the trace of the incoming request (or starts one), wraps the invocation in a
+root span and returns the trace id in the X-Trace-Id response header, with the handler duration in
+Server-Timing so callers can tell API Gateway time from Lambda time. AwsHelper clients are instrumented
+with botocore before-call / after-call hooks, so every AWS call becomes a child span.
+
+Finished spans go to the exporter picked by TRACE_EXPORTER: "log" (default, one JSON line per span in
+CloudWatch Logs), "memory" (kept in-process, for tests) or "none".
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOGGER = logging.Logger("Tracing", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+# bare message, so each span line stays a JSON document for CloudWatch Logs Insights
+HANDLER.setFormatter(logging.Formatter("%(message)s"))
+LOGGER.addHandler(HANDLER)
+
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "X-Trace-Id"
+
+_CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)
+# Root span of the running invocation, parent of spans started on worker threads
+_INVOCATION_SPAN = None
+_MODULE_LOADED = time.perf_counter()
+_COLD_START = True
+
+
+class Span:
+    """
+    Timed operation within a trace
+    """
+
+    __slots__ = ("traceId", "spanId", "parentId", "name", "attributes", "start", "end", "status")
+
+    def __init__(self, name, traceId, parentId=None, attributes=None):
+        self.traceId = traceId
+        self.spanId = secrets.token_hex(8)
+        self.parentId = parentId
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.status = "OK"
+
+    @property
+    def durationMs(self):
+        return None if self.end is None else round((self.end - self.start) * 1000, 2)
+
+    def setAttribute(self, key, value):
+        self.attributes[key] = value
+
+    def traceparent(self):
+        return f"00-{self.traceId}-{self.spanId}-01"
+
+    def toDict(self):
+        return {
+            "traceId": self.traceId,
+            "spanId": self.spanId,
+            "parentId": self.parentId,
+            "name": self.name,
+            "start": self.start,
+            "durationMs": self.durationMs,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    """
+    Keeps finished spans in the process, e.g. to assert on them in tests
+    """
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self._spans.append(span)
+
+    def getFinishedSpans(self, traceId=None):
+        with self._lock:
+            return [span for span in self._spans if traceId is None or span.traceId == traceId]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class LogExporter:
+    """
+    Logs each finished span as a JSON line, searchable with CloudWatch Logs Insights
+    """
+
+    def export(self, span):
+        LOGGER.info(json.dumps({"span": span.toDict()}, default=str))
+
+
+class NoopExporter:
+    def export(self, span):
+        pass
+
+
+_EXPORTERS = {"log": LogExporter, "memory": InMemoryExporter, "none": NoopExporter}
+EXPORTER = _EXPORTERS[os.environ.get("TRACE_EXPORTER", "log")]()
+
+
+def setExporter(exporter):
+    """
+    Replace the exporter of finished spans, returns the previous one
+    """
+    global EXPORTER
+    previous, EXPORTER = EXPORTER, exporter
+    return previous
+
+
+def parseTraceparent(value):
+    """
+    (trace id, parent span id) of a traceparent header, None when absent or malformed
+    """
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+def currentSpan():
+    return _CURRENT_SPAN.get() or _INVOCATION_SPAN
+
+
+def _open(name, attributes, parent=None, remoteParent=None):
+    parent = parent or currentSpan()
+    if remoteParent:
+        traceId, parentId = remoteParent
+    elif parent:
+        traceId, parentId = parent.traceId, parent.spanId
+    else:
+        traceId, parentId = secrets.token_hex(16), None
+    return Span(name, traceId, parentId, attributes)
+
+
+def _close(span, error=None):
+    span.end = time.time()
+    if error is not None:
+        span.status = "ERROR"
+        span.setAttribute("error", f"{type(error).__name__}: {error}")
+    EXPORTER.export(span)
+
+
+@contextmanager
+def startSpan(name, **attributes):
+    """
+    Child span of the current span, or the root of a new trace
+    """
+    span = _open(name, attributes)
+    token = _CURRENT_SPAN.set(span)
+    try:
+        yield span
+    except Exception as e:
+        _close(span, e)
+        raise
+    else:
+        _close(span)
+    finally:
+        _CURRENT_SPAN.reset(token)
+
+
+#########################
+#   BOTOCORE CLIENTS
+#########################
+
+
+def _beforeCall(model, context, **kwargs):
+    span = _open(
+        f"{model.service_model.service_name}.{model.name}",
+        {"aws.service": model.service_model.service_name, "aws.operation": model.name},
+    )
+    # botocore hands the same request context to after-call, retries included
+    context.setdefault("tracingSpans", []).append(span)
+
+
+def _afterCall(http_response, parsed, model, context, **kwargs):
+    spans = context.get("tracingSpans")
+    if not spans:
+        return
+    span = spans.pop()
+    metadata = (parsed or {}).get("ResponseMetadata", {})
+    span.setAttribute("http.status_code", getattr(http_response, "status_code", None))
+    span.setAttribute("aws.request_id", metadata.get("RequestId"))
+    span.setAttribute("aws.retries", metadata.get("RetryAttempts", 0))
+    if "Error" in (parsed or {}):
+        span.status = "ERROR"
+        span.setAttribute("error", parsed["Error"].get("Code"))
+    _close(span)
+
+
+def _afterCallError(context, exception, **kwargs):
+    spans = context.get("tracingSpans")
+    if spans:
+        _close(spans.pop(), exception)
+
+
+def instrumentClient(client):
+    """
+    Record a span around every call of a boto3 client
+    """
+    client.meta.events.register("before-call", _beforeCall, unique_id="tracing-before-call")
+    client.meta.events.register("after-call", _afterCall, unique_id="tracing-after-call")
+    client.meta.events.register("after-call-error", _afterCallError, unique_id="tracing-after-call-error")
+    return client
+
+
+#########################
+#    LAMBDA HANDLERS
+#########################
+
+
+def _withTraceHeaders(response, span):
+    """
+    Handler response with the trace id and the handler duration in its headers
+    """
+    if not isinstance(response, dict) or "statusCode" not in response:
+        # not a proxy response, API Gateway would read added headers as part of the body
+        return response
+    response["headers"] = {
+        **(response.get("headers") or {}),
+        TRACE_ID_HEADER: span.traceId,
+        TRACEPARENT_HEADER: span.traceparent(),
+        "Server-Timing": f"lambda;dur={span.durationMs}",
+    }
+    return response
+
+
+def tracedHandler(handler):
+    """
+    Trace a Lambda handler, continuing the trace of the traceparent header of API Gateway events
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _INVOCATION_SPAN, _COLD_START
+        event = event if isinstance(event, dict) else {}
+        headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+        attributes = {
+            "faas.name": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", handler.__module__),
+            "faas.coldstart": _COLD_START,
+            "route": event.get("routeKey"),
+        }
+        if _COLD_START:
+            # time from loading the layer to the first invocation, i.e. most of the init phase
+            attributes["faas.init_ms"] = round((time.perf_counter() - _MODULE_LOADED) * 1000, 2)
+        _COLD_START = False
+
+        # a handler called by the router is a child of the router's span
+        outermost = currentSpan() is None
+        remoteParent = parseTraceparent(headers.get(TRACEPARENT_HEADER)) if outermost else None
+        span = _open(f"lambda {handler.__module__}", attributes, remoteParent=remoteParent)
+        token = _CURRENT_SPAN.set(span)
+        if outermost:
+            _INVOCATION_SPAN = span
+        try:
+            response = handler(event, context)
+        except Exception as e:
+            _close(span, e)
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            if outermost:
+                _INVOCATION_SPAN = None
+
+        if isinstance(response, dict) and "statusCode" in response:
+            span.setAttribute("http.status_code", response["statusCode"])
+        _close(span)
+        if outermost and "requestContext" in event:
+            response = _withTraceHeaders(response, span)
+        return response
+
+    return wrapper
@@ -1,26 +1,14 @@
 import streamlit as st
-import pandas as pd
-import langchain as lc
-from langchain import PromptTemplate
-from langchain.llms.bedrock import Bedrock
-import datetime
 import os
 import sys
-import boto3
-from pprint import pprint
-from streamlit_extras.echo_expander import echo_expander
-from streamlit_extras.add_vertical_space import add_vertical_space
-import json
 from pathlib import Path
 from st_pages import show_pages_from_config
 from components.utils import display_cover_with_title, reset_session_state
 import components.authenticate as authenticate  # noqa: E402
-import components.genai_api as genai_api  # noqa: E402
-import components.pinpoint_api as pinpoint_api
 import logging
 from streamlit_extras.switch_page_button import switch_page
-import s3fs
 from components.utils_models import BEDROCK_MODELS
+from components.resources import get_model_specs
 
 LOGGER = logging.Logger("AI-Chat", level=logging.DEBUG)
 HANDLER = logging.StreamHandler(sys.stdout)
@@ -86,8 +74,7 @@ HELLO_MESSAGE = "Hi! I am an AI assistant. How can I help you?"
 PAGE_NAME = "ai_chat"
 
 # default model specs
-with open(f"{path.parent.absolute()}/components/model_specs.json") as f:
-    MODEL_SPECS = json.load(f)
+MODEL_SPECS = get_model_specs()
 
 # Hardcoded lists of available and non available models.
 # If you want to add new available models make sure to update those lists as well as model_specs dict
@@ -101,9 +88,6 @@ MODELS_NOT_DEPLOYED = []  # Remove models from this list after deploying the mod
 
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
 
-# Initialize s3fs object
-fs = s3fs.S3FileSystem(anon=False)
-
 #########################
 # SESSION STATE VARIABLES
 #########################
@@ -1,24 +1,20 @@
 import streamlit as st
 import pandas as pd
-import langchain as lc
-from langchain import PromptTemplate
-from langchain.llms.bedrock import Bedrock
 import os
 import sys
+import threading
 import time
-import boto3
-from pprint import pprint
-from streamlit_extras.echo_expander import echo_expander
-from streamlit_extras.add_vertical_space import add_vertical_space
 import json
 from pathlib import Path
 from st_pages import show_pages_from_config
 from components.utils import display_cover_with_title, reset_session_state
 import components.authenticate as authenticate  # noqa: E402
-import components.genai_api as genai_api  # noqa: E402
 import components.pinpoint_api as pinpoint_api
-import s3fs
 from components.utils_models import BEDROCK_MODELS
+from components.segment_store import save_segment
+from components.data_grid import data_grid
+from components.data_access import read_table
+from components.resources import get_filesystem, get_model_specs
 
 import logging
 from streamlit_extras.switch_page_button import switch_page
@@ -83,8 +79,7 @@ PAGE_NAME = "choose_segment"
 POLL_INTERVAL = 1
 
 # default model specs
-with open(f"{path.parent.absolute()}/components/model_specs.json") as f:
-    MODEL_SPECS = json.load(f)
+MODEL_SPECS = get_model_specs()
 
 # Hardcoded lists of available and non available models.
 # If you want to add new available models make sure to update those lists as well as model_specs dict
@@ -109,8 +104,11 @@ JOB_STATUS_PROGRESS_MAP = {
     "FAILED": 0,
 }
 
-# Initialize s3fs object
-fs = s3fs.S3FileSystem(anon=False)
+# Seconds the segment list is served from the cache before the API is asked whether it changed
+SEGMENT_REVALIDATE_SECONDS = 30
+
+# Process-wide s3fs object, shared across reruns
+fs = get_filesystem()
 
 #########################
 # SESSION STATE VARIABLES
@@ -148,12 +146,77 @@ box_style = {
 ########################################################################################################################################################################
 
 
+@st.cache_resource(show_spinner=False)
+def get_segment_cache():
+    """
+    Process-wide segment lists per Pinpoint project id, plus the project served by the API
+    """
+    return {"projects": {}, "currentProject": None, "lock": threading.Lock()}
+
+
+def segments_table(segments):
+    """
+    Segment overview shown in the table and dropdown
+    """
+    # Normalize the JSON into a DataFrame
+    df = pd.json_normalize(segments)
+
+    # Extract the required columns with default value 0 if not present
+    df["SMS"] = df.get("ImportDefinition.ChannelCounts.SMS", 0)
+    df["VOICE"] = df.get("ImportDefinition.ChannelCounts.VOICE", 0)
+    df["EMAIL"] = df.get("ImportDefinition.ChannelCounts.EMAIL", 0)
+    df["PUSH"] = df.get("ImportDefinition.ChannelCounts.PUSH", 0)
+
+    # Select only the required columns
+    df = df.reindex(
+        columns=[
+            "Name",
+            "SegmentType",
+            "ImportDefinition.Size",
+            "SMS",
+            "VOICE",
+            "EMAIL",
+            "PUSH",
+            "Id",
+        ]
+    )
+
+    # Rename the columns
+    df.columns = ["Name", "Type", "Size", "SMS", "VOICE", "EMAIL", "PUSH", "Segment ID"]
+    return df
+
+
 def get_pinpoint_segments():
-    with st.spinner("Processing..."):
-        segments = pinpoint_api.invoke_pinpoint_segment(
-            access_token=st.session_state["access_token"],
-        )
-        return segments
+    """
+    Segment list and its table, revalidated against the API at most every SEGMENT_REVALIDATE_SECONDS
+    """
+    cache = get_segment_cache()
+    with cache["lock"]:
+        entry = cache["projects"].get(cache["currentProject"])
+        if entry is not None and time.time() - entry["checkedAt"] < SEGMENT_REVALIDATE_SECONDS:
+            return entry
+
+        with st.spinner("Processing..."):
+            response = json.loads(
+                pinpoint_api.invoke_pinpoint_segment(
+                    access_token=st.session_state["access_token"],
+                    version=entry["version"] if entry else None,
+                )
+            )
+        if response["NotModified"] and entry is not None:
+            entry["checkedAt"] = time.time()
+            return entry
+
+        segments = response["Segments"]
+        entry = {
+            "version": response["Version"],
+            "segments": segments,
+            "table": segments_table(segments) if segments else None,
+            "checkedAt": time.time(),
+        }
+        cache["projects"][response["ProjectId"]] = entry
+        cache["currentProject"] = response["ProjectId"]
+        return entry
 
 
 def create_pinpoint_export_job(segment_id):
@@ -181,15 +244,15 @@ def get_export_files_uri(s3_url_prefix, total_pieces):
 
 def read_s3_file(file_path):
     """Read a gzipped file from S3 and return its content as a DataFrame."""
-    with fs.open(file_path, "rb") as f:
-        df = pd.read_json(f, compression="gzip", lines=True)
-        normalized_df = pd.json_normalize(df.to_dict(orient="records"))
+    # export pieces are gzipped JSON lines without a .gz suffix
+    df = read_table(file_path, compression="GZIP")
+    normalized_df = pd.json_normalize(df.to_dict(orient="records"))
     return normalized_df
 
 
 def save_df_session_state(df, df_name):
-    st.session_state["df"] = df
-    st.session_state["df_name"] = df_name
+    # Sessions only keep a handle, the segment itself lives once in the shared segment store
+    save_segment(df, name=df_name)
 
 
 def disable(b):
@@ -237,37 +300,14 @@ st.sidebar.markdown(
 
 st.markdown("## Segment Data in Amazon Pinpoint")
 
-segments = json.loads(get_pinpoint_segments())
+segment_list = get_pinpoint_segments()
 
-if not segments:
+if not segment_list["segments"]:
     st.error("No Segment Found in Amazon Pinpoint. Please upload a Segment first.")
     st.stop()
 
-# Normalize the JSON into a DataFrame
-df = pd.json_normalize(segments)
-
-# Extract the required columns with default value 0 if not present
-df["SMS"] = df.get("ImportDefinition.ChannelCounts.SMS", 0)
-df["VOICE"] = df.get("ImportDefinition.ChannelCounts.VOICE", 0)
-df["EMAIL"] = df.get("ImportDefinition.ChannelCounts.EMAIL", 0)
-df["PUSH"] = df.get("ImportDefinition.ChannelCounts.PUSH", 0)
-
-# Select only the required columns
-df = df[
-    [
-        "Name",
-        "SegmentType",
-        "ImportDefinition.Size",
-        "SMS",
-        "VOICE",
-        "EMAIL",
-        "PUSH",
-        "Id",
-    ]
-]
-
-# Rename the columns
-df.columns = ["Name", "Type", "Size", "SMS", "VOICE", "EMAIL", "PUSH", "Segment ID"]
+# Segment overview, built once per version of the segment list
+df = segment_list["table"]
 
 
 st.dataframe(df, hide_index=True)
@@ -337,14 +377,13 @@ if exported_files is not None:
     for file_path in exported_files:
         df = read_s3_file(file_path)
         combined_df = pd.concat([combined_df, df], ignore_index=True)
-    # Display the combined DataFrame in Streamlit
-    st.markdown(f"## Preview of {selected_segment_name} (100 entries)")
-    st.dataframe(combined_df.head(100), hide_index=True)
+    # Display the combined DataFrame in Streamlit, one page at a time
+    st.markdown(f"## Preview of {selected_segment_name}")
+    data_grid(combined_df, key="pinpoint_segment_grid")
     # Check if the DataFrame is already confirmed and stored in session state
     # Create a button for confirmation
     st.button(
         "Confirm to use this Segment Data",
-        on_click=save_df_session_state(
-            df=combined_df, df_name=f"(Pinpoint)-{selected_segment_name}"
-        ),
+        on_click=save_df_session_state,
+        kwargs={"df": combined_df, "df_name": f"(Pinpoint)-{selected_segment_name}"},
     )
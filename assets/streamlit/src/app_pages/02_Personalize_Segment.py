@@ -1,23 +1,23 @@
 import streamlit as st
 import pandas as pd
-import langchain as lc
-from langchain import PromptTemplate
-from langchain.llms.bedrock import Bedrock
 import os
+import re
 import sys
 import time
-import boto3
-from pprint import pprint
-from streamlit_extras.echo_expander import echo_expander
-from streamlit_extras.add_vertical_space import add_vertical_space
 import json
 from pathlib import Path
 from st_pages import show_pages_from_config
 from components.utils import display_cover_with_title, reset_session_state
 import components.authenticate as authenticate  # noqa: E402
 import components.personalize_api as personalize_api
-import s3fs
+import components.async_api as async_api
 from components.utils_models import BEDROCK_MODELS
+from components.segment_store import save_segment
+from components.data_grid import data_grid
+from components.data_access import read_table
+from components.catalog_filter import get_catalog_filter_engine
+from components.resources import get_filesystem, get_model_specs
+from components.shared_cache import shared_cache
 import logging
 from streamlit_extras.switch_page_button import switch_page
 
@@ -81,8 +81,7 @@ PAGE_NAME = "choose_segment"
 POLL_INTERVAL = 5
 
 # default model specs
-with open(f"{path.parent.absolute()}/components/model_specs.json") as f:
-    MODEL_SPECS = json.load(f)
+MODEL_SPECS = get_model_specs()
 
 # Hardcoded lists of available and non available models.
 # If you want to add new available models make sure to update those lists as well as model_specs dict
@@ -109,8 +108,17 @@ JOB_STATUS_PROGRESS_MAP = {
 
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
 
-# Initialize s3fs object
-fs = s3fs.S3FileSystem(anon=False)
+# Job name suffix of the individual jobs of a sharded submission
+SHARD_JOB_SUFFIX = re.compile(r"-shard-\d+$")
+
+# Jobs in these statuses never change again, the others are described again when the status table is shown
+TERMINAL_JOB_STATUSES = ["ACTIVE", "CREATE FAILED"]
+
+# Longest list of users whose demo data is filtered on S3 instead of after a full read
+MAX_PUSHDOWN_USERS = 1000
+
+# Process-wide s3fs object, shared across reruns
+fs = get_filesystem()
 
 #########################
 # SESSION STATE VARIABLES
@@ -157,12 +165,13 @@ box_style = {
 ########################################################################################################################################################################
 
 
-def create_personalize_batch_segment(item_ids, num_results):
+def create_personalize_batch_segment(item_ids, num_results, num_shards=1):
     personalize_batch_segment_response = (
         personalize_api.invoke_personalize_batch_segment(
             access_token=st.session_state["access_token"],
             item_ids=item_ids,
             num_results=num_results,
+            num_shards=num_shards,
         )
     )
     return personalize_batch_segment_response
@@ -175,14 +184,65 @@ def get_personalize_job(job_arn):
     return job_status_response
 
 
+def get_personalize_job_group(group_id):
+    job_status_response = personalize_api.invoke_personalize_describe_job_group(
+        access_token=st.session_state["access_token"], group_id=group_id
+    )
+    return job_status_response
+
+
 def get_personalize_jobs():
-    job_status_response = personalize_api.invoke_personalize_get_jobs(
+    """Fetch all pages of batch segment jobs, newest first."""
+    jobs = []
+    next_token = None
+    while True:
+        job_status_response = json.loads(
+            personalize_api.invoke_personalize_get_jobs(
+                access_token=st.session_state["access_token"],
+                next_token=next_token,
+            ).decode("utf-8")
+        )
+        jobs += job_status_response["batchSegmentJobs"]
+        next_token = job_status_response.get("nextToken")
+        if not next_token:
+            break
+    return jobs
+
+
+def refresh_job_statuses(jobs):
+    """Describe the jobs still running concurrently, the cached job list may be up to 30 seconds old."""
+    running = [job for job in jobs if job["status"] not in TERMINAL_JOB_STATUSES]
+    responses = async_api.run_all(
+        (
+            async_api.invoke_personalize_describe_job(
+                access_token=st.session_state["access_token"], job_arn=job["batchSegmentJobArn"]
+            )
+            for job in running
+        ),
+        return_exceptions=True,
+    )
+    statuses = {}
+    for job, response in zip(running, responses):
+        if isinstance(response, Exception):
+            # keep the listed status, a failed describe does not fail the whole table
+            LOGGER.log(logging.WARNING, f"Could not describe {job['jobName']}: {response}")
+            continue
+        statuses[job["batchSegmentJobArn"]] = json.loads(response.decode("utf-8"))["batchSegmentJob"]["status"]
+    # the cached list is shared across reruns, the refreshed statuses go on copies
+    return [{**job, "status": statuses.get(job["batchSegmentJobArn"], job["status"])} for job in jobs]
+
+
+def get_personalize_recommendations(user_ids, num_results):
+    recommendations_response = personalize_api.invoke_personalize_recommendations(
         access_token=st.session_state["access_token"],
+        user_ids=user_ids,
+        num_results=num_results,
     )
-    return job_status_response
+    return recommendations_response
 
 
 @st.cache_data(ttl=30)
+@shared_cache(ttl=30)
 def cached_get_personalize_jobs():
     return get_personalize_jobs()
 
@@ -194,6 +254,19 @@ def read_s3_file(file_path):
     return file_content
 
 
+def read_segment_snapshot(job_name):
+    """Read the materialized segment snapshot and its statistics, None if not materialized yet."""
+    segment_path = f"s3://{BUCKET_NAME}/personalize-segments/{job_name}/segment.parquet"
+    stats_path = f"s3://{BUCKET_NAME}/personalize-segments/{job_name}/stats.json"
+    try:
+        with fs.open(stats_path, "rb") as f:
+            segment_stats = json.load(f)
+        segment_df = read_table(segment_path)
+    except FileNotFoundError:
+        return None, None
+    return segment_df, segment_stats
+
+
 def process_json_content(content):
     """Process the JSON content and return a DataFrame."""
     # Split the content by newline to get individual JSON strings
@@ -213,8 +286,8 @@ def process_json_content(content):
 
 
 def save_df_session_state(df, df_name):
-    st.session_state["df"] = df
-    st.session_state["df_name"] = df_name
+    # Sessions only keep a handle, the segment itself lives once in the shared segment store
+    save_segment(df, name=df_name)
 
 
 def disable(b):
@@ -267,11 +340,18 @@ st.markdown("## Batch Segmentation with Amazon Personalize")
 st.markdown("### Generate Recommended Segment")
 # Text boxes for user input
 num_results = st.number_input("Enter Number of Results", min_value=1, value=3)
+num_shards = st.number_input(
+    "Number of Concurrent Jobs",
+    min_value=1,
+    # bound returned by the API with the last submission, the API caps the number of jobs anyway
+    max_value=st.session_state.get("max_shards"),
+    value=1,
+    help="Split large item selections across several batch segment jobs running in parallel",
+)
 
 # Fetch item metadata
-# Get Item Metadata
-with fs.open(f"s3://{BUCKET_NAME}/demo-data/df_item_deduplicated.csv", "rb") as f:
-    item_data = pd.read_csv(f)
+# Item Metadata with its column stats and indexes, built once per catalog version
+item_catalog = get_catalog_filter_engine(f"s3://{BUCKET_NAME}/demo-data/df_item_deduplicated.csv")
 # Sidebar title
 st.sidebar.title("Filters")
 
@@ -279,33 +359,25 @@ st.sidebar.title("Filters")
 filters = {}
 
 # Dynamically create filters for all columns except 'ITEM_ID'
-for col in item_data.columns:
+for col in item_catalog.df.columns:
     if col != "ITEM_ID":
         # For categorical columns, use a selectbox
-        if item_data[col].dtype == "object":
+        if col in item_catalog.categorical:
             filters[col] = st.sidebar.selectbox(
-                f"Select {col}", options=["All"] + list(item_data[col].unique())
+                f"Select {col}", options=item_catalog.options(col)
             )
         # For numerical columns, use a slider
         else:
+            min_value, max_value = item_catalog.value_range(col)
             filters[col] = st.sidebar.slider(
                 f"{col} Range",
-                float(item_data[col].min()),
-                float(item_data[col].max()),
-                (float(item_data[col].min()), float(item_data[col].max())),
+                min_value,
+                max_value,
+                (min_value, max_value),
             )
 
-# Filtering data
-filtered_data = item_data.copy()
-
-for col, value in filters.items():
-    if value != "All":
-        if isinstance(value, tuple):  # For numerical columns
-            filtered_data = filtered_data[
-                (filtered_data[col] >= value[0]) & (filtered_data[col] <= value[1])
-            ]
-        else:  # For categorical columns
-            filtered_data = filtered_data[filtered_data[col] == value]
+# Filtering data, all filters are evaluated as one mask over the indexed catalog
+filtered_data = item_catalog.filter(filters)
 
 st.markdown("#### Filtered Item Dataframe")
 # Display filtered DataFrame
@@ -320,16 +392,59 @@ if st.button("Create Batch Segment"):
     item_ids = ",".join(item_ids)
 
     personalize_batch_segment_response = create_personalize_batch_segment(
-        item_ids, num_results
+        item_ids, num_results, num_shards
     )
     personalize_batch_segment_response = json.loads(
         personalize_batch_segment_response.decode("utf-8")
     )
-    st.session_state["job_name"] = personalize_batch_segment_response[
-        "batchSegmentJobArn"
-    ].split("/")[-1]
-    st.write(
-        f'Batch Segment:{st.session_state["job_name"]} for items: {str(item_ids)} Created Successfully!'
+    st.session_state["max_shards"] = personalize_batch_segment_response.get("maxShards")
+    if "groupId" in personalize_batch_segment_response:
+        # Sharded submission, all shard jobs are tracked under the group id
+        st.session_state["job_name"] = personalize_batch_segment_response["groupId"]
+        if "submissionError" in personalize_batch_segment_response:
+            st.error(
+                f"Only {len(personalize_batch_segment_response['jobs'])} of "
+                f"{personalize_batch_segment_response['numShards']} shard jobs were submitted: "
+                f"{personalize_batch_segment_response['submissionError']}"
+            )
+        elif personalize_batch_segment_response["numShards"] < num_shards:
+            st.info(f"Items split across {personalize_batch_segment_response['numShards']} concurrent jobs")
+    else:
+        st.session_state["job_name"] = personalize_batch_segment_response[
+            "batchSegmentJobArn"
+        ].split("/")[-1]
+    if "submissionError" not in personalize_batch_segment_response:
+        st.write(
+            f'Batch Segment:{st.session_state["job_name"]} for items: {str(item_ids)} Created Successfully!'
+        )
+
+st.divider()
+
+#########################
+#       REAL-TIME RECOMMENDATIONS FOR A HANDFUL OF USERS
+#########################
+
+st.markdown("### Real-time Recommendations")
+st.markdown(
+    "For one-off outreach, get recommended items for specific customers without waiting for a batch segment job."
+)
+recommendation_user_ids = st.text_input("Enter comma separated User IDs")
+if st.button("Get Recommendations") and recommendation_user_ids:
+    recommendations_response = json.loads(
+        get_personalize_recommendations(recommendation_user_ids, num_results).decode("utf-8")
+    )
+    st.caption(f"Source: {recommendations_response['source']}")
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {"userId": user_id, **item}
+                for user_id, items in recommendations_response["recommendations"].items()
+                for item in items
+            ],
+            columns=["userId", "itemId", "score"],
+        ),
+        hide_index=True,
+        use_container_width=True,
     )
 
 st.divider()
@@ -340,15 +455,11 @@ st.divider()
 
 try:
     # Run Fetch all segment jobs one time first
+    # Jobs come back sorted by creationDateTime, newest first
     personalize_jobs = cached_get_personalize_jobs()
-    # Decode the byte string and parse as JSON
-    data = json.loads(personalize_jobs.decode("utf-8"))
-    st.session_state.df_personalize_jobs = pd.DataFrame(data["batchSegmentJobs"])
-    st.session_state.df_personalize_jobs = (
-        st.session_state.df_personalize_jobs.sort_values(
-            by="creationDateTime", ascending=False
-        )
-    )
+    if not personalize_jobs:
+        raise KeyError("batchSegmentJobs")
+    st.session_state.df_personalize_jobs = pd.DataFrame(personalize_jobs)
     show_segment_info = True  # Flag to control UI display
 except KeyError:
     st.error("No Segment Job found. Create a segment job first.")
@@ -377,52 +488,78 @@ if show_segment_info:
         # Get the batchSegmentJobArn corresponding to the selected job name
         selected_job_arn = selected_job["batchSegmentJobArn"].values[0]
 
-        # Fetch the personalize job details using the selected job ARN
-        personalize_batch_segment_job = get_personalize_job(selected_job_arn)
+        # Shards of a sharded submission are viewed through the merged output of their group
+        segment_job_name = SHARD_JOB_SUFFIX.sub("", selected_job_name)
 
-        # Parse the returned JSON
-        job_details = json.loads(personalize_batch_segment_job.decode("utf-8"))
+        # Segments are materialized by the snapshot Lambda once the job output lands in S3
+        combined_df, segment_stats = read_segment_snapshot(segment_job_name)
+        job_name = segment_job_name
 
-        # Extract the S3 path for the jobOutput
-        s3_path = job_details["batchSegmentJob"]["jobOutput"]["s3DataDestination"][
-            "path"
-        ]
+        if combined_df is None:
+            if segment_job_name != selected_job_name:
+                # Shard of a sharded submission, view the merged output of the whole group
+                personalize_batch_segment_job = get_personalize_job_group(segment_job_name)
+            else:
+                # Fetch the personalize job details using the selected job ARN
+                personalize_batch_segment_job = get_personalize_job(selected_job_arn)
+
+            # Parse the returned JSON
+            job_details = json.loads(personalize_batch_segment_job.decode("utf-8"))
+
+            # Extract the S3 path for the jobOutput
+            s3_path = job_details["batchSegmentJob"]["jobOutput"]["s3DataDestination"][
+                "path"
+            ]
+
+            # Get the job name
+            job_name = job_details["batchSegmentJob"]["jobName"]
+
+            # Add the S3 file name to the path
+            s3_file_path = f"{s3_path}{job_name}.json.out"
+
+            try:
+                # Read the file content
+                file_content = read_s3_file(s3_file_path)
+
+                # Process the content to get the DataFrame
+                df_recommended_segments = process_json_content(file_content)
+            except Exception:
+                print(Exception)
+                st.error("No Segment Export File Found. Is your Segment Export Job ACTIVE?")
+
+            # TODO
+            # For now just take demo data
+            # Only fetch the recommended users, pushed down to S3 when the list is short enough
+            user_ids = df_recommended_segments["userId"].astype(str).unique().tolist()
+            user_predicates = []
+            if len(user_ids) <= MAX_PUSHDOWN_USERS:
+                user_predicates = [
+                    ("User.UserId", "in", [int(u) if u.isdigit() else u for u in user_ids])
+                ]
+            user_data = read_table(
+                f"s3://{BUCKET_NAME}/demo-data/df_segment_data.csv",
+                predicates=user_predicates,
+            )
+            # Convert both columns to the same data type (e.g., string)
+            df_recommended_segments["userId"] = df_recommended_segments["userId"].astype(
+                str
+            )
+            user_data["User.UserId"] = user_data["User.UserId"].astype(str)
+            combined_df = df_recommended_segments.merge(
+                user_data, left_on="userId", right_on="User.UserId", how="left"
+            )
 
-        # Get the job name
-        job_name = job_details["batchSegmentJob"]["jobName"]
-
-        # Add the S3 file name to the path
-        s3_file_path = f"{s3_path}{job_name}.json.out"
-
-        try:
-            # Read the file content
-            file_content = read_s3_file(s3_file_path)
-
-            # Process the content to get the DataFrame
-            df_recommended_segments = process_json_content(file_content)
-        except Exception:
-            print(Exception)
-            st.error("No Segment Export File Found. Is your Segment Export Job ACTIVE?")
-
-        # TODO
-        # For now just take demo data
-        with fs.open(f"s3://{BUCKET_NAME}/demo-data/df_segment_data.csv", "rb") as f:
-            user_data = pd.read_csv(f)
-        # Convert both columns to the same data type (e.g., string)
-        df_recommended_segments["userId"] = df_recommended_segments["userId"].astype(
-            str
-        )
-        user_data["User.UserId"] = user_data["User.UserId"].astype(str)
-        combined_df = df_recommended_segments.merge(
-            user_data, left_on="userId", right_on="User.UserId", how="left"
-        )
         st.write("### Recommended Customers Information")
-        st.write(combined_df)
+        if segment_stats is not None:
+            st.caption(
+                f"{segment_stats['rowCount']} rows, {segment_stats['columnCount']} columns "
+                f"(materialized {segment_stats['createdAt']})"
+            )
+        data_grid(combined_df, key="personalize_segment_grid")
         st.button(
             "Confirm to use this Segment Data",
-            on_click=save_df_session_state(
-                df=combined_df, df_name=f"(Personalize)-{job_name}"
-            ),
+            on_click=save_df_session_state,
+            kwargs={"df": combined_df, "df_name": f"(Personalize)-{job_name}"},
         )
 
     #########################
@@ -439,15 +576,8 @@ if show_segment_info:
     # Add a button to fetch all segment jobs
     if st.button("Fetch Segment Jobs"):
         # Fetch the personalize jobs when the button is pressed
-        personalize_jobs = cached_get_personalize_jobs()
-        # Decode the byte string and parse as JSON
-        data = json.loads(personalize_jobs.decode("utf-8"))
-        st.session_state.df_personalize_jobs = pd.DataFrame(data["batchSegmentJobs"])
-        st.session_state.df_personalize_jobs = (
-            st.session_state.df_personalize_jobs.sort_values(
-                by="creationDateTime", ascending=False
-            )
-        )
+        personalize_jobs = refresh_job_statuses(cached_get_personalize_jobs())
+        st.session_state.df_personalize_jobs = pd.DataFrame(personalize_jobs)
         # Update the placeholder on the main page with the new dataframe
         jobs_df_main_placeholder.dataframe(
             st.session_state.df_personalize_jobs[["jobName", "status"]],
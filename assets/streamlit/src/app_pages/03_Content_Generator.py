@@ -1,28 +1,23 @@
 import streamlit as st
 import pandas as pd
-import langchain as lc
-from langchain import PromptTemplate
-from langchain.llms.bedrock import Bedrock
-import datetime
+import duckdb
+import hashlib
 import os
 import sys
-import boto3
-from pprint import pprint
-from streamlit_extras.echo_expander import echo_expander
-from streamlit_extras.add_vertical_space import add_vertical_space
 import json
 from pathlib import Path
 from st_pages import show_pages_from_config
-from components.utils import display_cover_with_title, reset_session_state
+from components.utils import display_cover_with_title, log_duration, reset_session_state
 import components.authenticate as authenticate  # noqa: E402
 import components.genai_api as genai_api  # noqa: E402
 import components.pinpoint_api as pinpoint_api
 import logging
 from streamlit_extras.switch_page_button import switch_page
-import s3fs
 from components.utils_models import BEDROCK_MODELS
-
-from langchain.chains import LLMChain
+from components.segment_store import get_segment_store, load_segment
+from components.segment_query import OPERATORS as SEGMENT_QUERY_OPERATORS, count_segment, query_segment, segment_schema
+from components.resources import get_bedrock_runtime_client, get_filesystem, get_model_specs
+from components.shared_cache import shared_cache
 
 LOGGER = logging.Logger("AI-Chat", level=logging.DEBUG)
 HANDLER = logging.StreamHandler(sys.stdout)
@@ -88,8 +83,7 @@ HELLO_MESSAGE = "Hi! I am an AI assistant. How can I help you?"
 PAGE_NAME = "ai_chat"
 
 # default model specs
-with open(f"{path.parent.absolute()}/components/model_specs.json") as f:
-    MODEL_SPECS = json.load(f)
+MODEL_SPECS = get_model_specs()
 
 # Hardcoded lists of available and non available models.
 # If you want to add new available models make sure to update those lists as well as model_specs dict
@@ -103,8 +97,11 @@ MODELS_NOT_DEPLOYED = []  # Remove models from this list after deploying the mod
 
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
 
-# Initialize s3fs object
-fs = s3fs.S3FileSystem(anon=False)
+# Seconds the demo product catalogs are cached for
+CATALOG_TTL = 600
+
+# Process-wide s3fs object, shared across reruns
+fs = get_filesystem()
 
 #########################
 # SESSION STATE VARIABLES
@@ -120,12 +117,11 @@ LOGGER.log(logging.DEBUG, (f"ai_model selected: {st.session_state['ai_model']}")
 ######################################################## Session States and CSS      ###################################################################################
 ########################################################################################################################################################################
 
-if "df" not in st.session_state or st.session_state["df"] is None:
-    st.session_state["df"] = None
+# The session only holds a handle, the segment is read from the shared segment store
+df = load_segment()
+if df is None:
+    st.session_state["segment_handle"] = None
     st.session_state["df_name"] = None
-    df = st.session_state["df"]
-else:
-    df = st.session_state["df"]
 
 # Initialize session state if not already done
 if "button_clicked" not in st.session_state:
@@ -157,19 +153,36 @@ box_style = {
 ########################################################################################################################################################################
 
 
-def get_product_info(product_id, return_dict=True):
+@st.cache_data(ttl=CATALOG_TTL, show_spinner=False)
+@shared_cache(ttl=CATALOG_TTL)
+def load_product_catalog():
     with fs.open(f"s3://{BUCKET_NAME}/demo-data/products.json", "rb") as f:
-        data = json.load(f)
+        return json.load(f)
 
-        if return_dict:
-            for product in data["products"]:
-                if product["id"] == product_id:
-                    return product
-        else:
-            return data
+
+@st.cache_data(ttl=CATALOG_TTL, show_spinner=False)
+@shared_cache(ttl=CATALOG_TTL)
+def load_item_catalog(file_name):
+    with fs.open(f"s3://{BUCKET_NAME}/demo-data/{file_name}", "rb") as f:
+        return pd.read_csv(f)
+
+
+def get_product_info(product_id, return_dict=True):
+    data = load_product_catalog()
+
+    if return_dict:
+        for product in data["products"]:
+            if product["id"] == product_id:
+                return product
+    else:
+        return data
 
 
 def get_llm(ai_model="anthropic.claude-v2"):
+    # LangChain and boto3 are only imported once a generation actually needs them
+    import boto3
+    from langchain.llms.bedrock import Bedrock
+
     session = boto3.session.Session(profile_name="bedrock-team-account")
     bedrock = session.client("bedrock", region_name="us-east-1")
 
@@ -284,6 +297,10 @@ def marketingBaseTemplate(channel, product_data, lang, template):
 def generateMarketingContent(
     ai_model, prompt_template, channel, product_data, name, age, lang
 ):
+    from langchain import PromptTemplate
+    from langchain.chains import LLMChain
+    from langchain.llms.bedrock import Bedrock
+
     template = marketingBaseTemplate(channel, product_data, lang, prompt_template)
     input_vars = ["channel", "name", "age", "lang"]
     prompt_template = PromptTemplate(input_variables=input_vars, template=template)
@@ -292,7 +309,7 @@ def generateMarketingContent(
 
     with st.spinner("Generating content..."):
 
-        boto3_bedrock = boto3.client('bedrock-runtime', region_name="us-east-1")
+        boto3_bedrock = get_bedrock_runtime_client(region_name="us-east-1")
         cl_llm = Bedrock(
             model_id="anthropic.claude-v2",
             # model_id="anthropic.claude-instant-v1",
@@ -416,6 +433,14 @@ def process_df(df):
     return df, user_attribute_columns, attribute_columns, metric_columns, other_columns
 
 
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_processed_segment(segment_key, _df):
+    """
+    process_df once per stored segment, shared by every session on it. Do not modify in place
+    """
+    return process_df(_df)
+
+
 def send_message_pinpoint(
     address, channel, message_body_text, message_subject=None, message_body_html=None
 ):
@@ -472,7 +497,7 @@ def increment_counter():
     )
 
 
-def set_button_clicked():
+def set_button_clicked(customer_details, message_subject, message_body_html, message_body_text):
     """
     Set button as clicked and send out content
     """
@@ -487,205 +512,225 @@ def set_button_clicked():
     st.session_state.button_clicked = True
 
 
-########################################################################################################################################################################
-######################################################## PAGE CODE    ##################################################################################################
-########################################################################################################################################################################
+def go_to_customer(index):
+    """
+    Move to another customer of the segment
+    """
+    st.session_state["customer_counter"] = index
+    st.session_state.button_clicked = False
 
-st.sidebar.markdown(f"<div style='{box_style}'>", unsafe_allow_html=True)
-st.sidebar.markdown(
-    f"<p><strong>Current Segment: </strong> {st.session_state['df_name']}</p>",
-    unsafe_allow_html=True,
-)
 
-# Check whether segment is selected
-if df is None:
-    st.error(
-        """
-    You have not specified a segment. Please choose a segment from Amazon Pinpoint or Amazon Personalize.
-             """
-    )
-# Check whether prompt is keyed in
-elif "prompt" not in st.session_state:
-    # If no prompt found, use the banking prompt
-    st.error(
-        """
-    No prompt found. Please select a prompt from the sidebar.
-             """
-    )
-else:
-    #########################
-    #       SIDEBAR MODEL SELECTION
-    #########################
-
-    with st.sidebar:
-        st.markdown("")
-
-        # language model
-        st.subheader("Language Model")
-        ai_model = st.selectbox(
-            label="Select a language model:",
-            options=MODELS_DISPLAYED,
-            key="ai_model",
-            help="Choose the LLM model used for content generation",
+def get_customer_product_data(customer_details):
+    """
+    Catalog row of the product promoted to a customer, and its text for the prompt
+    """
+    # If there's item ID found in customer database (meaning using Personalize Segment)
+    if "itemId" in customer_details.index:
+        # Get Item Metadata (Airline)
+        item_data = load_item_catalog("df_item_deduplicated.csv")
+        item_data = item_data.loc[item_data["ITEM_ID"] == int(customer_details.loc["itemId"])]
+    else:
+        # Get Item Metadata (Banking) since using Pinpoint Segment
+        item_data = load_item_catalog("df_item_banking.csv")
+        item_data = item_data[
+            item_data["itemId"] == customer_details["User.UserAttributes.Product"]
+        ]
+
+    # Extract the single row as a Series
+    row = item_data.iloc[0]
+
+    product_data = ""
+    for col, value in row.items():
+        product_data += f"{col}: {value}; "
+    return item_data, product_data
+
+
+def get_generated_content(cache_key, ai_model, channel, product_data, customer_details):
+    """
+    Generate content once per customer, reruns and navigating back reuse it
+    """
+    generated_contents = st.session_state.setdefault("generated_contents", {})
+    if cache_key not in generated_contents:
+        generated_contents[cache_key] = generateMarketingContent(
+            ai_model,
+            st.session_state.prompt,
+            channel,
+            product_data=product_data,
+            name=customer_details["User.UserAttributes.FirstName"],
+            age=customer_details["User.UserAttributes.Age"],
+            lang=customer_details["User.UserAttributes.PreferredLanguage"],
         )
-        if st.session_state["ai_model"] in MODELS_UNAVAILABLE:
-            st.error(f'{st.session_state["ai_model"]} not available', icon="⚠️")
-            st.stop()
-        elif st.session_state["ai_model"] in MODELS_NOT_DEPLOYED:
-            st.error(f'{st.session_state["ai_model"]} has been shut down', icon="⚠️")
-            st.stop()
+    return generated_contents[cache_key]
 
-    #########################
-    #       NAVIGATION
-    #########################
 
-    if "customer_counter" not in st.session_state:
-        st.session_state["customer_counter"] = 0
+def discard_generated_content(cache_key):
+    """
+    Drop the content generated for a customer so that it is generated again
+    """
+    st.session_state.setdefault("generated_contents", {}).pop(cache_key, None)
 
-    col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 1], gap="small")
 
-    with col1:
-        if st.button(
-            "First customer", key="first_customer", help="Go to the first customer"
-        ):
-            st.session_state["customer_counter"] = 0
-            st.session_state.button_clicked = False
+@st.fragment
+def customer_navigation(segment_key, num_customers):
+    """
+    Navigation and everything specific to the current customer, reruns on its own when navigating
+    """
+    with log_duration(LOGGER, "Customer navigation fragment"):
+        st.session_state["customer_counter"] = min(
+            st.session_state.setdefault("customer_counter", 0), num_customers - 1
+        )
 
-    with col2:
-        if st.button(
-            ":arrow_backward:", key="prev_customer", help="Go to the previous customer"
-        ):
-            st.session_state["customer_counter"] = max(
-                0, st.session_state["customer_counter"] - 1
+        col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 1], gap="small")
+
+        with col1:
+            st.button(
+                "First customer",
+                key="first_customer",
+                help="Go to the first customer",
+                on_click=go_to_customer,
+                args=(0,),
             )
-            st.session_state.button_clicked = False
-
-    with col4:
-        if st.button(
-            ":arrow_forward:", key="next_customer", help="Go to the next customer"
-        ):
-            st.session_state["customer_counter"] = min(
-                len(df) - 1, st.session_state["customer_counter"] + 1
+
+        with col2:
+            st.button(
+                ":arrow_backward:",
+                key="prev_customer",
+                help="Go to the previous customer",
+                on_click=go_to_customer,
+                args=(max(0, st.session_state["customer_counter"] - 1),),
             )
-            st.session_state.button_clicked = False
-
-    with col5:
-        if st.button(
-            "Last customer", key="last_customer", help="Go to the last customer"
-        ):
-            st.session_state["customer_counter"] = len(df) - 1
-            st.session_state.button_clicked = False
-
-    with col3:
-        st.markdown(
-            f"{st.session_state['customer_counter']+1}/{len(df)}",
-            unsafe_allow_html=True,
-        )
 
-    print("Datafetch counter", st.session_state["customer_counter"])
-
-    #########################
-    #       PAGE CONTENT
-    #########################
-
-    # Check the session state variable at the beginning of the script
-    if st.session_state.button_clicked:
-        st.success("Message sent! Click to Proceed to next customer.")
-        st.stop()
-    st.markdown("""# **GenAI Direct Marketing Creator**""")
-    (
-        df,
-        user_attribute_columns,
-        attribute_columns,
-        metric_columns,
-        other_columns,
-    ) = process_df(df)
-
-    # Get the specific customer's details
-    customer_details = df.iloc[st.session_state["customer_counter"]]
-    customer_details_df = customer_details.to_frame()
+        with col4:
+            st.button(
+                ":arrow_forward:",
+                key="next_customer",
+                help="Go to the next customer",
+                on_click=go_to_customer,
+                args=(min(num_customers - 1, st.session_state["customer_counter"] + 1),),
+            )
 
-    channel = customer_details.loc["ChannelType"]
+        with col5:
+            st.button(
+                "Last customer",
+                key="last_customer",
+                help="Go to the last customer",
+                on_click=go_to_customer,
+                args=(num_customers - 1,),
+            )
 
-    
-    
+        with col3:
+            st.markdown(
+                f"{st.session_state['customer_counter']+1}/{num_customers}",
+                unsafe_allow_html=True,
+            )
 
-    #### GET PRODUCT DATA FOR CONTENT GENERATION
+        LOGGER.debug(f"Datafetch counter {st.session_state['customer_counter']}")
 
-    product_data = ""
-    # If there's item ID found in customer database (meaning using Personalize Segment)
-    if "itemId" in customer_details.index:
-        # Get Item Metadata (Airline)
-        with fs.open(
-            f"s3://{BUCKET_NAME}/demo-data/df_item_deduplicated.csv", "rb"
-        ) as f:
-            item_data = pd.read_csv(f)
-            item_data = item_data.loc[item_data["ITEM_ID"] == int(customer_details.loc["itemId"])]
+        st.markdown("""# **GenAI Direct Marketing Creator**""")
 
-    else:
-        # Get Item Metadata (Banking) since using Pinpoint Segment
-        with fs.open(f"s3://{BUCKET_NAME}/demo-data/df_item_banking.csv", "rb") as f:
-            item_data = pd.read_csv(f)
-        item_data = item_data[
-            item_data["itemId"] == customer_details["User.UserAttributes.Product"]
-        ]
+        df = get_processed_segment(segment_key, load_segment())[0]
 
-    # Extract the single row as a Series
-    row = item_data.iloc[0]
+        # Get the specific customer's details
+        customer_details = df.iloc[st.session_state["customer_counter"]]
 
-    for col, value in row.items():
-        product_data += f"{col}: {value}; "
+        #### GET PRODUCT DATA FOR CONTENT GENERATION
+        item_data, product_data = get_customer_product_data(customer_details)
 
+        generated_content(
+            # reuse is only safe for the same segment, customer, model and prompt, a change to any of them
+            # must not show content generated for another one
+            cache_key=(
+                segment_key,
+                st.session_state["customer_counter"],
+                st.session_state["ai_model"],
+                hashlib.sha256(str(st.session_state.prompt).encode()).hexdigest(),
+            ),
+            customer_details=customer_details,
+            product_data=product_data,
+        )
 
-    # create a button that will generate the channel content
-    content = generateMarketingContent(
-        ai_model,
-        st.session_state.prompt,
-        channel,
-        product_data=product_data,
-        name=customer_details["User.UserAttributes.FirstName"],
-        age=customer_details["User.UserAttributes.Age"],
-        lang=customer_details["User.UserAttributes.PreferredLanguage"],
-    )
+        customer_panel(customer_details, item_data, product_data)
 
-    # Show the generated text in a text box (not editable yet)
-    text_area = st.text_area(
-        f"#### Generated {channel}", content, key="generated_content", height=400
-    )
 
-    # Check if there is any adjusted text, if not use the generated text
-    text_to_show = st.session_state.get("adjusted_text", content)
-    del content
+@st.fragment
+def generated_content(cache_key, customer_details, product_data):
+    """
+    Generated content of the current customer, edits and regeneration only rerun this part
+    """
+    with log_duration(LOGGER, "Generated content fragment"):
+        channel = customer_details.loc["ChannelType"]
 
-    # Extract content from text_area
-    message_subject, message_body_html, message_body_text = extract_content(
-        text_to_show
-    )
-    # override the theme, else it will use the Streamlit applied theme
-    over_theme = {
-        "txc_inactive": "white",
-        "menu_background": "lightgrey",
-        "txc_active": "white",
-        "option_active": "blue",
-    }
-    font_fmt = {"font-class": "h2", "font-size": "150%"}
+        # create a button that will generate the channel content
+        content = get_generated_content(
+            cache_key, st.session_state["ai_model"], channel, product_data, customer_details
+        )
 
-    col1, _, _, _, col2 = st.columns([2, 1, 1, 2, 2], gap="small")
+        # Show the generated text in a text box (not editable yet)
+        st.text_area(
+            f"#### Generated {channel}", content, key="generated_content", height=400
+        )
+
+        # Check if there is any adjusted text, if not use the generated text
+        text_to_show = st.session_state.get("adjusted_text", content)
+        del content
+
+        # Extract content from text_area
+        message_subject, message_body_html, message_body_text = extract_content(
+            text_to_show
+        )
+
+        col1, _, _, _, col2 = st.columns([2, 1, 1, 2, 2], gap="small")
+
+        with col1:
+            send_controls(
+                customer_details=customer_details,
+                message_subject=message_subject,
+                message_body_html=message_body_html,
+                message_body_text=message_body_text,
+            )
+
+        with col2:
+            # the content is generated again when this fragment reruns
+            st.button(
+                "Disagree - try again",
+                key="try_again",
+                help="Try again with different parameters",
+                on_click=discard_generated_content,
+                args=(cache_key,),
+            )
+
+
+@st.fragment
+def send_controls(customer_details, message_subject, message_body_html, message_body_text):
+    """
+    Send button, sending only reruns this part
+    """
+    with log_duration(LOGGER, "Send controls fragment"):
+        # Check the session state variable after sending
+        if st.session_state.button_clicked:
+            st.success("Message sent! Click to Proceed to next customer.")
+            return
 
-    with col1:
         st.button(
             "Send with Amazon Pinpoint",
             key="accept",
             help="Move to the next customer",
             on_click=set_button_clicked,
+            kwargs={
+                "customer_details": customer_details,
+                "message_subject": message_subject,
+                "message_body_html": message_body_html,
+                "message_body_text": message_body_text,
+            },
         )
 
-    with col2:
-        st.button(
-            "Disagree - try again",
-            key="try_again",
-            help="Try again with different parameters",
-        )
+
+def customer_panel(customer_details, item_data, product_data):
+    """
+    Product, customer and prompt details of the current customer
+    """
+    channel = customer_details.loc["ChannelType"]
+    customer_details_df = customer_details.to_frame()
 
     with st.expander("#### Recommended Product Details", expanded=False):
         # If there's item ID found in customer database
@@ -722,3 +767,149 @@ else:
 
     with st.expander("#### Prompt Details", expanded=False):
         st.code(template, language="text")
+
+
+def apply_segment_refinement(base_handle, filters, sample_size):
+    """
+    Hand the refined segment to the Content Generator, the full segment stays available
+    """
+    refined_df = query_segment(base_handle, filters, sample_size=sample_size or None)
+    st.session_state["segment_handle"] = get_segment_store().put(refined_df, name=f"{base_handle.name} (refined)")
+    st.session_state["df_name"] = st.session_state["segment_handle"].name
+    st.session_state["base_segment_handle"] = base_handle
+    st.session_state["customer_counter"] = 0
+
+
+def reset_segment_refinement():
+    """
+    Go back to the full confirmed segment
+    """
+    base_handle = st.session_state.pop("base_segment_handle")
+    st.session_state["segment_handle"] = base_handle
+    st.session_state["df_name"] = base_handle.name
+    st.session_state["customer_counter"] = 0
+
+
+@st.fragment
+def refine_segment_panel():
+    """
+    Narrow the confirmed segment with SQL filters over its stored file before generating
+    """
+    # Refinements always start from the full confirmed segment
+    base_handle = st.session_state.get("base_segment_handle") or st.session_state["segment_handle"]
+    columns = segment_schema(base_handle).names
+
+    with st.expander("#### Refine segment", expanded="base_segment_handle" in st.session_state):
+        st.caption("All filters must match. Use comma separated values with the 'in' operator.")
+        refinement = st.data_editor(
+            pd.DataFrame(columns=["column", "operator", "value"], dtype="str"),
+            column_config={
+                "column": st.column_config.SelectboxColumn("Column", options=columns, required=True),
+                "operator": st.column_config.SelectboxColumn(
+                    "Operator", options=SEGMENT_QUERY_OPERATORS, required=True, default="="
+                ),
+                "value": st.column_config.TextColumn("Value", required=True),
+            },
+            num_rows="dynamic",
+            hide_index=True,
+            use_container_width=True,
+            key="refine_filters",
+        )
+        filters = list(refinement.dropna().itertuples(index=False, name=None))
+
+        col1, col2 = st.columns([1, 1], gap="small")
+        with col1:
+            sample_size = st.number_input(
+                "Sample customers (0 keeps all)", min_value=0, value=0, step=10, key="refine_sample_size"
+            )
+        with col2:
+            group_by = st.multiselect("Preview customers per", columns, key="refine_group_by")
+
+        try:
+            matching = count_segment(base_handle, filters)
+            if group_by:
+                st.dataframe(
+                    query_segment(base_handle, filters, group_by=group_by, limit=50),
+                    hide_index=True,
+                    use_container_width=True,
+                )
+        except (KeyError, ValueError, duckdb.Error) as e:
+            st.error(f"Invalid refinement: {e}")
+            return
+        st.caption(f"{matching:,} of {base_handle.num_rows:,} customers match")
+
+        col1, col2 = st.columns([1, 1], gap="small")
+        with col1:
+            if st.button("Use refined segment", key="apply_refinement", disabled=not matching):
+                apply_segment_refinement(base_handle, filters, sample_size)
+                st.rerun()
+        with col2:
+            if st.button(
+                "Back to full segment",
+                key="reset_refinement",
+                disabled="base_segment_handle" not in st.session_state,
+            ):
+                reset_segment_refinement()
+                st.rerun()
+
+
+########################################################################################################################################################################
+######################################################## PAGE CODE    ##################################################################################################
+########################################################################################################################################################################
+
+with log_duration(LOGGER, "Content Generator full run"):
+    st.sidebar.markdown(f"<div style='{box_style}'>", unsafe_allow_html=True)
+    st.sidebar.markdown(
+        f"<p><strong>Current Segment: </strong> {st.session_state['df_name']}</p>",
+        unsafe_allow_html=True,
+    )
+
+    # Check whether segment is selected
+    if df is None:
+        st.error(
+            """
+        You have not specified a segment. Please choose a segment from Amazon Pinpoint or Amazon Personalize.
+                 """
+        )
+    # Check whether prompt is keyed in
+    elif "prompt" not in st.session_state:
+        # If no prompt found, use the banking prompt
+        st.error(
+            """
+        No prompt found. Please select a prompt from the sidebar.
+                 """
+        )
+    else:
+        #########################
+        #       SIDEBAR MODEL SELECTION
+        #########################
+
+        with st.sidebar:
+            st.markdown("")
+
+            # language model
+            st.subheader("Language Model")
+            ai_model = st.selectbox(
+                label="Select a language model:",
+                options=MODELS_DISPLAYED,
+                key="ai_model",
+                help="Choose the LLM model used for content generation",
+            )
+            if st.session_state["ai_model"] in MODELS_UNAVAILABLE:
+                st.error(f'{st.session_state["ai_model"]} not available', icon="⚠️")
+                st.stop()
+            elif st.session_state["ai_model"] in MODELS_NOT_DEPLOYED:
+                st.error(f'{st.session_state["ai_model"]} has been shut down', icon="⚠️")
+                st.stop()
+
+        #########################
+        #       PAGE CONTENT
+        #########################
+
+        refine_segment_panel()
+
+        # Navigation, customer details, generated content and send controls rerun as fragments
+        customer_navigation(
+            segment_key=st.session_state["segment_handle"].key,
+            num_customers=len(df),
+        )
@@ -0,0 +1,92 @@
+"""
+Shared HTTP session for the API Gateway clients
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from components.tracing import TRACEPARENT_HEADER, record_response, start_span
+
+#########################
+#      CONSTANTS
+#########################
+
+API_URI = os.environ.get("API_URI")
+
+# Keep-alive connections kept per host, Streamlit serves each browser session on its own thread
+POOL_MAXSIZE = int(os.environ.get("API_POOL_MAXSIZE", "20"))
+CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+# Read timeout (seconds) per route, content generation waits for the LLM
+ROUTE_READ_TIMEOUTS = {
+    "/content/bedrock": 120,
+    "/personalize/batch-segment-job": 60,
+    "/personalize/batch-segment-jobs": 60,
+    "/s3": 60,
+}
+
+# Only idempotent calls are retried, POST routes create jobs or send messages
+RETRY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide session with a bounded keep-alive connection pool and retries
+    """
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=RETRY)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Accept-Encoding": "gzip, deflate"})
+                _SESSION = session
+    return _SESSION
+
+
+def invoke_api(
+    method: str,
+    route: str,
+    access_token: str,
+    params: dict = None,
+) -> requests.Response:
+    """
+    Call an API Gateway route through the shared session, within a span continued by the Lambda
+    """
+    with start_span(f"{method} {route}", route=route) as span:
+        response = get_session().request(
+            method=method,
+            url=API_URI + route,
+            json=params,
+            headers={"Authorization": access_token, TRACEPARENT_HEADER: span.traceparent()},
+            timeout=(CONNECT_TIMEOUT, ROUTE_READ_TIMEOUTS.get(route, DEFAULT_READ_TIMEOUT)),
+        )
+        record_response(span, response.status_code, response.headers)
+    return response
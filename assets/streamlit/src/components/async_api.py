@@ -0,0 +1,331 @@
+"""
+Asyncio client for the API Gateway routes, for issuing several calls concurrently from a page
+
+Mirrors pinpoint_api, personalize_api and genai_api as coroutines sharing one aiohttp session.
+Streamlit scripts are synchronous, so the session lives on a background event loop thread and
+the run / run_all bridges block the calling script until the coroutines complete, e.g.
+
+    responses = async_api.run_all(
+        async_api.invoke_personalize_describe_job(access_token=token, job_arn=arn) for arn in job_arns
+    )
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Awaitable, Iterable
+
+import aiohttp
+
+from components.api_session import (
+    API_URI,
+    CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    POOL_MAXSIZE,
+    ROUTE_READ_TIMEOUTS,
+)
+from components.tracing import (
+    TRACEPARENT_HEADER,
+    current_span,
+    record_response,
+    set_current_span,
+    start_span,
+)
+
+#########################
+#      CONSTANTS
+#########################
+
+# Calls in flight at once across all browser sessions of this process
+MAX_CONCURRENCY = int(os.environ.get("API_MAX_CONCURRENCY", "8"))
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_LOOP = None
+_SESSION = None
+_SEMAPHORE = None
+_LOOP_LOCK = threading.Lock()
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Process-wide event loop running on a daemon thread
+    """
+    global _LOOP
+    if _LOOP is None:
+        with _LOOP_LOCK:
+            if _LOOP is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-api", daemon=True).start()
+                _LOOP = loop
+    return _LOOP
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """
+    Shared session and concurrency limit, only ever touched from the background loop
+    """
+    global _SESSION, _SEMAPHORE
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_MAXSIZE, keepalive_timeout=60),
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+        _SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _SESSION
+
+
+def run(coro: Awaitable, timeout: float = None) -> Any:
+    """
+    Run a coroutine on the background loop and wait for its result
+    """
+    parent = current_span()
+
+    async def traced():
+        # tasks on the loop thread do not see the caller's context, its span is handed over explicitly
+        set_current_span(parent)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(traced(), _get_loop()).result(timeout)
+
+
+def run_all(coros: Iterable[Awaitable], timeout: float = None, return_exceptions: bool = False) -> list:
+    """
+    Run coroutines concurrently on the background loop, results come back in input order
+    """
+
+    async def gather():
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+
+    return run(gather(), timeout=timeout)
+
+
+async def invoke_api(
+    method: str,
+    route: str,
+    access_token: str,
+    params: dict = None,
+) -> bytes:
+    """
+    Call an API Gateway route through the shared session, retrying GET on throttling and 5xx
+    """
+    session = _get_session()
+    timeout = aiohttp.ClientTimeout(
+        connect=CONNECT_TIMEOUT,
+        sock_read=ROUTE_READ_TIMEOUTS.get(route, DEFAULT_READ_TIMEOUT),
+    )
+    attempt = 0
+    async with _SEMAPHORE:
+        with start_span(f"{method} {route}", route=route) as span:
+            while True:
+                async with session.request(
+                    method=method,
+                    url=API_URI + route,
+                    json=params,
+                    headers={"Authorization": access_token, TRACEPARENT_HEADER: span.traceparent()},
+                    timeout=timeout,
+                ) as response:
+                    body = await response.read()
+                    if method != "GET" or response.status not in RETRY_STATUSES or attempt >= RETRY_TOTAL:
+                        record_response(span, response.status, response.headers)
+                        span.attributes["retries"] = attempt
+                        return body
+                    retry_after = response.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else RETRY_BACKOFF_FACTOR * 2**attempt
+                attempt += 1
+                await asyncio.sleep(delay)
+
+
+## ********* Pinpoint API *********
+async def invoke_pinpoint_segment(
+    access_token: str,
+    version: str = None,
+) -> bytes:
+    """
+    Get Segments From Pinpoint Project, segments are left out when version is still current
+    """
+    params = {"version": version}
+    return await invoke_api(method="GET", route="/pinpoint/segment", access_token=access_token, params=params)
+
+
+async def invoke_pinpoint_create_export_job(
+    access_token: str,
+    segment_id: str,
+) -> bytes:
+    """
+    Create Export Job For A Pinpoint Segment
+    """
+    params = {"segment-id": segment_id}
+    return await invoke_api(method="POST", route="/pinpoint/job", access_token=access_token, params=params)
+
+
+async def invoke_pinpoint_export_job_status(
+    access_token: str,
+    job_id: str,
+) -> bytes:
+    """
+    Get Export Job Status From Pinpoint
+    """
+    params = {"job-id": job_id}
+    return await invoke_api(method="GET", route="/pinpoint/job", access_token=access_token, params=params)
+
+
+async def invoke_pinpoint_send_message(
+    access_token: str,
+    address: str,
+    channel: str,
+    message_body_text: str,
+    message_subject: str = None,
+    message_body_html: str = None,
+) -> bytes:
+    """
+    Send Message via Pinpoint
+    """
+    params = {
+        "address": address,
+        "channel": channel,
+        "message-subject": message_subject,
+        "message-body-html": message_body_html,
+        "message-body-text": message_body_text,
+    }
+    return await invoke_api(method="POST", route="/pinpoint/message", access_token=access_token, params=params)
+
+
+async def invoke_s3_fetch_files(
+    access_token: str,
+    s3_url_prefix: str,
+    total_pieces: int,
+) -> bytes:
+    """
+    Get Files URI from S3 which were exported by Pinpoint
+    """
+    params = {
+        "s3-url-prefix": s3_url_prefix,
+        "total-pieces": total_pieces,
+    }
+    return await invoke_api(method="GET", route="/s3", access_token=access_token, params=params)
+
+
+## ********* Personalize API *********
+async def invoke_personalize_batch_segment(
+    access_token: str,
+    item_ids: str,
+    num_results: int,
+    num_shards: int = 1,
+) -> bytes:
+    """
+    Start batch segmentation job in Personalize, split across num_shards concurrent jobs
+    """
+    params = {
+        "item-ids": item_ids,
+        "num-results": num_results,
+        "num-shards": num_shards,
+    }
+    return await invoke_api(
+        method="POST", route="/personalize/batch-segment-job", access_token=access_token, params=params
+    )
+
+
+async def invoke_personalize_get_jobs(
+    access_token: str,
+    status: str = None,
+    sort_by: str = "creationDateTime",
+    ascending: bool = False,
+    max_results: int = 100,
+    next_token: str = None,
+) -> bytes:
+    """
+    Get one page of batch segment jobs in personalize, filtered and sorted server-side
+    """
+    params = {
+        "sort-by": sort_by,
+        "ascending": ascending,
+        "max-results": max_results,
+    }
+    if status:
+        params["status"] = status
+    if next_token:
+        params["next-token"] = next_token
+    return await invoke_api(
+        method="GET", route="/personalize/batch-segment-jobs", access_token=access_token, params=params
+    )
+
+
+async def invoke_personalize_describe_job(
+    access_token: str,
+    job_arn: str,
+) -> bytes:
+    """
+    Describe a batch segment job in personalize
+    """
+    params = {"job-arn": job_arn}
+    return await invoke_api(
+        method="GET", route="/personalize/batch-segment-job", access_token=access_token, params=params
+    )
+
+
+async def invoke_personalize_describe_job_group(
+    access_token: str,
+    group_id: str,
+) -> bytes:
+    """
+    Describe a group of sharded batch segment jobs in personalize
+    """
+    params = {"group-id": group_id}
+    return await invoke_api(
+        method="GET", route="/personalize/batch-segment-job", access_token=access_token, params=params
+    )
+
+
+async def invoke_personalize_recommendations(
+    access_token: str,
+    user_ids: str,
+    num_results: int = 5,
+) -> bytes:
+    """
+    Get real-time recommendations for a handful of users from personalize
+    """
+    params = {
+        "user-ids": user_ids,
+        "num-results": num_results,
+    }
+    return await invoke_api(
+        method="POST", route="/personalize/recommendations", access_token=access_token, params=params
+    )
+
+
+## ********* GenAI API *********
+async def invoke_content_creation(
+    prompt: str,
+    model_id: int,
+    access_token: str,
+    answer_length: int = 4096,
+    temperature: float = 0.0,
+) -> str:
+    """
+    Run LLM to generate content via API
+    """
+    params = {
+        "query": prompt,
+        "type": "content_generation",
+        "model_params": {
+            "model_id": model_id,
+            "answer_length": answer_length,
+            "temperature": temperature,
+        },
+    }
+    response = await invoke_api(method="POST", route="/content/bedrock", access_token=access_token, params=params)
+    return json.loads(response)
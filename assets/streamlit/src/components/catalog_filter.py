@@ -0,0 +1,151 @@
+"""
+Indexed filter engine for the item catalog
+
+Column statistics, integer codes and inverted indexes are computed once per catalog version
+(S3 ETag) and shared by every session, so building the filter widgets and filtering cost the
+same on every rerun whatever the number of reruns and sessions.
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from components.resources import get_filesystem
+from components.shared_cache import shared_cache
+
+#########################
+#      CONSTANTS
+#########################
+
+ALL = "All"
+# Seconds before the catalog ETag is checked again
+ETAG_TTL = 60
+# Seconds a catalog version is kept in the cache shared by the Streamlit tasks
+CATALOG_SHARED_TTL = 24 * 3600
+# Filter combinations whose result is kept per catalog version
+MAX_CACHED_FILTERS = 64
+
+
+#########################
+#    HELPER CLASSES
+#########################
+
+
+class CatalogFilterEngine:
+    """
+    Precomputed per-column stats and indexes of an item catalog
+    """
+
+    def __init__(self, df: pd.DataFrame, id_column: str = "ITEM_ID"):
+        self.df = df
+        self.id_column = id_column
+        self.categorical = {}
+        self.numeric = {}
+        for col in df.columns:
+            if col == id_column:
+                continue
+            if df[col].dtype == "object":
+                # codes follow the order of first appearance, like unique()
+                codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+                codes = codes.astype(np.int32)
+                order = np.argsort(codes, kind="stable").astype(np.int32)
+                bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+                self.categorical[col] = {
+                    "options": [ALL] + list(uniques),
+                    "codes": {value: code for code, value in enumerate(uniques)},
+                    # row positions per code
+                    "index": np.split(order, bounds),
+                }
+            else:
+                values = df[col].to_numpy(dtype=np.float64)
+                self.numeric[col] = {
+                    "values": values,
+                    "valid": ~np.isnan(values),
+                    "min": float(np.nanmin(values)),
+                    "max": float(np.nanmax(values)),
+                }
+        self._positions = lru_cache(maxsize=MAX_CACHED_FILTERS)(self._compute_positions)
+
+    def options(self, col: str) -> list:
+        """
+        Selectbox options of a categorical column
+        """
+        return self.categorical[col]["options"]
+
+    def value_range(self, col: str) -> tuple:
+        """
+        Slider bounds of a numeric column
+        """
+        return self.numeric[col]["min"], self.numeric[col]["max"]
+
+    def _compute_positions(self, filters: tuple) -> np.ndarray:
+        mask = np.ones(len(self.df), dtype=bool)
+        for col, value in filters:
+            if col in self.categorical:
+                code = self.categorical[col]["codes"].get(value)
+                selected = np.zeros(len(self.df), dtype=bool)
+                if code is not None:
+                    selected[self.categorical[col]["index"][code]] = True
+                mask &= selected
+            else:
+                low, high = value
+                stats = self.numeric[col]
+                # a full-range slider only drops rows missing the value
+                if low > stats["min"] or high < stats["max"]:
+                    mask &= (stats["values"] >= low) & (stats["values"] <= high)
+                else:
+                    mask &= stats["valid"]
+        return np.flatnonzero(mask)
+
+    def filter(self, filters: dict) -> pd.DataFrame:
+        """
+        Rows matching every filter, evaluated as one combined mask
+
+        filters maps categorical columns to a value or "All" and numeric columns to a (low, high) range
+        """
+        active = tuple(sorted((col, value) for col, value in filters.items() if not _is_all(value)))
+        if not active:
+            return self.df
+        return self.df.iloc[self._positions(active)]
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+def _is_all(value) -> bool:
+    return isinstance(value, str) and value == ALL
+
+
+@st.cache_data(ttl=ETAG_TTL, show_spinner=False)
+@shared_cache(ttl=ETAG_TTL)
+def _catalog_etag(path: str) -> str:
+    return get_filesystem().info(path, refresh=True).get("ETag", "")
+
+
+@shared_cache(ttl=CATALOG_SHARED_TTL)
+def _read_catalog(path: str, etag: str) -> pd.DataFrame:
+    # one S3 read per catalog version across all tasks, the ETag is part of the cache key
+    with get_filesystem().open(path, "rb") as f:
+        return pd.read_csv(f)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _build_engine(path: str, etag: str) -> CatalogFilterEngine:
+    return CatalogFilterEngine(_read_catalog(path, etag))
+
+
+def get_catalog_filter_engine(path: str) -> CatalogFilterEngine:
+    """
+    Filter engine of the catalog at an S3 path, rebuilt only when the file changes
+    """
+    return _build_engine(path, _catalog_etag(path))
@@ -0,0 +1,268 @@
+"""
+Data access layer pushing column projection and simple predicates down to S3
+
+CSV and JSON lines objects are filtered with S3 Select, Parquet objects are read through a pyarrow
+dataset which prunes row groups on their statistics and only fetches the projected column chunks.
+Anything S3 Select rejects falls back to a full read filtered in pandas, so callers always get the
+same result. Every call logs how it was served, the bytes transferred and its latency.
+
+Predicates are (column, operator, value) triples combined with AND, operators are
+=, !=, <, <=, >, >= and in (value is a list).
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import operator
+import sys
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import pandas as pd
+import pyarrow.dataset as ds
+from botocore.exceptions import BotoCoreError, ClientError
+
+from components.resources import get_filesystem, get_s3_client
+
+LOGGER = logging.Logger("Data-Access", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+#########################
+#      CONSTANTS
+#########################
+
+# Comparison operators, shared by pyarrow expressions and pandas series. "in" is handled with isin
+COMPARISONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+OPERATORS = (*COMPARISONS, "in")
+# S3 Select rejects expressions longer than 256 KiB, long IN lists are filtered after a full read
+MAX_SELECT_EXPRESSION = 200 * 1024
+# Bytes read to find the header of a CSV object when no projection is given
+CSV_HEADER_RANGE = 64 * 1024
+# Recent calls kept for inspection, newest last
+READ_STATS = deque(maxlen=100)
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+def _format_of(path: str) -> tuple:
+    """
+    Format and compression of an object from its key
+    """
+    key = path.lower()
+    compression = "GZIP" if key.endswith(".gz") else "NONE"
+    key = key[:-3] if key.endswith(".gz") else key
+    if key.endswith(".parquet"):
+        return "parquet", "NONE"
+    if key.endswith(".csv"):
+        return "csv", compression
+    # JSON lines: .json, .jsonl, Personalize .json.out and the extensionless Pinpoint export pieces,
+    # whose gzip compression their key does not tell, callers pass it to read_table
+    return "json", compression
+
+
+def _record(path: str, method: str, bytes_transferred: int, start: float, rows: int) -> None:
+    stats = {
+        "path": path,
+        "method": method,
+        "bytes": bytes_transferred,
+        "latencyMs": round((time.perf_counter() - start) * 1000, 1),
+        "rows": rows,
+    }
+    READ_STATS.append(stats)
+    LOGGER.info(f"Read {path} via {method}: {bytes_transferred / 1024:.1f} KiB, {rows} rows in {stats['latencyMs']} ms")
+
+
+def _literal(value) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def _select_expression(fmt: str, columns: list, predicates: list) -> str:
+    """
+    S3 Select SQL for a projection and predicates, CSV fields are text and cast for numeric comparisons
+    """
+
+    def field(column):
+        return 's."' + column.replace('"', '""') + '"'
+
+    projection = ", ".join(field(column) for column in columns) if columns else "*"
+    clauses = []
+    for column, op, value in predicates:
+        values = value if op == "in" else [value]
+        numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+        target = f"CAST({field(column)} AS FLOAT)" if fmt == "csv" and numeric else field(column)
+        if op == "in":
+            clauses.append(f"{target} IN ({', '.join(_literal(v) for v in values)})")
+        else:
+            clauses.append(f"{target} {'<>' if op == '!=' else op} {_literal(value)}")
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return f"SELECT {projection} FROM S3Object s{where}"
+
+
+def _csv_header(bucket: str, key: str, compression: str) -> list:
+    """
+    Column names of a CSV object, from its first bytes only
+    """
+    if compression != "NONE":
+        raise ValueError("Header of a compressed CSV needs a full read")
+    response = get_s3_client().get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{CSV_HEADER_RANGE - 1}")
+    first_line = response["Body"].read().decode("utf-8").splitlines()[0]
+    return next(csv.reader([first_line]))
+
+
+def _s3_select(path: str, fmt: str, compression: str, columns: list, predicates: list) -> tuple:
+    """
+    Run S3 Select, returns the DataFrame and the bytes returned by S3
+    """
+    parsed = urlparse(path)
+    bucket, key = parsed.netloc, parsed.path.lstrip("/")
+    if fmt == "csv":
+        # CSV output keeps pandas type inference identical to a full read
+        columns = columns or _csv_header(bucket, key, compression)
+        input_serialization = {"CSV": {"FileHeaderInfo": "USE"}, "CompressionType": compression}
+        output_serialization = {"CSV": {}}
+    else:
+        input_serialization = {"JSON": {"Type": "LINES"}, "CompressionType": compression}
+        output_serialization = {"JSON": {}}
+
+    expression = _select_expression(fmt, columns, predicates)
+    if len(expression) > MAX_SELECT_EXPRESSION:
+        raise ValueError("S3 Select expression too long")
+    response = get_s3_client().select_object_content(
+        Bucket=bucket,
+        Key=key,
+        ExpressionType="SQL",
+        Expression=expression,
+        InputSerialization=input_serialization,
+        OutputSerialization=output_serialization,
+    )
+
+    payload = io.BytesIO()
+    bytes_returned = 0
+    for event in response["Payload"]:
+        if "Records" in event:
+            payload.write(event["Records"]["Payload"])
+        elif "Stats" in event:
+            bytes_returned = event["Stats"]["Details"]["BytesReturned"]
+    payload.seek(0)
+
+    if not payload.getbuffer().nbytes:
+        return pd.DataFrame(columns=columns), bytes_returned
+    if fmt == "csv":
+        return pd.read_csv(payload, names=columns, header=None), bytes_returned
+    return pd.read_json(payload, lines=True), bytes_returned
+
+
+def _compare(operand, op: str, value):
+    """
+    Predicate on a pyarrow field or a pandas series
+    """
+    if op == "in":
+        return operand.isin(value)
+    return COMPARISONS[op](operand, value)
+
+
+def _read_parquet(path: str, columns: list, predicates: list) -> tuple:
+    """
+    Read a Parquet object pruning row groups, returns the DataFrame and the compressed bytes fetched
+    """
+    dataset = ds.dataset(path.replace("s3://", "", 1), filesystem=get_filesystem(), format="parquet")
+    expression = None
+    for column, op, value in predicates:
+        clause = _compare(ds.field(column), op, value)
+        expression = clause if expression is None else expression & clause
+
+    table = dataset.to_table(columns=columns, filter=expression)
+
+    # compressed size of the column chunks of the row groups surviving the pruning
+    bytes_fetched = 0
+    for fragment in dataset.get_fragments(filter=expression):
+        metadata = fragment.metadata
+        for row_group in fragment.split_by_row_group(filter=expression, schema=dataset.schema):
+            group = metadata.row_group(row_group.row_groups[0].id)
+            bytes_fetched += sum(
+                group.column(i).total_compressed_size
+                for i in range(group.num_columns)
+                if columns is None or group.column(i).path_in_schema.split(".")[0] in columns
+            )
+    return table.to_pandas(), bytes_fetched
+
+
+def _full_read(path: str, fmt: str, compression: str) -> tuple:
+    """
+    Download and parse a whole object, returns the DataFrame and the object size
+    """
+    fs = get_filesystem()
+    with fs.open(path, "rb") as f:
+        if fmt == "parquet":
+            df = pd.read_parquet(f)
+        elif fmt == "csv":
+            df = pd.read_csv(f, compression="gzip" if compression == "GZIP" else None)
+        else:
+            df = pd.read_json(f, lines=True, compression="gzip" if compression == "GZIP" else None)
+    return df, fs.size(path)
+
+
+def apply_predicates(df: pd.DataFrame, columns: list = None, predicates: list = None) -> pd.DataFrame:
+    """
+    Same projection and predicates as the pushed down reads, evaluated in pandas
+    """
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in predicates or []:
+        mask &= _compare(df[column], op, value)
+    df = df[mask] if predicates else df
+    return df[columns] if columns else df
+
+
+def read_table(path: str, columns: list = None, predicates: list = None, compression: str = None) -> pd.DataFrame:
+    """
+    Read an S3 object as a DataFrame, pushing the projection and predicates down when possible
+
+    compression ("GZIP" or "NONE") overrides the one inferred from the key, for objects without a suffix
+    """
+    predicates = predicates or []
+    for predicate in predicates:
+        if predicate[1] not in OPERATORS:
+            raise ValueError(f"Unsupported operator {predicate[1]}")
+    fmt, inferred_compression = _format_of(path)
+    compression = compression or inferred_compression
+    start = time.perf_counter()
+
+    if fmt == "parquet":
+        df, bytes_transferred = _read_parquet(path, columns, predicates)
+        _record(path, "parquet-pruning", bytes_transferred, start, len(df))
+        return df
+
+    if columns or predicates:
+        try:
+            df, bytes_transferred = _s3_select(path, fmt, compression, columns, predicates)
+            _record(path, "s3-select", bytes_transferred, start, len(df))
+            return df
+        except (ClientError, BotoCoreError, ValueError) as e:
+            LOGGER.warning(f"S3 Select not possible on {path}, falling back to a full read: {e}")
+
+    # nothing to push down, or S3 Select refused it
+    df, bytes_transferred = _full_read(path, fmt, compression)
+    df = apply_predicates(df, columns, predicates)
+    _record(path, "full-read", bytes_transferred, start, len(df))
+    return df
@@ -9,15 +9,8 @@ Helper classes for LLM inference
 from __future__ import annotations
 
 import json
-import os
 
-import requests
-
-#########################
-#      CONSTANTS
-#########################
-
-API_URI = os.environ.get("API_URI")
+from components.api_session import invoke_api
 
 
 #########################
@@ -45,11 +38,11 @@ def invoke_content_creation(
             "temperature": temperature,
         },
     }
-    response = requests.post(
-        url=API_URI + "/content/bedrock",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    response = invoke_api(
+        method="POST",
+        route="/content/bedrock",
+        access_token=access_token,
+        params=params,
     )
     print(response.text)
     response = json.loads(response.text)
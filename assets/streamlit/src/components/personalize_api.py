@@ -9,15 +9,8 @@ Helper classes for Amazon Personalize
 from __future__ import annotations
 
 import json
-import os
 
-import requests
-
-#########################
-#      CONSTANTS
-#########################
-
-API_URI = os.environ.get("API_URI")
+from components.api_session import invoke_api
 
 
 #########################
@@ -29,37 +22,51 @@ def invoke_personalize_batch_segment(
     access_token: str,
     item_ids: str,
     num_results: int,
+    num_shards: int = 1,
 ) -> list:
     """
-    Start batch segmentation job in Personalzie
+    Start batch segmentation job in Personalzie, split across num_shards concurrent jobs
     """
 
     params = {
         "item-ids": item_ids,
         "num-results": num_results,
+        "num-shards": num_shards,
     }
-    response = requests.post(
-        url=API_URI + "/personalize/batch-segment-job",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    response = invoke_api(
+        method="POST",
+        route="/personalize/batch-segment-job",
+        access_token=access_token,
+        params=params,
     )
     return response.content
 
 def invoke_personalize_get_jobs( 
     access_token: str,
+    status: str = None,
+    sort_by: str = "creationDateTime",
+    ascending: bool = False,
+    max_results: int = 100,
+    next_token: str = None,
 ) -> list:
     """
-    Get all batch segment jobs in personalize
+    Get one page of batch segment jobs in personalize, filtered and sorted server-side
     """
 
     params = {
+        "sort-by": sort_by,
+        "ascending": ascending,
+        "max-results": max_results,
     }
-    response = requests.get(
-        url=API_URI + "/personalize/batch-segment-jobs",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    if status:
+        params["status"] = status
+    if next_token:
+        params["next-token"] = next_token
+    response = invoke_api(
+        method="GET",
+        route="/personalize/batch-segment-jobs",
+        access_token=access_token,
+        params=params,
     )
     return response.content
 
@@ -74,10 +81,50 @@ def invoke_personalize_describe_job(
     params = {
         "job-arn": job_arn
     }
-    response = requests.get(
-        url=API_URI + "/personalize/batch-segment-job",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    response = invoke_api(
+        method="GET",
+        route="/personalize/batch-segment-job",
+        access_token=access_token,
+        params=params,
+    )
+    return response.content
+
+def invoke_personalize_describe_job_group(
+    access_token: str,
+    group_id: str,
+) -> list:
+    """
+    Describe a group of sharded batch segment jobs in personalize
+    """
+
+    params = {
+        "group-id": group_id
+    }
+    response = invoke_api(
+        method="GET",
+        route="/personalize/batch-segment-job",
+        access_token=access_token,
+        params=params,
     )
-    return response.content
\ No newline at end of file
+    return response.content
+
+def invoke_personalize_recommendations(
+    access_token: str,
+    user_ids: str,
+    num_results: int = 5,
+) -> list:
+    """
+    Get real-time recommendations for a handful of users from personalize
+    """
+
+    params = {
+        "user-ids": user_ids,
+        "num-results": num_results,
+    }
+    response = invoke_api(
+        method="POST",
+        route="/personalize/recommendations",
+        access_token=access_token,
+        params=params,
+    )
+    return response.content
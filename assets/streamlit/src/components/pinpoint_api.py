@@ -9,15 +9,8 @@ Helper classes for Amazon Pinpoint
 from __future__ import annotations
 
 import json
-import os
 
-import requests
-
-#########################
-#      CONSTANTS
-#########################
-
-API_URI = os.environ.get("API_URI")
+from components.api_session import invoke_api
 
 
 #########################
@@ -27,14 +20,19 @@ API_URI = os.environ.get("API_URI")
 ## ********* Pinpoint API ********* 
 def invoke_pinpoint_segment( 
     access_token: str,
+    version: str = None,
 ) -> list:
     """
-    Get Segments From Pinpoint Project
+    Get Segments From Pinpoint Project, segments are left out when version is still current
     """
-    response = requests.get(
-        url=API_URI + "/pinpoint/segment",
-        stream=False,
-        headers={"Authorization": access_token},
+    params = {
+        "version": version
+    }
+    response = invoke_api(
+        method="GET",
+        route="/pinpoint/segment",
+        access_token=access_token,
+        params=params,
     )
     return response.content
 
@@ -48,11 +46,11 @@ def invoke_pinpoint_create_export_job(
     params = {
         "segment-id": segment_id
     }
-    response = requests.post(
-        url=API_URI + "/pinpoint/job",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    response = invoke_api(
+        method="POST",
+        route="/pinpoint/job",
+        access_token=access_token,
+        params=params,
     )
     return response.content
 
@@ -66,11 +64,11 @@ def invoke_pinpoint_export_job_status(
     params = {
         "job-id": job_id
     }
-    response = requests.get(
-        url=API_URI + "/pinpoint/job",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    response = invoke_api(
+        method="GET",
+        route="/pinpoint/job",
+        access_token=access_token,
+        params=params,
     )
     return response.content
 
@@ -92,11 +90,11 @@ def invoke_pinpoint_send_message(
         "message-body-html": message_body_html,
         "message-body-text": message_body_text,
     }
-    response = requests.post(
-        url=API_URI + "/pinpoint/message",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    response = invoke_api(
+        method="POST",
+        route="/pinpoint/message",
+        access_token=access_token,
+        params=params,
     )
     return response.content
 
@@ -112,11 +110,11 @@ def invoke_s3_fetch_files(
         "s3-url-prefix": s3_url_prefix,
         "total-pieces": total_pieces,
     }
-    response = requests.get(
-        url=API_URI + "/s3",
-        json=params,
-        stream=False,
-        headers={"Authorization": access_token},
+    response = invoke_api(
+        method="GET",
+        route="/s3",
+        access_token=access_token,
+        params=params,
     )
     return response.content
 
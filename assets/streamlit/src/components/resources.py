@@ -0,0 +1,64 @@
+"""
+Process-wide resources shared by every page and rerun
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import streamlit as st
+
+#########################
+#      CONSTANTS
+#########################
+
+MODEL_SPECS_PATH = Path(__file__).parent / "model_specs.json"
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+@st.cache_resource(show_spinner=False)
+def get_filesystem():
+    """
+    S3 filesystem built once per process instead of on every page rerun
+    """
+    import s3fs
+
+    return s3fs.S3FileSystem(anon=False)
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_specs() -> dict:
+    """
+    Default model specs, read once per process. Shared object, do not mutate
+    """
+    with open(MODEL_SPECS_PATH) as f:
+        return json.load(f)
+
+
+@st.cache_resource(show_spinner=False)
+def get_bedrock_runtime_client(region_name: str = "us-east-1"):
+    """
+    Bedrock runtime client for the in-page LangChain generation path
+    """
+    import boto3
+
+    return boto3.client("bedrock-runtime", region_name=region_name)
+
+
+@st.cache_resource(show_spinner=False)
+def get_s3_client():
+    """
+    S3 client for calls s3fs does not cover, e.g. S3 Select
+    """
+    import boto3
+
+    return boto3.client("s3")
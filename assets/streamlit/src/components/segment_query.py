@@ -0,0 +1,167 @@
+"""
+Embedded SQL engine over the stored segment files
+
+DuckDB scans the Arrow files of the segment store through a pyarrow dataset, so filters and
+projections are pushed into the scan, only the needed columns are paged in from the memory-mapped
+file and the query runs on several threads, spilling to SEGMENT_QUERY_TEMP_DIR when it does not
+fit in SEGMENT_QUERY_MEMORY_LIMIT. Queries are built from structured filters, never from user SQL.
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import os
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+
+from components.segment_store import SegmentHandle, get_segment_store, table_to_pandas
+
+#########################
+#      CONSTANTS
+#########################
+
+SEGMENT_QUERY_THREADS = int(os.environ.get("SEGMENT_QUERY_THREADS", "4"))
+SEGMENT_QUERY_MEMORY_LIMIT = os.environ.get("SEGMENT_QUERY_MEMORY_LIMIT", "256MB")
+SEGMENT_QUERY_TEMP_DIR = os.environ.get("SEGMENT_QUERY_TEMP_DIR", "/tmp/segment-query")
+
+OPERATORS = ["=", "!=", ">", ">=", "<", "<=", "in", "contains"]
+# Seed of the sampling, the same refinement gives the same customers
+SAMPLE_SEED = 42
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_connection() -> duckdb.DuckDBPyConnection:
+    """
+    Process-wide DuckDB database, every query runs on its own cursor
+    """
+    return duckdb.connect(
+        database=":memory:",
+        config={
+            "threads": SEGMENT_QUERY_THREADS,
+            "memory_limit": SEGMENT_QUERY_MEMORY_LIMIT,
+            "temp_directory": SEGMENT_QUERY_TEMP_DIR,
+        },
+    )
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _segment_dataset(handle: SegmentHandle) -> ds.Dataset:
+    path = get_segment_store().path(handle)
+    if path is None:
+        raise KeyError(f"Segment {handle.name} is no longer stored")
+    return ds.dataset(str(path), format="arrow")
+
+
+def segment_schema(handle: SegmentHandle) -> pa.Schema:
+    """
+    Columns and types of a stored segment, read from the file footer only
+    """
+    return _segment_dataset(handle).schema
+
+
+def _cast_value(value_type: pa.DataType, operator: str, value: str):
+    """
+    Filter value typed after its column, "in" takes a comma separated list
+    """
+    if operator == "in":
+        return [_cast_value(value_type, "=", item.strip()) for item in value.split(",")]
+    if operator == "contains":
+        return value
+    if pa.types.is_integer(value_type) or pa.types.is_floating(value_type):
+        return float(value)
+    if pa.types.is_boolean(value_type):
+        return value.strip().lower() in ("true", "1", "yes")
+    return value
+
+
+def _where_clause(schema: pa.Schema, filters: list) -> tuple:
+    """
+    SQL predicate and its parameters for (column, operator, value) filters, all combined with AND
+    """
+    clauses, params = [], []
+    for column, operator, value in filters:
+        if operator not in OPERATORS:
+            raise ValueError(f"Unsupported operator {operator}")
+        field = schema.field(column)
+        expression, value_type = _quote(column), field.type
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            # Pinpoint attributes are lists, compared on their first value like process_df does
+            expression, value_type = f"{expression}[1]", field.type.value_type
+        value = _cast_value(value_type, operator, value)
+        if operator == "in":
+            clauses.append(f"{expression} IN ({', '.join('?' for _ in value)})")
+            params += value
+        elif operator == "contains":
+            clauses.append(f"CAST({expression} AS VARCHAR) ILIKE ?")
+            params.append(f"%{value}%")
+        else:
+            clauses.append(f"{expression} {operator} ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def query_segment(
+    handle: SegmentHandle,
+    filters: list = None,
+    columns: list = None,
+    group_by: list = None,
+    sample_size: int = None,
+    limit: int = None,
+) -> pd.DataFrame:
+    """
+    Filter, project, group or sample a stored segment
+
+    filters are (column, operator, value) triples, group_by returns the number of customers per group,
+    sample_size draws a reproducible sample of the matching customers
+    """
+    dataset = _segment_dataset(handle)
+    where, params = _where_clause(dataset.schema, filters or [])
+
+    if group_by:
+        keys = ", ".join(_quote(column) for column in group_by)
+        sql = f"SELECT {keys}, COUNT(*) AS customers FROM segment{where} GROUP BY {keys} ORDER BY customers DESC"
+    else:
+        projection = ", ".join(_quote(column) for column in columns) if columns else "*"
+        sql = f"SELECT {projection} FROM segment{where}"
+        if sample_size:
+            # sample the filtered rows, not the whole segment
+            sql = f"SELECT * FROM ({sql}) USING SAMPLE reservoir({int(sample_size)} ROWS)"
+            sql += f" REPEATABLE ({SAMPLE_SEED})"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+
+    cursor = get_query_connection().cursor()
+    try:
+        cursor.register("segment", dataset)
+        return table_to_pandas(cursor.execute(sql, params).fetch_arrow_table())
+    finally:
+        cursor.close()
+
+
+def count_segment(handle: SegmentHandle, filters: list = None) -> int:
+    """
+    Number of customers matching the filters
+    """
+    dataset = _segment_dataset(handle)
+    where, params = _where_clause(dataset.schema, filters or [])
+    cursor = get_query_connection().cursor()
+    try:
+        cursor.register("segment", dataset)
+        return cursor.execute(f"SELECT COUNT(*) FROM segment{where}", params).fetchone()[0]
+    finally:
+        cursor.close()
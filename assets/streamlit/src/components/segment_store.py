@@ -0,0 +1,260 @@
+"""
+Server-side store for segment DataFrames shared by all sessions of the Streamlit container
+
+Segments are written once as Arrow IPC files on local disk, named after the hash of their content,
+and read back memory-mapped. Sessions only keep a SegmentHandle in st.session_state, so marketers
+working on the same segment share one file and one in-memory DataFrame. Every live handle holds a
+reference on its segment, released when the session drops the handle. Unreferenced segments are
+evicted least recently used first, from memory above SEGMENT_STORE_MAX_OPEN and from disk above
+SEGMENT_STORE_MAX_BYTES.
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sys
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+LOGGER = logging.Logger("Segment-Store", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+#########################
+#      CONSTANTS
+#########################
+
+SEGMENT_STORE_DIR = os.environ.get("SEGMENT_STORE_DIR", "/tmp/segment-store")
+# Disk budget for segment files, referenced segments are never evicted
+SEGMENT_STORE_MAX_BYTES = int(os.environ.get("SEGMENT_STORE_MAX_BYTES", str(2 * 1024**3)))
+# Unreferenced segments kept open in memory for the next session picking them up
+SEGMENT_STORE_MAX_OPEN = int(os.environ.get("SEGMENT_STORE_MAX_OPEN", "4"))
+SEGMENT_FILE_SUFFIX = ".arrow"
+HASH_CHUNK_SIZE = 8 * 1024**2
+
+
+#########################
+#    HELPER CLASSES
+#########################
+
+
+class SegmentHandle:
+    """
+    Reference to a stored segment, the only thing a session keeps in st.session_state
+    """
+
+    __slots__ = ("key", "name", "num_rows", "__weakref__")
+
+    def __init__(self, key: str, name: str, num_rows: int):
+        self.key = key
+        self.name = name
+        self.num_rows = num_rows
+
+    def __repr__(self):
+        return f"SegmentHandle({self.name!r}, key={self.key[:12]}, rows={self.num_rows})"
+
+
+class SegmentStore:
+    """
+    Content-addressed, reference-counted store of Arrow segment files
+    """
+
+    def __init__(
+        self,
+        directory: str = SEGMENT_STORE_DIR,
+        max_bytes: int = SEGMENT_STORE_MAX_BYTES,
+        max_open: int = SEGMENT_STORE_MAX_OPEN,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_open = max_open
+        self._lock = threading.RLock()
+        self._refcounts = {}
+        # key -> DataFrame, least recently used first
+        self._open = OrderedDict()
+        # key -> file size, least recently used first, seeded from files left by earlier processes
+        self._files = OrderedDict(
+            (path.stem, path.stat().st_size)
+            for path in sorted(self.directory.glob(f"*{SEGMENT_FILE_SUFFIX}"), key=lambda p: p.stat().st_mtime)
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{SEGMENT_FILE_SUFFIX}"
+
+    def put(self, df: pd.DataFrame, name: str) -> SegmentHandle:
+        """
+        Store a segment and return a handle referencing it, identical segments share one file
+        """
+        table = _to_arrow(df)
+        tmp_path = self.directory / f".{uuid.uuid4().hex}.tmp"
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        key = _file_digest(tmp_path)
+
+        with self._lock:
+            if key in self._files:
+                tmp_path.unlink()
+            else:
+                os.replace(tmp_path, self._path(key))
+                self._files[key] = self._path(key).stat().st_size
+                LOGGER.info(f"Stored segment {name} as {key} ({self._files[key]} bytes)")
+            self._files.move_to_end(key)
+            return self._acquire(key, name, table.num_rows)
+
+    def _acquire(self, key: str, name: str, num_rows: int) -> SegmentHandle:
+        handle = SegmentHandle(key=key, name=name, num_rows=num_rows)
+        self._refcounts[key] = self._refcounts.get(key, 0) + 1
+        # the reference is released once the session replaces or drops the handle
+        weakref.finalize(handle, self._release, key)
+        self._evict()
+        return handle
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            self._refcounts[key] -= 1
+            if not self._refcounts[key]:
+                del self._refcounts[key]
+            self._evict()
+
+    def get_dataframe(self, handle: SegmentHandle) -> pd.DataFrame | None:
+        """
+        Segment behind a handle, one DataFrame shared by all sessions. Do not modify it in place
+
+        Returns None when the segment file is gone, e.g. after a container restart
+        """
+        with self._lock:
+            if handle.key in self._open:
+                self._open.move_to_end(handle.key)
+                self._files.move_to_end(handle.key)
+                return self._open[handle.key]
+            if handle.key not in self._files:
+                return None
+            with pa.memory_map(str(self._path(handle.key)), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            df = table_to_pandas(table)
+            self._open[handle.key] = df
+            self._files.move_to_end(handle.key)
+            self._evict()
+            return df
+
+    def path(self, handle: SegmentHandle) -> Path | None:
+        """
+        Arrow file behind a handle, for engines scanning it directly. None when it is gone
+        """
+        with self._lock:
+            if handle.key not in self._files:
+                return None
+            self._files.move_to_end(handle.key)
+            return self._path(handle.key)
+
+    def _evict(self) -> None:
+        with self._lock:
+            for key in [k for k in self._open if k not in self._refcounts][: max(0, len(self._open) - self.max_open)]:
+                del self._open[key]
+
+            total_bytes = sum(self._files.values())
+            for key in list(self._files):
+                if total_bytes <= self.max_bytes:
+                    break
+                if key in self._refcounts:
+                    continue
+                total_bytes -= self._files.pop(key)
+                self._open.pop(key, None)
+                self._path(key).unlink(missing_ok=True)
+                LOGGER.info(f"Evicted segment {key}")
+
+    def stats(self) -> dict:
+        """
+        Current usage of the store
+        """
+        with self._lock:
+            return {
+                "segments": len(self._files),
+                "bytes": sum(self._files.values()),
+                "open": len(self._open),
+                "referenced": len(self._refcounts),
+            }
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    """
+    Arrow table of a segment, columns mixing value types are stored as strings
+    """
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for col in df.columns:
+            try:
+                pa.array(df[col])
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[col] = df[col].map(lambda v: v if v is None else str(v))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def table_to_pandas(table: pa.Table) -> pd.DataFrame:
+    """
+    DataFrame of a segment, list columns come back as python lists like the JSON exports they came from
+    """
+    df = table.to_pandas()
+    for field in table.schema:
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            df[field.name] = table.column(field.name).to_pylist()
+    return df
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def get_segment_store() -> SegmentStore:
+    """
+    Process-wide segment store
+    """
+    return SegmentStore()
+
+
+def save_segment(df: pd.DataFrame, name: str) -> None:
+    """
+    Store a segment and make it the current segment of this session
+    """
+    st.session_state["segment_handle"] = get_segment_store().put(df, name=name)
+    st.session_state["df_name"] = name
+    # a refinement of the previous segment no longer applies
+    st.session_state.pop("base_segment_handle", None)
+
+
+def load_segment() -> pd.DataFrame | None:
+    """
+    Current segment of this session, None if none was chosen or it is no longer stored
+    """
+    handle = st.session_state.get("segment_handle")
+    if handle is None:
+        return None
+    return get_segment_store().get_dataframe(handle)
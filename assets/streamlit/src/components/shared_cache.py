@@ -0,0 +1,139 @@
+"""
+File cache shared by all Streamlit tasks of the service, for session-independent data
+
+st.cache_data only lives in its process, so every ECS task added by autoscaling would read the same
+catalogs from S3 and call the same API routes again. Functions decorated with shared_cache keep their
+pickled results in SHARED_CACHE_DIR, an EFS mount common to all tasks, for ttl seconds. A file lock
+per entry makes one task compute an expired entry while the others wait for it instead of all
+computing it at once. Stack st.cache_data on top to keep a per-process copy in memory:
+
+    @st.cache_data(ttl=CATALOG_TTL, show_spinner=False)
+    @shared_cache(ttl=CATALOG_TTL)
+    def load_product_catalog():
+        ...
+
+Without SHARED_CACHE_DIR (single task, local runs) the decorated functions are called as they are.
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import fcntl
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import time
+import uuid
+from pathlib import Path
+
+LOGGER = logging.Logger("Shared-Cache", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+#########################
+#      CONSTANTS
+#########################
+
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR")
+ENTRY_SUFFIX = ".pkl"
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+def _entry_key(args: tuple, kwargs: dict) -> str:
+    """
+    Hash of the call arguments, arguments starting with an underscore are left out like in st.cache_data
+    """
+    kwargs = {name: value for name, value in sorted(kwargs.items()) if not name.startswith("_")}
+    return hashlib.sha256(repr((args, kwargs)).encode()).hexdigest()
+
+
+def _read_fresh(path: Path, ttl: float):
+    """
+    (True, value) of an entry younger than ttl, (False, None) when it is missing or expired
+    """
+    try:
+        if time.time() - path.stat().st_mtime >= ttl:
+            return False, None
+        with open(path, "rb") as f:
+            return True, pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return False, None
+
+
+def _write(path: Path, value) -> None:
+    # readers never see a partial entry, other tasks included
+    tmp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def _prune(directory: Path, ttl: float) -> None:
+    """
+    Delete the expired entries of one function, they all share its ttl
+    """
+    now = time.time()
+    for path in directory.glob(f"*{ENTRY_SUFFIX}"):
+        try:
+            if now - path.stat().st_mtime >= ttl:
+                path.unlink()
+                path.with_suffix(".lock").unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+
+
+def shared_cache(ttl: float):
+    """
+    Cache the results of a function for ttl seconds in the directory shared by all tasks
+    """
+
+    def decorator(func):
+        if not SHARED_CACHE_DIR:
+            return func
+
+        # page scripts all run as __main__, their file name tells their functions apart
+        directory = Path(SHARED_CACHE_DIR) / f"{Path(func.__code__.co_filename).stem}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            path = directory / f"{_entry_key(args, kwargs)}{ENTRY_SUFFIX}"
+            calling = False
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                found, value = _read_fresh(path, ttl)
+                if found:
+                    return value
+                with open(path.with_suffix(".lock"), "a") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    # another task may have filled the entry while this one waited for the lock
+                    found, value = _read_fresh(path, ttl)
+                    if found:
+                        return value
+                    calling = True
+                    value = func(*args, **kwargs)
+                    calling = False
+                    _write(path, value)
+                    LOGGER.debug(f"Stored {func.__qualname__} in the shared cache")
+                _prune(directory, ttl)
+                return value
+            except OSError as e:
+                if calling:
+                    raise
+                # an unavailable file system slows the page down, it does not break it
+                LOGGER.warning(f"Shared cache unavailable for {func.__qualname__}: {e}")
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
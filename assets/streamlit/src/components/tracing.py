@@ -0,0 +1,135 @@
+"""
+Client side of the distributed traces, propagated to the API with W3C traceparent headers
+
+Page runs, fragments and API calls open spans. Every API call sends the traceparent of its span, so
+the Lambda spans join the same trace, and reads back the X-Trace-Id and Server-Timing headers to split
+its latency between the Lambda handler and API Gateway plus the network. Finished spans are logged and
+kept in RECENT_SPANS for inspection.
+"""
+
+#########################
+#    IMPORTS & LOGGER
+#########################
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import secrets
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+
+LOGGER = logging.Logger("Tracing", level=logging.DEBUG)
+HANDLER = logging.StreamHandler(sys.stdout)
+HANDLER.setFormatter(logging.Formatter("%(levelname)s | %(name)s | %(message)s"))
+LOGGER.addHandler(HANDLER)
+
+#########################
+#      CONSTANTS
+#########################
+
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "X-Trace-Id"
+# Finished spans of this process, newest last
+RECENT_SPANS = deque(maxlen=500)
+
+_CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)
+
+
+#########################
+#    HELPER CLASSES
+#########################
+
+
+class Span:
+    """
+    Timed operation within a trace
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "duration_ms", "status")
+
+    def __init__(self, name: str, parent: Span | None = None, attributes: dict = None):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.status = "OK"
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "name": self.name,
+            "durationMs": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+#########################
+#    HELPER FUNCTIONS
+#########################
+
+
+def current_span() -> Span | None:
+    return _CURRENT_SPAN.get()
+
+
+def set_current_span(span: Span | None) -> None:
+    """
+    Make a span the parent of the spans opened in this context, e.g. on the async API event loop
+    """
+    _CURRENT_SPAN.set(span)
+
+
+@contextmanager
+def start_span(name: str, **attributes):
+    """
+    Child span of the current span, or the root of a new trace
+    """
+    span = Span(name, parent=current_span(), attributes=attributes)
+    token = _CURRENT_SPAN.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.status = "ERROR"
+        span.attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        span.duration_ms = round(span.elapsed_ms(), 2)
+        RECENT_SPANS.append(span)
+        LOGGER.debug(f"trace {span.trace_id} | {span.name} took {span.duration_ms} ms {span.attributes}")
+
+
+def record_response(span: Span, status: int, headers) -> None:
+    """
+    Attach the API response to its span: status, server trace id and Lambda versus gateway time
+    """
+    span.attributes["http.status_code"] = status
+    span.attributes["server.trace_id"] = headers.get(TRACE_ID_HEADER)
+    for metric in (headers.get("Server-Timing") or "").split(","):
+        name, _, duration = metric.strip().partition(";dur=")
+        if name == "lambda" and duration:
+            lambda_ms = float(duration)
+            span.attributes["lambda_ms"] = lambda_ms
+            span.attributes["gateway_ms"] = round(span.elapsed_ms() - lambda_ms, 2)
+
+
+def get_finished_spans(trace_id: str = None) -> list:
+    """
+    Recent finished spans, of one trace when trace_id is given
+    """
+    return [span for span in RECENT_SPANS if trace_id is None or span.trace_id == trace_id]
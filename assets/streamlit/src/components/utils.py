@@ -2,8 +2,14 @@
 Helper functions with StreamLit UI utils
 """
 
+import logging
+import time
+from contextlib import contextmanager
+
 import streamlit as st
 
+from components.tracing import start_span
+
 
 def reset_session_state(page_name: str) -> None:
     """
@@ -17,12 +23,14 @@ def reset_session_state(page_name: str) -> None:
             if key not in [
                 "authenticated",
                 "access_token",
-                "df",
+                "segment_handle",
+                "base_segment_handle",
                 "df_name",
                 "prompter_text",
                 "button_clicked",
                 "df_personalize_jobs",
                 "job_name",
+                "max_shards",
                 "item_data",
                 "prompt",
             ]:
@@ -31,6 +39,21 @@ def reset_session_state(page_name: str) -> None:
     st.session_state["last_page"] = page_name
 
 
+@contextmanager
+def log_duration(logger: logging.Logger, label: str):
+    """
+    Log how long a page run or fragment run took, to compare per-click latency
+
+    The run is also a span, the parent of the spans of the API calls made during it
+    """
+    start = time.perf_counter()
+    try:
+        with start_span(label):
+            yield
+    finally:
+        logger.log(logging.DEBUG, f"{label} took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
 def button_with_url(
     url: str,
     text: str,
@@ -0,0 +1,81 @@
+"""
+Latency of per-call requests.get/post versus the shared keep-alive session of the Streamlit API clients
+
+Runs against a local HTTP/1.1 stub standing in for API Gateway. Against the real endpoint the
+gap is larger, since each new connection there also pays the TLS handshake.
+
+Usage: python benchmarks/api_session.py [--calls 500]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+sys.path.append(str(Path(__file__).parent.parent / "assets" / "streamlit" / "src"))
+
+RESPONSE = b'[{"Id": "segment", "Name": "demo"}]'
+
+
+class ApiStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(call, calls):
+    call()
+    durations = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return statistics.mean(durations), durations[int(len(durations) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ApiStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["API_URI"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    from components.api_session import invoke_api
+
+    def per_call_request():
+        return requests.get(
+            url=os.environ["API_URI"] + "/pinpoint/segment", stream=False, headers={"Authorization": "token"}
+        ).content
+
+    def shared_session():
+        return invoke_api(method="GET", route="/pinpoint/segment", access_token="token").content
+
+    print(f"{'client':<24}{'mean ms':>10}{'p95 ms':>10}")
+    for name, call in [("requests.get per call", per_call_request), ("shared session", shared_session)]:
+        mean, p95 = measure(call, args.calls)
+        print(f"{name:<24}{mean:>10.2f}{p95:>10.2f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
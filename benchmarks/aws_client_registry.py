@@ -0,0 +1,94 @@
+"""
+Warm-invocation latency of a handler building its boto3 client per call versus using the AwsHelper registry
+
+A local HTTP stub stands in for S3, so the numbers only contain client construction, endpoint resolution
+and connection setup, which is exactly what the registry removes from warm invocations.
+
+Usage: python benchmarks/aws_client_registry.py [--invocations 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "assets" / "layers" / "utilities" / "python"))
+# spans of the registry calls are not printed, they would be timed with the handler
+os.environ.setdefault("TRACE_EXPORTER", "none")
+
+import boto3  # noqa: E402
+from aws_helper import AwsHelper  # noqa: E402
+
+LIST_OBJECTS_RESPONSE = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+    b"<Name>bench</Name><Prefix></Prefix><KeyCount>0</KeyCount><MaxKeys>1000</MaxKeys>"
+    b"<IsTruncated>false</IsTruncated></ListBucketResult>"
+)
+
+
+class S3Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # reused keep-alive connections would otherwise wait on delayed ACKs, ~40 ms per call
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(LIST_OBJECTS_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(LIST_OBJECTS_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def handler_fresh_client(endpoint_url):
+    s3 = boto3.client("s3", endpoint_url=endpoint_url, region_name="us-east-1")
+    return s3.list_objects_v2(Bucket="bench")
+
+
+def handler_registry_client(endpoint_url):
+    s3 = AwsHelper().get_client("s3", awsRegion="us-east-1", endpoint_url=endpoint_url)
+    return s3.list_objects_v2(Bucket="bench")
+
+
+def measure(handler, endpoint_url, invocations):
+    # first call is the cold invocation, excluded from the warm statistics
+    handler(endpoint_url)
+    durations = []
+    for _ in range(invocations):
+        start = time.perf_counter()
+        handler(endpoint_url)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return statistics.mean(durations), durations[int(len(durations) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--invocations", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), S3Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{'handler':<28}{'mean ms':>10}{'p95 ms':>10}")
+    handlers = [("boto3.client per call", handler_fresh_client), ("AwsHelper registry", handler_registry_client)]
+    for name, handler in handlers:
+        mean, p95 = measure(handler, endpoint_url, args.invocations)
+        print(f"{name:<28}{mean:>10.2f}{p95:>10.2f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Per-click latency of the Content Generator customer navigation, measured with streamlit's AppTest
+
+The clicks first move forward through the customers of a synthetic Pinpoint segment, then back over
+the customers already seen, where generated content can be reused. The S3 demo data and the Bedrock
+generation are replaced by in-process stand-ins, generation sleeps --generation-ms, so the numbers are
+the page's own work plus the generations it makes per click. --page measures another version of the
+page, e.g. one written out with git show <revision>:assets/streamlit/src/app_pages/03_Content_Generator.py
+
+AppTest reruns the whole script on a click, it does not scope reruns to st.fragment, so the numbers
+of the fragmented page are an upper bound of its per-click latency in the app server.
+
+Usage: python benchmarks/content_generator_clicks.py [--customers 200] [--clicks 20] [--generation-ms 0] [--page path]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import types
+from pathlib import Path
+
+STREAMLIT_DIR = Path(__file__).parent.parent / "assets" / "streamlit"
+sys.path.append(str(STREAMLIT_DIR / "src"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("BUCKET_NAME", "benchmark")
+
+import fsspec  # noqa: E402
+import pandas as pd  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import components.resources as resources  # noqa: E402
+from components.segment_store import get_segment_store  # noqa: E402
+
+PRODUCTS = ["checking", "savings", "travel-card"]
+
+
+def install_generation_stand_in(generation_ms):
+    """
+    langchain modules whose chain sleeps like a Bedrock call and returns an SMS in the expected format
+    """
+
+    class PromptTemplate:
+        def __init__(self, input_variables, template):
+            self.template = template
+
+        def format(self, **kwargs):
+            return self.template
+
+    class Bedrock:
+        def __init__(self, **kwargs):
+            pass
+
+    class LLMChain:
+        def __init__(self, llm, prompt):
+            pass
+
+        def run(self, name, **kwargs):
+            time.sleep(generation_ms / 1000)
+            return f"###TEXTBODY### Hi {name}, your offer is waiting. ###END###"
+
+    modules = {name: types.ModuleType(name) for name in ["langchain", "langchain.chains", "langchain.llms"]}
+    modules["langchain.llms.bedrock"] = types.ModuleType("langchain.llms.bedrock")
+    modules["langchain"].PromptTemplate = PromptTemplate
+    modules["langchain.chains"].LLMChain = LLMChain
+    modules["langchain.llms.bedrock"].Bedrock = Bedrock
+    sys.modules.update(modules)
+
+
+def install_demo_data():
+    """
+    Demo catalogs in an in-memory filesystem, handed to the page in place of s3fs
+    """
+    fs = fsspec.filesystem("memory")
+    bucket = os.environ["BUCKET_NAME"]
+    products = [
+        {
+            "id": product,
+            "Name": product.title(),
+            "Title": f"The {product} for you",
+            "Description": f"A {product} product",
+            "Key Features": ["No fees", "Mobile app"],
+            "Great For": ["Everyday banking"],
+        }
+        for product in PRODUCTS
+    ]
+    fs.pipe(f"s3://{bucket}/demo-data/products.json", json.dumps({"products": products}).encode())
+    items = pd.DataFrame({"itemId": PRODUCTS, "Name": [product.title() for product in PRODUCTS]})
+    fs.pipe(f"s3://{bucket}/demo-data/df_item_banking.csv", items.to_csv(index=False).encode())
+    resources.get_filesystem = lambda: fs
+
+
+def store_segment(customers):
+    segment = pd.DataFrame(
+        {
+            "User.UserAttributes.FirstName": [f"Customer{i}" for i in range(customers)],
+            "User.UserAttributes.LastName": ["Smith"] * customers,
+            "User.UserAttributes.Age": [20 + i % 50 for i in range(customers)],
+            "User.UserAttributes.PreferredLanguage": ["en"] * customers,
+            "User.UserAttributes.Product": [PRODUCTS[i % len(PRODUCTS)] for i in range(customers)],
+            "User.UserAttributes.Probability": [1 - i / customers for i in range(customers)],
+            "ChannelType": ["SMS"] * customers,
+            "Address": [f"+1555000{i:04d}" for i in range(customers)],
+        }
+    )
+    return get_segment_store().put(segment, name="benchmark")
+
+
+def measure_clicks(page, handle, clicks):
+    app = AppTest.from_file(str(page), default_timeout=120)
+    app.session_state["authenticated"] = True
+    app.session_state["segment_handle"] = handle
+    app.session_state["df_name"] = handle.name
+    app.session_state["prompt"] = "Write a short SMS promoting the product."
+
+    start = time.perf_counter()
+    app.run()
+    first_run = (time.perf_counter() - start) * 1000
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    def click(key):
+        start = time.perf_counter()
+        app.button(key=key).click().run()
+        duration = (time.perf_counter() - start) * 1000
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        return duration
+
+    forward = [click("next_customer") for _ in range(clicks)]
+    back = [click("prev_customer") for _ in range(clicks)]
+    return first_run, percentiles(forward), percentiles(back)
+
+
+def percentiles(durations):
+    durations = sorted(durations)
+    return statistics.median(durations), durations[int(len(durations) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--clicks", type=int, default=20)
+    parser.add_argument("--generation-ms", type=float, default=0)
+    parser.add_argument("--page", type=Path, default=STREAMLIT_DIR / "src" / "app_pages" / "03_Content_Generator.py")
+    args = parser.parse_args()
+    page = args.page.resolve()
+
+    # show_pages_from_config reads .streamlit/pages.toml relative to the working directory
+    os.chdir(STREAMLIT_DIR)
+    install_generation_stand_in(args.generation_ms)
+    install_demo_data()
+    handle = store_segment(args.customers)
+
+    first_run, forward, back = measure_clicks(page, handle, args.clicks)
+    print(
+        f"{'page':<30}{'first run ms':>14}{'next p50 ms':>14}{'next p95 ms':>14}{'back p50 ms':>14}{'back p95 ms':>14}"
+    )
+    print(f"{page.name:<30}{first_run:>14.1f}{forward[0]:>14.1f}{forward[1]:>14.1f}{back[0]:>14.1f}{back[1]:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Cold-start frequency and latency of the deployed API functions, per_route layout versus the consolidated router
+
+Reads the REPORT lines of the functions' CloudWatch log groups with Logs Insights. Deploy with
+lambda.deployment_mode: per_route, drive the portal, redeploy with consolidated and drive it the same way,
+then run this script over a window covering both runs. Log groups that do not exist are skipped.
+
+Usage: python benchmarks/lambda_cold_starts.py --stack-name genai-marketer [--hours 24] [--region us-east-1]
+"""
+
+import argparse
+import time
+
+import boto3
+
+PER_ROUTE_FUNCTIONS = [
+    "bedrock-content-generation-lambda",
+    "pinpoint-segment",
+    "pinpoint-job",
+    "pinpoint-message",
+    "s3-fetch",
+    "personalize-batch-segment-job",
+    "personalize-batch-segment-jobs",
+    "personalize-recommendations",
+]
+CONSOLIDATED_FUNCTIONS = ["api-router"]
+
+REPORT_QUERY = """
+filter @type = "REPORT"
+| stats count(*) as invocations,
+        count(@initDuration) as coldStarts,
+        pct(@duration, 50) as p50,
+        pct(@duration, 95) as p95,
+        pct(@duration + coalesce(@initDuration, 0), 95) as p95WithInit,
+        avg(@initDuration) as avgInit
+"""
+
+
+def run_query(logs, log_groups, start_time, end_time):
+    query_id = logs.start_query(
+        logGroupNames=log_groups, startTime=start_time, endTime=end_time, queryString=REPORT_QUERY
+    )["queryId"]
+    while True:
+        response = logs.get_query_results(queryId=query_id)
+        if response["status"] in ("Complete", "Failed", "Cancelled", "Timeout"):
+            break
+        time.sleep(1)
+    if not response["results"]:
+        return None
+    return {field["field"]: float(field["value"]) for field in response["results"][0] if field.get("value")}
+
+
+def existing_log_groups(logs, stack_name, functions):
+    groups = []
+    for function in functions:
+        name = f"/aws/lambda/{stack_name}-{function}"
+        if logs.describe_log_groups(logGroupNamePrefix=name).get("logGroups"):
+            groups.append(name)
+    return groups
+
+
+def print_row(label, stats):
+    if not stats or not stats.get("invocations"):
+        print(f"{label:<45} no invocations")
+        return
+    cold_rate = stats.get("coldStarts", 0) / stats["invocations"] * 100
+    print(
+        f"{label:<45} {int(stats['invocations']):>8} {int(stats.get('coldStarts', 0)):>6} {cold_rate:>6.1f}% "
+        f"{stats.get('p50', 0):>9.1f} {stats.get('p95', 0):>9.1f} {stats.get('p95WithInit', 0):>11.1f} "
+        f"{stats.get('avgInit', 0):>9.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stack-name", required=True)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--region", default=None)
+    args = parser.parse_args()
+
+    logs = boto3.client("logs", region_name=args.region)
+    end_time = int(time.time())
+    start_time = end_time - int(args.hours * 3600)
+
+    print(
+        f"{'function':<45} {'invokes':>8} {'cold':>6} {'cold%':>7} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p95+init ms':>11} {'init ms':>9}"
+    )
+    for layout, functions in (("per_route", PER_ROUTE_FUNCTIONS), ("consolidated", CONSOLIDATED_FUNCTIONS)):
+        log_groups = existing_log_groups(logs, args.stack_name, functions)
+        if not log_groups:
+            print(f"{layout}: no log groups found")
+            continue
+        for log_group in log_groups:
+            print_row(log_group.rsplit("/", 1)[1], run_query(logs, [log_group], start_time, end_time))
+        print_row(f"== {layout} total", run_query(logs, log_groups, start_time, end_time))
+
+
+if __name__ == "__main__":
+    main()
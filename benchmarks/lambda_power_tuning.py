@@ -0,0 +1,173 @@
+"""
+Power tuning of the API Lambda handlers: modeled duration and cost per memory size and architecture
+
+Replays the recorded events in benchmarks/events against the real handlers. AWS calls are answered by
+local stand-ins returning the recorded responses after their recorded latency, hooked into the
+AwsHelper clients the same way botocore's Stubber is, so client and handler code run unchanged.
+
+Every invocation is split into CPU time and waiting time. Lambda allocates CPU in proportion to memory,
+one full vCPU at 1769 MB, so the CPU part is scaled by 1769 / memory below that point and by the
+architecture's relative CPU speed (--arm-cpu-factor, measure it once on a Graviton function), while the
+waiting part is kept as is. The handlers are single threaded, so memory above 1769 MB does not speed them up.
+Costs use the published on-demand prices per GB-second and per request, the recommendation is the
+cheapest setting whose p95 stays within --max-slowdown of the fastest one.
+
+Usage: python benchmarks/lambda_power_tuning.py [--invocations 50] [--memory 128 256 512 1024 1769 3008]
+                                               [--events benchmarks/events] [--arm-cpu-factor 1.0]
+
+Event files: {"function": profile name, "handler": path under assets/lambda, "environment": {...},
+"event": API Gateway v2 event, "calls": {"<service>.<Operation>": {"response": {...}, "latencyMs": 20}}}
+"""
+
+import argparse
+import copy
+import importlib.util
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT / "assets" / "layers" / "utilities" / "python"))
+# spans of the replayed invocations are not printed, they would be timed with the handlers
+os.environ.setdefault("TRACE_EXPORTER", "none")
+
+from aws_helper import AwsHelper  # noqa: E402
+
+# Memory giving one full vCPU
+FULL_VCPU_MEMORY = 1769
+# On-demand prices, us-east-1
+PRICE_PER_GB_SECOND = {"X86_64": 0.0000166667, "ARM_64": 0.0000133334}
+PRICE_PER_REQUEST = 0.20 / 1_000_000
+
+# Recorded calls of the event being replayed, registry clients outlive a single recording
+RECORDED_CALLS = {}
+
+
+class RecordedResponse:
+    """
+    HTTP response handed back to botocore together with the parsed recorded response
+    """
+
+    status_code = 200
+    headers = {}
+    content = b""
+
+
+def install_stand_ins():
+    """
+    Answer every AWS call of AwsHelper clients from RECORDED_CALLS
+    """
+    original_get_client = AwsHelper.get_client
+    stubbed = set()
+
+    def answer(model, **kwargs):
+        recorded = RECORDED_CALLS.get(f"{model.service_model.service_name}.{model.name}")
+        if recorded is None:
+            raise KeyError(f"No recorded response for {model.service_model.service_name}.{model.name}")
+        time.sleep(recorded.get("latencyMs", 0) / 1000)
+        return RecordedResponse(), copy.deepcopy(recorded["response"])
+
+    def get_client(self, name, *args, **kwargs):
+        client = original_get_client(self, name, *args, **kwargs)
+        if id(client) not in stubbed:
+            client.meta.events.register_first("before-call", answer)
+            stubbed.add(id(client))
+        return client
+
+    AwsHelper.get_client = get_client
+
+
+def load_handler(recording):
+    """
+    Import the handler module of a recording with its environment, returns the handler and the init time
+    """
+    os.environ.update(recording.get("environment", {}))
+    path = ROOT / "assets" / "lambda" / recording["handler"]
+    spec = importlib.util.spec_from_file_location(f"tuned_{recording['function']}", path)
+    module = importlib.util.module_from_spec(spec)
+    start = time.perf_counter()
+    spec.loader.exec_module(module)
+    return module.lambda_handler, (time.perf_counter() - start) * 1000
+
+
+def replay(handler, event, invocations):
+    """
+    CPU and waiting milliseconds of each warm invocation
+    """
+    handler(copy.deepcopy(event), None)
+    samples = []
+    for _ in range(invocations):
+        request = copy.deepcopy(event)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        response = handler(request, None)
+        cpu_ms = (time.thread_time() - cpu_start) * 1000
+        wall_ms = (time.perf_counter() - wall_start) * 1000
+        if response.get("statusCode", 200) >= 400:
+            raise RuntimeError(f"Handler returned {response['statusCode']}: {response.get('body')}")
+        samples.append((cpu_ms, max(0.0, wall_ms - cpu_ms)))
+    return samples
+
+
+def model(samples, memory, architecture, arm_cpu_factor):
+    """
+    Modeled p95 and mean duration in ms and cost per 1M invocations at a memory size and architecture
+    """
+    cpu_scale = max(1.0, FULL_VCPU_MEMORY / memory) * (arm_cpu_factor if architecture == "ARM_64" else 1.0)
+    durations = sorted(cpu_ms * cpu_scale + wait_ms for cpu_ms, wait_ms in samples)
+    p95 = durations[max(0, math.ceil(len(durations) * 0.95) - 1)]
+    billed_seconds = statistics.mean(math.ceil(duration) for duration in durations) / 1000
+    cost = 1_000_000 * (billed_seconds * memory / 1024 * PRICE_PER_GB_SECOND[architecture] + PRICE_PER_REQUEST)
+    return p95, statistics.mean(durations), cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--invocations", type=int, default=50)
+    parser.add_argument("--memory", type=int, nargs="+", default=[128, 256, 512, 1024, 1769, 3008])
+    parser.add_argument("--architectures", nargs="+", default=["X86_64", "ARM_64"])
+    parser.add_argument("--events", type=Path, default=Path(__file__).parent / "events")
+    parser.add_argument("--arm-cpu-factor", type=float, default=1.0, help="ARM_64 CPU time relative to X86_64")
+    parser.add_argument("--max-slowdown", type=float, default=1.1, help="p95 allowed relative to the fastest")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    install_stand_ins()
+    for event_file in sorted(args.events.glob("*.json")):
+        recording = json.loads(event_file.read_text())
+        RECORDED_CALLS.clear()
+        RECORDED_CALLS.update(recording.get("calls", {}))
+        handler, init_ms = load_handler(recording)
+        samples = replay(handler, recording["event"], args.invocations)
+
+        results = [
+            (memory, architecture, *model(samples, memory, architecture, args.arm_cpu_factor))
+            for architecture in args.architectures
+            for memory in args.memory
+        ]
+        fastest = min(p95 for _, _, p95, _, _ in results)
+        recommended = min(
+            (result for result in results if result[2] <= fastest * args.max_slowdown),
+            key=lambda result: (result[4], result[2]),
+        )
+
+        print(f"\n{recording['function']} ({event_file.name}), local init {init_ms:.1f} ms")
+        print(f"{'memory MB':>10} {'arch':>7} {'p95 ms':>9} {'mean ms':>9} {'$ per 1M':>10}")
+        for result in results:
+            marker = "  <- recommended" if result is recommended else ""
+            memory, architecture, p95, mean, cost = result
+            print(f"{memory:>10} {architecture:>7} {p95:>9.2f} {mean:>9.2f} {cost:>10.2f}{marker}")
+        print(
+            f"config.yml: {recording['function']}: "
+            f"{{memory_size: {recommended[0]}, architecture: {recommended[1]}}}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+First-run and rerun latency of each Streamlit page, measured with streamlit's AppTest
+
+The first run of a page pays its imports and the construction of the process-wide resources
+(components/resources.py), reruns should only pay for the page script itself. Pages run
+in-process, like in the app server, so imports and cached resources carry over between pages.
+
+Pages 01 to 03 read demo data from S3 and call the API on load, run with BUCKET_NAME, API_URI
+and AWS credentials of a deployed stack to measure them end to end; failing pages are reported.
+
+Usage: python benchmarks/streamlit_rerun.py [--reruns 20] [--pages 00_Prompt_Iterator.py ...]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+STREAMLIT_DIR = Path(__file__).parent.parent / "assets" / "streamlit"
+sys.path.append(str(STREAMLIT_DIR / "src"))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+
+def run_page(page, reruns):
+    app = AppTest.from_file(str(STREAMLIT_DIR / "src" / "app_pages" / page), default_timeout=120)
+    # authenticate.set_st_state_vars only verifies tokens that are set
+    app.session_state["authenticated"] = True
+
+    start = time.perf_counter()
+    app.run()
+    first_run = (time.perf_counter() - start) * 1000
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    durations = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return first_run, statistics.median(durations), durations[int(len(durations) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument(
+        "--pages", nargs="+", default=sorted(p.name for p in (STREAMLIT_DIR / "src" / "app_pages").glob("*.py"))
+    )
+    args = parser.parse_args()
+
+    # show_pages_from_config reads .streamlit/pages.toml relative to the working directory
+    os.chdir(STREAMLIT_DIR)
+
+    print(f"{'page':<30}{'first run ms':>14}{'rerun p50 ms':>14}{'rerun p95 ms':>14}")
+    for page in args.pages:
+        try:
+            first_run, p50, p95 = run_page(page, args.reruns)
+        except Exception as e:
+            print(f"{page:<30}  failed: {e}")
+            continue
+        print(f"{page:<30}{first_run:>14.1f}{p50:>14.1f}{p95:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
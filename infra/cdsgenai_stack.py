@@ -113,10 +113,16 @@ class CDSGenAIStack(Stack):
             pinpoint_export_role_arn=self.pinpoint_constructs.pinpoint_role_ARN,
             architecture=config["lambda"]["architecture"],
             python_runtime=config["lambda"]["python_runtime"],
+            aws_sdk_pandas_layer_version=config["lambda"]["aws_sdk_pandas_layer_version"],
             email_identity=config["pinpoint"]["email_identity"],
             sms_identity=config["pinpoint"]["sms_identity"],
             personalize_role_arn=self.personalize_constructs.personalize_role_ARN,
             personalize_solution_version_arn=config["personalize"]["personalize_solution_version_arn"],
+            personalize_campaign_arn=config["personalize"].get("personalize_campaign_arn", "None"),
+            pinpoint_export_reuse_window=config["pinpoint"].get("export_reuse_window", 3600),
+            deployment_mode=config["lambda"].get("deployment_mode", "per_route"),
+            function_profiles=config["lambda"].get("function_profiles"),
+            provisioned_concurrency=config["lambda"].get("provisioned_concurrency"),
         )
 
         output(
@@ -137,6 +143,9 @@ class CDSGenAIStack(Stack):
                 api_uri=self.api_constructs.api_uri,
                 ecs_cpu=config["streamlit"]["ecs_cpu"],
                 ecs_memory=config["streamlit"]["ecs_memory"],
+                autoscaling=config["streamlit"].get("autoscaling"),
+                stickiness_duration=config["streamlit"].get("stickiness_duration", 86400),
+                shared_cache=config["streamlit"].get("shared_cache", False),
                 cover_image_url=config["streamlit"]["cover_image_url"],
                 s3_data_bucket=self.s3_data_bucket,
                 cover_image_login_url=config["streamlit"]["cover_image_login_url"],
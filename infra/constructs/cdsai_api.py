@@ -7,10 +7,12 @@ import aws_cdk.aws_apigatewayv2_alpha as _apigw
 import aws_cdk.aws_apigatewayv2_integrations_alpha as _integrations
 import aws_cdk.aws_apigatewayv2 as _apigwv2
 from aws_cdk import Duration, RemovalPolicy
+from aws_cdk import aws_applicationautoscaling as appscaling
 from aws_cdk import aws_cognito as cognito
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as _lambda
 from aws_cdk import aws_s3 as _s3
+from aws_cdk import aws_s3_notifications as _s3n
 from aws_cdk import Aws
 from aws_cdk import aws_logs as logs
 from aws_cdk.aws_apigatewayv2_authorizers_alpha import HttpUserPoolAuthorizer
@@ -22,6 +24,9 @@ FEEDBACK_TIMEOUT = 900
 PINPOINT_TIMEOUT = 900
 S3_TIMEOUT = 900
 
+# AWS managed layer (AWS SDK for pandas) providing pandas and pyarrow
+AWS_SDK_PANDAS_LAYER_ACCOUNT = "336392948345"
+
 DIRNAME = os.path.dirname(__file__)
 
 
@@ -41,7 +46,13 @@ class CDSAIAPIConstructs(Construct):
         sms_identity: str,
         personalize_role_arn: str,
         personalize_solution_version_arn: str,
+        aws_sdk_pandas_layer_version: int,
+        personalize_campaign_arn: str = "None",
         bedrock_role_arn: str = None,
+        pinpoint_export_reuse_window: int = 3600,
+        deployment_mode: str = "per_route",
+        function_profiles: dict = None,
+        provisioned_concurrency: dict = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -51,18 +62,20 @@ class CDSAIAPIConstructs(Construct):
         self.bedrock_role_arn = bedrock_role_arn
         self.pinpoint_project_id = pinpoint_project_id
         self.pinpoint_export_role_arn = pinpoint_export_role_arn
+        self.pinpoint_export_reuse_window = pinpoint_export_reuse_window
         self.email_identity = email_identity
         self.sms_identity = sms_identity
         self.personalize_role_arn = personalize_role_arn
         self.personalize_solution_version_arn = personalize_solution_version_arn
+        self.aws_sdk_pandas_layer_version = aws_sdk_pandas_layer_version
+        self.personalize_campaign_arn = personalize_campaign_arn
+        self.python_runtime = python_runtime
+        self.deployment_mode = deployment_mode
+        self.function_profiles = function_profiles or {}
+        self.provisioned_concurrency = provisioned_concurrency or {}
 
         ## **************** Set Architecture and Python Runtime ****************
-        if architecture == "ARM_64":
-            self._architecture = _lambda.Architecture.ARM_64
-        elif architecture == "X86_64":
-            self._architecture = _lambda.Architecture.X86_64
-        else:
-            raise RuntimeError("Select one option for system architecture among [ARM_64, X86_64]")
+        self._architecture = self.to_architecture(architecture)
 
         if python_runtime == "PYTHON_3_10":
             self._runtime = _lambda.Runtime.PYTHON_3_10
@@ -73,11 +86,21 @@ class CDSAIAPIConstructs(Construct):
         else:
             raise RuntimeError("Select a Python version >= PYTHON_3_9")
 
+        if deployment_mode not in ("per_route", "consolidated"):
+            raise RuntimeError("Select one option for Lambda deployment mode among [per_route, consolidated]")
+
         ## **************** Create resources ****************
 
         self.create_lambda_layers(stack_name)
         self.create_roles(stack_name)
-        self.create_lambda_functions(stack_name)
+        # Function name -> Warm alias, the target of the API routes
+        self.warm_aliases = {}
+        if deployment_mode == "consolidated":
+            self.create_router_function(stack_name)
+        else:
+            self.create_lambda_functions(stack_name)
+        self.create_segment_snapshot_function(stack_name)
+        self.configure_provisioned_concurrency()
 
         self.prefix = stack_name[:16]
 
@@ -111,73 +134,39 @@ class CDSAIAPIConstructs(Construct):
             format="$context.requestId",
         )
 
-        # add content/bedrock to POST /
-        http_api.add_routes(
-            path="/content/bedrock",
-            methods=[_apigw.HttpMethod.POST],
-            integration=_integrations.HttpLambdaIntegration(
-                "LambdaProxyIntegration", handler=self.bedrock_content_generation_lambda
-            ),
-        )
-
-        # add Pinpoint segment to GET
-        http_api.add_routes(
-            path="/pinpoint/segment",
-            methods=[_apigw.HttpMethod.GET],
-            integration=_integrations.HttpLambdaIntegration(
-                "LambdaProxyIntegration", handler=self.pinpoint_segment_lambda
-            ),
-        )
-
-        # add Pinpoint job to GET / POST
-        http_api.add_routes(
-            path="/pinpoint/job",
-            methods=[_apigw.HttpMethod.GET, _apigw.HttpMethod.POST],
-            integration=_integrations.HttpLambdaIntegration("LambdaProxyIntegration", handler=self.pinpoint_job_lambda),
-        )
-
-        # add Pinpoint message to POST /
-        http_api.add_routes(
-            path="/pinpoint/message",
-            methods=[_apigw.HttpMethod.POST],
-            integration=_integrations.HttpLambdaIntegration(
-                "LambdaProxyIntegration", handler=self.pinpoint_message_lambda
+        # Route path, methods and the function serving it in the per_route deployment mode,
+        # integrated through its Warm alias so provisioned concurrency serves the API traffic
+        api_routes = [
+            ("/content/bedrock", [_apigw.HttpMethod.POST], "bedrock_content_generation"),
+            ("/pinpoint/segment", [_apigw.HttpMethod.GET], "pinpoint_segment"),
+            ("/pinpoint/job", [_apigw.HttpMethod.GET, _apigw.HttpMethod.POST], "pinpoint_job"),
+            ("/pinpoint/message", [_apigw.HttpMethod.POST], "pinpoint_message"),
+            ("/s3", [_apigw.HttpMethod.GET], "s3_fetch"),
+            (
+                "/personalize/batch-segment-job",
+                [_apigw.HttpMethod.GET, _apigw.HttpMethod.POST],
+                "personalize_batch_segment_job",
             ),
-        )
-
-        # add s3 file to GET /
-        http_api.add_routes(
-            path="/s3",
-            methods=[_apigw.HttpMethod.GET],
-            integration=_integrations.HttpLambdaIntegration("LambdaProxyIntegration", handler=self.s3_fetch_lambda),
-        )
-
-        # add Personalize batch segment to GET /
-        http_api.add_routes(
-            path="/personalize/batch-segment-job",
-            methods=[_apigw.HttpMethod.GET],
-            integration=_integrations.HttpLambdaIntegration(
-                "LambdaProxyIntegration", handler=self.personalize_batch_segment_job_lambda
-            ),
-        )
-
-        # add Personalize batch segment to POST /
-        http_api.add_routes(
-            path="/personalize/batch-segment-job",
-            methods=[_apigw.HttpMethod.POST],
-            integration=_integrations.HttpLambdaIntegration(
-                "LambdaProxyIntegration", handler=self.personalize_batch_segment_job_lambda
-            ),
-        )
+            ("/personalize/batch-segment-jobs", [_apigw.HttpMethod.GET], "personalize_batch_segment_jobs"),
+            ("/personalize/recommendations", [_apigw.HttpMethod.POST], "personalize_recommendations"),
+        ]
+
+        # In consolidated mode every route shares one integration with the router function
+        router_integration = None
+        if deployment_mode == "consolidated":
+            router_integration = _integrations.HttpLambdaIntegration(
+                "RouterIntegration", handler=self.warm_aliases["api_router"]
+            )
 
-        # add Personalize batch segments to GET /
-        http_api.add_routes(
-            path="/personalize/batch-segment-jobs",
-            methods=[_apigw.HttpMethod.GET],
-            integration=_integrations.HttpLambdaIntegration(
-                "LambdaProxyIntegration", handler=self.personalize_batch_segment_jobs_lambda
-            ),
-        )
+        for path, methods, function_name in api_routes:
+            http_api.add_routes(
+                path=path,
+                methods=methods,
+                integration=router_integration
+                or _integrations.HttpLambdaIntegration(
+                    "LambdaProxyIntegration", handler=self.warm_aliases[function_name]
+                ),
+            )
 
         self.api_uri = http_api.api_endpoint
 
@@ -218,6 +207,69 @@ class CDSAIAPIConstructs(Construct):
             layer_version_name=f"{stack_name}-langchain-layer",
         )
 
+        # Pure Python, usable by functions of either architecture
+        self.layer_utilities = _lambda.LayerVersion(
+            self,
+            f"{stack_name}-utilities-layer",
+            compatible_runtimes=[self._runtime],
+            compatible_architectures=[_lambda.Architecture.X86_64, _lambda.Architecture.ARM_64],
+            code=_lambda.Code.from_asset("./assets/layers/utilities"),
+            description="A layer for shared AWS helpers (pooled boto3 clients)",
+            layer_version_name=f"{stack_name}-utilities-layer",
+        )
+
+        # AWS SDK for pandas layers per architecture, created on first use
+        self.layers_aws_sdk_pandas = {}
+
+    def aws_sdk_pandas_layer(self, architecture: _lambda.Architecture):
+        """
+        AWS managed pandas layer built for the runtime and architecture of a function
+        """
+        if architecture.name not in self.layers_aws_sdk_pandas:
+            # e.g. PYTHON_3_9 on ARM_64 -> AWSSDKPandas-Python39-Arm64
+            pandas_layer_name = "AWSSDKPandas-Python" + self.python_runtime.split("_", 1)[1].replace("_", "")
+            if architecture == _lambda.Architecture.ARM_64:
+                pandas_layer_name += "-Arm64"
+            self.layers_aws_sdk_pandas[architecture.name] = _lambda.LayerVersion.from_layer_version_arn(
+                self,
+                f"aws-sdk-pandas-layer-{architecture.name}",
+                layer_version_arn=(
+                    f"arn:aws:lambda:{Aws.REGION}:{AWS_SDK_PANDAS_LAYER_ACCOUNT}:layer:"
+                    f"{pandas_layer_name}:{self.aws_sdk_pandas_layer_version}"
+                ),
+            )
+        return self.layers_aws_sdk_pandas[architecture.name]
+
+    ## **************** Function Profiles ****************
+    @staticmethod
+    def to_architecture(architecture: str) -> _lambda.Architecture:
+        if architecture == "ARM_64":
+            return _lambda.Architecture.ARM_64
+        if architecture == "X86_64":
+            return _lambda.Architecture.X86_64
+        raise RuntimeError("Select one option for system architecture among [ARM_64, X86_64]")
+
+    def function_profile(self, name: str, timeout: int, langchain_layer: bool = False) -> dict:
+        """
+        Memory, architecture and timeout of a function from lambda.function_profiles in config.yml
+
+        Keys missing from the function's profile fall back to its default profile, then to
+        3008 MB, the global lambda.architecture and the given timeout.
+        """
+        profile = {**self.function_profiles.get("default", {}), **self.function_profiles.get(name, {})}
+        architecture = self._architecture
+        if "architecture" in profile:
+            architecture = self.to_architecture(profile["architecture"])
+        if langchain_layer and architecture != self._architecture:
+            raise RuntimeError(
+                f"{name} uses the langchain layer, built for lambda.architecture, and cannot change architecture"
+            )
+        return {
+            "memory_size": int(profile.get("memory_size", 3008)),
+            "architecture": architecture,
+            "timeout": Duration.seconds(int(profile.get("timeout", timeout))),
+        }
+
     ## **************** Lambda Functions ****************
     def create_lambda_functions(self, stack_name):
         ## ********* Create Marketing Content Bedrock *********
@@ -227,23 +279,17 @@ class CDSAIAPIConstructs(Construct):
             runtime=self._runtime,
             code=_lambda.Code.from_asset("./assets/lambda/bedrock_content_generation_lambda"),
             handler="bedrock_content_generation_lambda.lambda_handler",
-            architecture=self._architecture,
             function_name=f"{stack_name}-bedrock-content-generation-lambda",
-            memory_size=3008,
-            timeout=Duration.seconds(QUERY_BEDROCK_TIMEOUT),
+            **self.function_profile("bedrock_content_generation", timeout=QUERY_BEDROCK_TIMEOUT, langchain_layer=True),
             environment={
                 "BUCKET_NAME": self.s3_data_bucket.bucket_name,
                 "BEDROCK_REGION": self.bedrock_region,
                 "BEDROCK_ROLE_ARN": str(self.bedrock_role_arn),
             },
             role=self.bedrock_content_generation_role,
-            layers=[self.layer_langchain],
-        )
-        self.bedrock_content_generation_lambda.add_alias(
-            "Warm",
-            provisioned_concurrent_executions=0,
-            description="Alias used for Lambda provisioned concurrency",
+            layers=[self.layer_langchain, self.layer_utilities],
         )
+        self.add_warm_alias("bedrock_content_generation", self.bedrock_content_generation_lambda)
 
         ## ********* Pinpoint Segment *********
         self.pinpoint_segment_lambda = _lambda.Function(
@@ -253,18 +299,14 @@ class CDSAIAPIConstructs(Construct):
             code=_lambda.Code.from_asset("./assets/lambda/genai_pinpoint_segment"),
             handler="pinpoint_segment.lambda_handler",
             function_name=f"{stack_name}-pinpoint-segment",
-            memory_size=3008,
-            timeout=Duration.seconds(PINPOINT_TIMEOUT),
+            **self.function_profile("pinpoint_segment", timeout=PINPOINT_TIMEOUT),
             environment={
                 "PINPOINT_PROJECT_ID": self.pinpoint_project_id,
             },
             role=self.lambda_pinpoint_segment_role,
+            layers=[self.layer_utilities],
         )
-        self.pinpoint_segment_lambda.add_alias(
-            "Warm",
-            provisioned_concurrent_executions=0,
-            description="Alias used for Lambda provisioned concurrency",
-        )
+        self.add_warm_alias("pinpoint_segment", self.pinpoint_segment_lambda)
 
         ## ********* Pinpoint Job *********
         self.pinpoint_job_lambda = _lambda.Function(
@@ -274,20 +316,17 @@ class CDSAIAPIConstructs(Construct):
             code=_lambda.Code.from_asset("./assets/lambda/genai_pinpoint_job"),
             handler="pinpoint_job.lambda_handler",
             function_name=f"{stack_name}-pinpoint-job",
-            memory_size=3008,
-            timeout=Duration.seconds(PINPOINT_TIMEOUT),
+            **self.function_profile("pinpoint_job", timeout=PINPOINT_TIMEOUT),
             environment={
                 "PINPOINT_PROJECT_ID": self.pinpoint_project_id,
                 "PINPOINT_EXPORT_ROLE_ARN": self.pinpoint_export_role_arn,
                 "BUCKET_NAME": self.s3_data_bucket.bucket_name,
+                "EXPORT_REUSE_WINDOW": str(self.pinpoint_export_reuse_window),
             },
             role=self.lambda_pinpoint_job_role,
+            layers=[self.layer_utilities],
         )
-        self.pinpoint_job_lambda.add_alias(
-            "Warm",
-            provisioned_concurrent_executions=0,
-            description="Alias used for Lambda provisioned concurrency",
-        )
+        self.add_warm_alias("pinpoint_job", self.pinpoint_job_lambda)
 
         ## ********* Pinpoint Message *********
         self.pinpoint_message_lambda = _lambda.Function(
@@ -297,8 +336,7 @@ class CDSAIAPIConstructs(Construct):
             code=_lambda.Code.from_asset("./assets/lambda/genai_pinpoint_message"),
             handler="pinpoint_message.lambda_handler",
             function_name=f"{stack_name}-pinpoint-message",
-            memory_size=3008,
-            timeout=Duration.seconds(PINPOINT_TIMEOUT),
+            **self.function_profile("pinpoint_message", timeout=PINPOINT_TIMEOUT),
             environment={
                 "PINPOINT_PROJECT_ID": self.pinpoint_project_id,
                 "BUCKET_NAME": self.s3_data_bucket.bucket_name,
@@ -306,12 +344,9 @@ class CDSAIAPIConstructs(Construct):
                 "SMS_IDENTITY": self.sms_identity,
             },
             role=self.lambda_pinpoint_message_role,
+            layers=[self.layer_utilities],
         )
-        self.pinpoint_message_lambda.add_alias(
-            "Warm",
-            provisioned_concurrent_executions=0,
-            description="Alias used for Lambda provisioned concurrency",
-        )
+        self.add_warm_alias("pinpoint_message", self.pinpoint_message_lambda)
 
         ## ********* S3 Fetch *********
         self.s3_fetch_lambda = _lambda.Function(
@@ -321,18 +356,14 @@ class CDSAIAPIConstructs(Construct):
             code=_lambda.Code.from_asset("./assets/lambda/genai_s3"),
             handler="s3_fetch.lambda_handler",
             function_name=f"{stack_name}-s3-fetch",
-            memory_size=3008,
-            timeout=Duration.seconds(S3_TIMEOUT),
+            **self.function_profile("s3_fetch", timeout=S3_TIMEOUT),
             environment={
                 "BUCKET_NAME": self.s3_data_bucket.bucket_name,
             },
             role=self.lambda_s3_role,
+            layers=[self.layer_utilities],
         )
-        self.s3_fetch_lambda.add_alias(
-            "Warm",
-            provisioned_concurrent_executions=0,
-            description="Alias used for Lambda provisioned concurrency",
-        )
+        self.add_warm_alias("s3_fetch", self.s3_fetch_lambda)
 
         ## ********* Personalize *********
 
@@ -344,20 +375,16 @@ class CDSAIAPIConstructs(Construct):
             code=_lambda.Code.from_asset("./assets/lambda/genai_personalize_batch_segment_job"),
             handler="personalize_batch_segment_job.lambda_handler",
             function_name=f"{stack_name}-personalize-batch-segment-job",
-            memory_size=3008,
-            timeout=Duration.seconds(S3_TIMEOUT),
+            **self.function_profile("personalize_batch_segment_job", timeout=S3_TIMEOUT),
             environment={
                 "BUCKET_NAME": self.s3_data_bucket.bucket_name,
                 "PERSONALIZE_ROLE_ARN": self.personalize_role_arn,
                 "SOLUTION_VERSION_ARN": self.personalize_solution_version_arn,
             },
             role=self.personalize_role,
+            layers=[self.layer_utilities],
         )
-        self.personalize_batch_segment_job_lambda.add_alias(
-            "Warm",
-            provisioned_concurrent_executions=0,
-            description="Alias used for Lambda provisioned concurrency",
-        )
+        self.add_warm_alias("personalize_batch_segment_job", self.personalize_batch_segment_job_lambda)
 
         ### ********* Personalize Batch Segment Jobs *********
         self.personalize_batch_segment_jobs_lambda = _lambda.Function(
@@ -367,15 +394,154 @@ class CDSAIAPIConstructs(Construct):
             code=_lambda.Code.from_asset("./assets/lambda/genai_personalize_batch_segment_jobs"),
             handler="personalize_batch_segment_jobs.lambda_handler",
             function_name=f"{stack_name}-personalize-batch-segment-jobs",
-            memory_size=3008,
-            timeout=Duration.seconds(S3_TIMEOUT),
+            **self.function_profile("personalize_batch_segment_jobs", timeout=S3_TIMEOUT),
+            environment={
+                "BUCKET_NAME": self.s3_data_bucket.bucket_name,
+            },
             role=self.personalize_role,
+            layers=[self.layer_utilities],
         )
-        self.personalize_batch_segment_jobs_lambda.add_alias(
-            "Warm",
-            provisioned_concurrent_executions=0,
-            description="Alias used for Lambda provisioned concurrency",
+        self.add_warm_alias("personalize_batch_segment_jobs", self.personalize_batch_segment_jobs_lambda)
+
+        ### ********* Personalize Real-time Recommendations *********
+        self.personalize_recommendations_lambda = _lambda.Function(
+            self,
+            f"{stack_name}-personalize-recommendations-lambda",
+            runtime=self._runtime,
+            code=_lambda.Code.from_asset("./assets/lambda/genai_personalize_recommendations"),
+            handler="personalize_recommendations.lambda_handler",
+            function_name=f"{stack_name}-personalize-recommendations",
+            **self.function_profile("personalize_recommendations", timeout=S3_TIMEOUT),
+            environment={
+                "BUCKET_NAME": self.s3_data_bucket.bucket_name,
+                "CAMPAIGN_ARN": str(self.personalize_campaign_arn),
+            },
+            role=self.personalize_role,
+            layers=[self.layer_utilities],
         )
+        self.add_warm_alias("personalize_recommendations", self.personalize_recommendations_lambda)
+
+    def create_router_function(self, stack_name):
+        ## ********* Consolidated API Router *********
+        # One function for every API route, packaging all route handlers side by side
+        self.router_lambda = _lambda.Function(
+            self,
+            f"{stack_name}-api-router-lambda",
+            runtime=self._runtime,
+            code=_lambda.Code.from_asset(
+                "./assets/lambda", exclude=["genai_personalize_segment_snapshot", "**/__pycache__"]
+            ),
+            handler="genai_router/router.lambda_handler",
+            function_name=f"{stack_name}-api-router",
+            **self.function_profile(
+                "api_router", timeout=max(QUERY_BEDROCK_TIMEOUT, PINPOINT_TIMEOUT, S3_TIMEOUT), langchain_layer=True
+            ),
+            environment={
+                "BUCKET_NAME": self.s3_data_bucket.bucket_name,
+                "BEDROCK_REGION": self.bedrock_region,
+                "BEDROCK_ROLE_ARN": str(self.bedrock_role_arn),
+                "PINPOINT_PROJECT_ID": self.pinpoint_project_id,
+                "PINPOINT_EXPORT_ROLE_ARN": self.pinpoint_export_role_arn,
+                "EXPORT_REUSE_WINDOW": str(self.pinpoint_export_reuse_window),
+                "EMAIL_IDENTITY": self.email_identity,
+                "SMS_IDENTITY": self.sms_identity,
+                "PERSONALIZE_ROLE_ARN": self.personalize_role_arn,
+                "SOLUTION_VERSION_ARN": self.personalize_solution_version_arn,
+                "CAMPAIGN_ARN": str(self.personalize_campaign_arn),
+                # Warm environments get the generation route ready during their init phase
+                "ROUTER_PRELOAD_ROUTES": (
+                    "POST /content/bedrock" if "api_router" in self.provisioned_concurrency else ""
+                ),
+            },
+            role=self.lambda_router_role,
+            layers=[self.layer_langchain, self.layer_utilities],
+        )
+        self.add_warm_alias("api_router", self.router_lambda)
+
+    def create_segment_snapshot_function(self, stack_name):
+        ## ********* Personalize Segment Snapshot *********
+        profile = self.function_profile("personalize_segment_snapshot", timeout=S3_TIMEOUT)
+        self.personalize_segment_snapshot_lambda = _lambda.Function(
+            self,
+            f"{stack_name}-personalize-segment-snapshot-lambda",
+            runtime=self._runtime,
+            code=_lambda.Code.from_asset("./assets/lambda/genai_personalize_segment_snapshot"),
+            handler="personalize_segment_snapshot.lambda_handler",
+            function_name=f"{stack_name}-personalize-segment-snapshot",
+            **profile,
+            environment={
+                "BUCKET_NAME": self.s3_data_bucket.bucket_name,
+            },
+            role=self.personalize_role,
+            layers=[self.aws_sdk_pandas_layer(profile["architecture"]), self.layer_utilities],
+        )
+
+        # Materialize the segment as soon as a batch segment job writes its output
+        self.s3_data_bucket.add_event_notification(
+            _s3.EventType.OBJECT_CREATED,
+            _s3n.LambdaDestination(self.personalize_segment_snapshot_lambda),
+            # shard jobs write under personalize-shard-output/, only their merged output is materialized
+            _s3.NotificationKeyFilter(prefix="personalize-output/", suffix=".json.out"),
+        )
+
+        ## ********* Personalize Shard Merge *********
+        self.personalize_shard_merge_lambda = _lambda.Function(
+            self,
+            f"{stack_name}-personalize-shard-merge-lambda",
+            runtime=self._runtime,
+            code=_lambda.Code.from_asset("./assets/lambda/genai_personalize_batch_segment_job"),
+            handler="personalize_batch_segment_job.merge_handler",
+            function_name=f"{stack_name}-personalize-shard-merge",
+            **self.function_profile("personalize_shard_merge", timeout=S3_TIMEOUT),
+            environment={
+                "BUCKET_NAME": self.s3_data_bucket.bucket_name,
+                "PERSONALIZE_ROLE_ARN": self.personalize_role_arn,
+                "SOLUTION_VERSION_ARN": self.personalize_solution_version_arn,
+            },
+            role=self.personalize_role,
+            layers=[self.layer_utilities],
+        )
+
+        # Merge a shard group when its last shard job writes its output, off the API's status requests
+        self.s3_data_bucket.add_event_notification(
+            _s3.EventType.OBJECT_CREATED,
+            _s3n.LambdaDestination(self.personalize_shard_merge_lambda),
+            _s3.NotificationKeyFilter(prefix="personalize-shard-output/", suffix=".json.out"),
+        )
+
+    ## **************** Provisioned Concurrency ****************
+    def add_warm_alias(self, name: str, fn: _lambda.Function) -> _lambda.Alias:
+        """
+        Warm alias of a function, the target of its provisioned concurrency settings under name
+        """
+        self.warm_aliases[name] = fn.add_alias("Warm", description="Alias used for Lambda provisioned concurrency")
+        return self.warm_aliases[name]
+
+    def configure_provisioned_concurrency(self):
+        """
+        Scheduled provisioned concurrency on the Warm aliases, from lambda.provisioned_concurrency in config.yml
+
+        Each function sets min/max provisioned environments, an optional utilization_target to scale
+        between them and schedules (cron expressions in UTC) changing min/max, e.g. warm during business hours.
+        """
+        for name, settings in self.provisioned_concurrency.items():
+            alias = self.warm_aliases.get(name)
+            if alias is None:
+                # e.g. a per-route function while deployment_mode is consolidated
+                continue
+            scaling = alias.add_auto_scaling(
+                min_capacity=int(settings.get("min", 0)),
+                max_capacity=int(settings.get("max", 1)),
+            )
+            if settings.get("utilization_target"):
+                scaling.scale_on_utilization(utilization_target=float(settings["utilization_target"]))
+            for schedule in settings.get("schedules", []):
+                scaling.scale_on_schedule(
+                    schedule["name"],
+                    schedule=appscaling.Schedule.expression(f"cron({schedule['cron']})"),
+                    min_capacity=schedule.get("min"),
+                    max_capacity=schedule.get("max"),
+                )
 
     ## **************** IAM Permissions ****************
     def create_roles(self, stack_name: str):
@@ -548,6 +714,15 @@ class CDSAIAPIConstructs(Construct):
         pinpoint_export_job_policy_statement = iam.PolicyStatement(
             actions=["mobiletargeting:GetExportJob"], resources=["*"], effect=iam.Effect.ALLOW
         )
+        # Statement to allow looking up previous exports of a segment and its last modification
+        pinpoint_reuse_export_job_policy_statement = iam.PolicyStatement(
+            actions=["mobiletargeting:GetExportJobs", "mobiletargeting:GetSegment"],
+            resources=[
+                f"arn:aws:mobiletargeting:{Aws.REGION}:{Aws.ACCOUNT_ID}:apps/{self.pinpoint_project_id}",
+                f"arn:aws:mobiletargeting:{Aws.REGION}:{Aws.ACCOUNT_ID}:apps/{self.pinpoint_project_id}/*",
+            ],
+            effect=iam.Effect.ALLOW,
+        )
         # Statement to allow creating Pinpoint Export Job
         pinpoint_create_export_job_policy_statement = iam.PolicyStatement(
             actions=["mobiletargeting:CreateExportJob"],
@@ -564,6 +739,7 @@ class CDSAIAPIConstructs(Construct):
             policy_name=f"{stack_name}-pinpoint-export-job-policy",
             statements=[
                 pinpoint_export_job_policy_statement,
+                pinpoint_reuse_export_job_policy_statement,
                 pinpoint_create_export_job_policy_statement,
                 pinpoint_pass_export_role_policy_statement,
             ],
@@ -599,6 +775,44 @@ class CDSAIAPIConstructs(Construct):
             iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AmazonPersonalizeFullAccess")
         )
 
+        ## ********* Consolidated API Router *********
+        # Union of the permissions of the per-route functions it replaces
+        if self.deployment_mode == "consolidated":
+            self.lambda_router_role = iam.Role(
+                self,
+                f"{stack_name}-api-router-role",
+                role_name=f"{stack_name}-api-router-role",
+                assumed_by=iam.CompositePrincipal(
+                    iam.ServicePrincipal("lambda.amazonaws.com"),
+                ),
+            )
+            self.lambda_router_role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")
+            )
+            self.lambda_router_role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AmazonPersonalizeFullAccess")
+            )
+            self.lambda_router_role.attach_inline_policy(bedrock_access_policy)
+            self.s3_data_bucket.grant_read_write(self.lambda_router_role)
+            pinpoint_segment_policy.attach_to_role(self.lambda_router_role)
+            pinpoint_export_job_policy.attach_to_role(self.lambda_router_role)
+            pinpoint_send_message_policy.attach_to_role(self.lambda_router_role)
+
+            NagSuppressions.add_resource_suppressions(
+                self.lambda_router_role,
+                [
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "reason": "Policy for the router Lambda to access S3 so wildcards are acceptable",
+                    },
+                    {
+                        "id": "AwsSolutions-IAM4",
+                        "reason": "Same managed policies as the per-route Lambda functions",
+                    },
+                ],
+                apply_to_children=True,
+            )
+
         ## ********* CDK Nag Suppressions *********
 
         NagSuppressions.add_resource_suppressions(
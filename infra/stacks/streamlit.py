@@ -3,9 +3,10 @@ from pathlib import Path
 
 from aws_cdk import aws_iam as iam
 from aws_cdk import CfnOutput as output
-from aws_cdk import NestedStack, Tags
+from aws_cdk import Duration, NestedStack, Tags
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_ecs as ecs
+from aws_cdk import aws_efs as efs
 from aws_cdk import aws_elasticloadbalancingv2 as elbv2
 from aws_cdk import aws_s3 as _s3
 from aws_cdk import aws_logs as logs
@@ -27,6 +28,9 @@ class StreamlitStack(NestedStack):
         s3_data_bucket: _s3.Bucket,
         ecs_cpu: int = 512,
         ecs_memory: int = 1024,
+        autoscaling: dict = None,
+        stickiness_duration: int = 86400,
+        shared_cache: bool = False,
         client_id: str = None,
         api_uri: str = None,
         cover_image_url: str = None,
@@ -45,6 +49,9 @@ class StreamlitStack(NestedStack):
         self.prefix = stack_name
         self.ecs_cpu = ecs_cpu
         self.ecs_memory = ecs_memory
+        self.autoscaling = autoscaling or {}
+        self.stickiness_duration = stickiness_duration
+        self.shared_cache = shared_cache
         self.client_id = client_id
         self.api_uri = api_uri
         self.cover_image_url = cover_image_url
@@ -207,7 +214,7 @@ class StreamlitStack(NestedStack):
 
         # app_uri = f"http://{alb.load_balancer_dns_name}"
 
-        fargate_task_definition.add_container(
+        container = fargate_task_definition.add_container(
             "WebContainer",
             # Use an image from DockerHub
             image=ecs.ContainerImage.from_docker_image_asset(self.docker_asset),
@@ -222,12 +229,16 @@ class StreamlitStack(NestedStack):
             logging=ecs.LogDrivers.aws_logs(stream_prefix="WebContainerLogs"),
         )
 
+        if self.shared_cache:
+            self.add_shared_cache(fargate_task_definition, container, task_role)
+
         service = ecs.FargateService(
             self,
             "StreamlitECSService",
             cluster=cluster,
             task_definition=fargate_task_definition,
             service_name=f"{self.prefix}-stl-front",
+            desired_count=self.autoscaling.get("min_tasks", 1),
             security_groups=[self.ecs_security_group],
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
         )
@@ -329,7 +340,8 @@ class StreamlitStack(NestedStack):
             open=not (bool(self.ip_address_allowed)),
         )
 
-        http_listener.add_targets(
+        # Streamlit keeps each browser session in the memory of one task, the cookie brings it back there
+        target_group = http_listener.add_targets(
             f"{self.prefix}-tg{alb_suffix}",
             target_group_name=f"{self.prefix}-tg{alb_suffix}",
             port=8501,
@@ -337,7 +349,13 @@ class StreamlitStack(NestedStack):
             conditions=[elbv2.ListenerCondition.http_header(self.custom_header_name, [self.custom_header_value])],
             protocol=elbv2.ApplicationProtocol.HTTP,
             targets=[service],
+            stickiness_cookie_duration=(
+                Duration.seconds(self.stickiness_duration) if self.stickiness_duration else None
+            ),
+            health_check=elbv2.HealthCheck(path="/_stcore/health", healthy_http_codes="200"),
+            deregistration_delay=Duration.seconds(self.autoscaling.get("deregistration_delay", 60)),
         )
+        self.configure_autoscaling(service, target_group)
         # add a default action to the listener that will deny all requests that do not have the custom header
         http_listener.add_action(
             "default-action",
@@ -349,3 +367,80 @@ class StreamlitStack(NestedStack):
         )
 
         return cluster, alb, cloudfront_distribution
+
+    def add_shared_cache(self, task_definition, container, task_role):
+        # EFS directory mounted by every task, holding the caches of session-independent data
+        efs_security_group = ec2.SecurityGroup(
+            self,
+            "SecurityGroupEFS",
+            vpc=self.vpc,
+            security_group_name=f"{self.prefix}-stl-efs-sg",
+        )
+        efs_security_group.add_ingress_rule(
+            peer=self.ecs_security_group,
+            connection=ec2.Port.tcp(2049),
+            description="NFS from the Streamlit tasks",
+        )
+
+        file_system = efs.FileSystem(
+            self,
+            "SharedCacheFileSystem",
+            vpc=self.vpc,
+            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
+            security_group=efs_security_group,
+            encrypted=True,
+            performance_mode=efs.PerformanceMode.GENERAL_PURPOSE,
+            lifecycle_policy=efs.LifecyclePolicy.AFTER_7_DAYS,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        access_point = file_system.add_access_point(
+            "SharedCacheAccessPoint",
+            path="/streamlit-cache",
+            create_acl=efs.Acl(owner_uid="1000", owner_gid="1000", permissions="750"),
+            posix_user=efs.PosixUser(uid="1000", gid="1000"),
+        )
+        file_system.grant(task_role, "elasticfilesystem:ClientMount", "elasticfilesystem:ClientWrite")
+
+        task_definition.add_volume(
+            name="shared-cache",
+            efs_volume_configuration=ecs.EfsVolumeConfiguration(
+                file_system_id=file_system.file_system_id,
+                transit_encryption="ENABLED",
+                authorization_config=ecs.AuthorizationConfig(
+                    access_point_id=access_point.access_point_id, iam="ENABLED"
+                ),
+            ),
+        )
+        container.add_mount_points(
+            ecs.MountPoint(container_path="/mnt/shared-cache", source_volume="shared-cache", read_only=False)
+        )
+        container.add_environment("SHARED_CACHE_DIR", "/mnt/shared-cache")
+
+    def configure_autoscaling(self, service, target_group):
+        # Horizontal scaling of the Streamlit tasks, each target given in config.yml adds a tracking policy
+        max_tasks = self.autoscaling.get("max_tasks", 1)
+        min_tasks = self.autoscaling.get("min_tasks", 1)
+        if max_tasks <= min_tasks:
+            return
+
+        scaling = service.auto_scale_task_count(min_capacity=min_tasks, max_capacity=max_tasks)
+        # scaling in ends the sessions of the stopped task, so it waits longer than scaling out
+        cooldowns = {
+            "scale_in_cooldown": Duration.seconds(self.autoscaling.get("scale_in_cooldown", 600)),
+            "scale_out_cooldown": Duration.seconds(self.autoscaling.get("scale_out_cooldown", 60)),
+        }
+        if self.autoscaling.get("cpu_target"):
+            scaling.scale_on_cpu_utilization(
+                "CpuScaling", target_utilization_percent=self.autoscaling["cpu_target"], **cooldowns
+            )
+        if self.autoscaling.get("memory_target"):
+            scaling.scale_on_memory_utilization(
+                "MemoryScaling", target_utilization_percent=self.autoscaling["memory_target"], **cooldowns
+            )
+        if self.autoscaling.get("requests_per_target"):
+            scaling.scale_on_request_count(
+                "RequestCountScaling",
+                requests_per_target=self.autoscaling["requests_per_target"],
+                target_group=target_group,
+                **cooldowns,
+            )
@@ -0,0 +1,44 @@
+import pytest
+from aws_helper import AwsHelper, DynamoDBHelper
+from botocore.stub import Stubber
+
+TABLE = "table"
+
+
+def put_requests(*ids):
+    return [{"PutRequest": {"Item": {"id": itemId}}} for itemId in ids]
+
+
+def unprocessed(*ids):
+    # responses are stubbed in the wire format, the resource client deserializes them
+    return {TABLE: [{"PutRequest": {"Item": {"id": {"S": itemId}}}} for itemId in ids]}
+
+
+@pytest.fixture
+def ddb_stub(monkeypatch):
+    # no backoff between the retries of unprocessed items
+    monkeypatch.setattr("aws_helper.time.sleep", lambda seconds: None)
+    client = AwsHelper().get_resource("dynamodb").meta.client
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_unprocessed_items_are_retried(ddb_stub):
+    ddb_stub.add_response(
+        "batch_write_item",
+        {"UnprocessedItems": unprocessed("b")},
+        {"RequestItems": {TABLE: put_requests("a", "b")}},
+    )
+    ddb_stub.add_response("batch_write_item", {"UnprocessedItems": {}}, {"RequestItems": {TABLE: put_requests("b")}})
+
+    DynamoDBHelper._batchWrite(TABLE, put_requests("a", "b"))
+
+
+def test_items_left_unprocessed_raise(ddb_stub, monkeypatch):
+    monkeypatch.setattr(DynamoDBHelper, "BATCH_WRITE_MAX_RETRIES", 1)
+    for _ in range(2):
+        ddb_stub.add_response("batch_write_item", {"UnprocessedItems": unprocessed("b")})
+
+    with pytest.raises(RuntimeError, match="1 items still unprocessed"):
+        DynamoDBHelper._batchWrite(TABLE, put_requests("a", "b"))
@@ -0,0 +1,115 @@
+import importlib.util
+import io
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from aws_helper import AwsHelper
+from boto3.exceptions import S3UploadFailedError
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+ROOT = Path(__file__).parent.parent.parent
+HANDLER_PATH = ROOT / "assets" / "lambda" / "genai_personalize_batch_segment_job" / "personalize_batch_segment_job.py"
+BUCKET = "bucket"
+GROUP_ID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+
+@pytest.fixture
+def module(monkeypatch):
+    monkeypatch.setenv("BUCKET_NAME", BUCKET)
+    monkeypatch.setenv("PERSONALIZE_ROLE_ARN", "arn:aws:iam::123456789012:role/personalize")
+    monkeypatch.setenv("SOLUTION_VERSION_ARN", "arn:aws:personalize:us-east-1:123456789012:solution/s/1")
+    spec = importlib.util.spec_from_file_location("personalize_batch_segment_job", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def s3_stub():
+    with Stubber(AwsHelper().get_client("s3")) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def body(data):
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+def manifest(num_shards=2):
+    return {
+        "groupId": GROUP_ID,
+        "numResults": 10,
+        "numShards": num_shards,
+        "creationDateTime": datetime.now(timezone.utc).isoformat(),
+        "jobs": [
+            {"jobName": f"{GROUP_ID}-shard-{i}", "batchSegmentJobArn": f"arn:job/{GROUP_ID}-shard-{i}"}
+            for i in range(num_shards)
+        ],
+    }
+
+
+def test_partial_submission_returns_its_group(module, s3_stub, monkeypatch):
+    uploads = []
+
+    def upload_job_input(s3, job_name, item_id_list):
+        uploads.append(job_name)
+        if len(uploads) == 2:
+            raise S3UploadFailedError("Failed to upload")
+        return f"s3://{BUCKET}/personalize-input/{job_name}.json"
+
+    monkeypatch.setattr(module, "upload_job_input", upload_job_input)
+    with Stubber(AwsHelper().get_client("personalize")) as personalize_stub:
+        personalize_stub.add_response("create_batch_segment_job", {"batchSegmentJobArn": "arn:job/shard-0"})
+        s3_stub.add_response("put_object", {}, {"Bucket": BUCKET, "Key": ANY, "Body": ANY})
+        s3_stub.add_response("put_object", {}, {"Bucket": BUCKET, "Key": ANY, "Body": ANY})
+
+        event = {
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"item-ids": "i1,i2,i3", "num-results": 10, "num-shards": 2}),
+        }
+        response = module.lambda_handler(event, None)
+
+    assert response["statusCode"] == 500
+    group = json.loads(response["body"])
+    assert group["submissionError"] == "Failed to upload"
+    assert [job["batchSegmentJobArn"] for job in group["jobs"]] == ["arn:job/shard-0"]
+    assert uploads == [f"{group['groupId']}-shard-0", f"{group['groupId']}-shard-1"]
+
+
+def test_merge_waits_for_every_shard_output(module, s3_stub):
+    s3_stub.add_client_error("head_object", "404", http_status_code=404)
+    s3_stub.add_response("get_object", {"Body": body(json.dumps(manifest()).encode())})
+    s3_stub.add_response("head_object", {})
+    s3_stub.add_client_error("head_object", "404", http_status_code=404)
+
+    assert module.merge_group(AwsHelper().get_client("s3"), GROUP_ID) is False
+
+
+def test_merge_streams_shard_outputs(module, s3_stub):
+    outputs = [
+        b'{"input": {"itemId": "i1"}, "output": {"usersList": ["u1", "u2", "u1"]}}\n',
+        b'{"input": {"itemId": "i2"}, "output": {"usersList": ["u3"]}}\n',
+    ]
+    s3_stub.add_client_error("head_object", "404", http_status_code=404)
+    s3_stub.add_response("get_object", {"Body": body(json.dumps(manifest()).encode())})
+    s3_stub.add_response("head_object", {})
+    s3_stub.add_response("head_object", {})
+    for output in outputs:
+        s3_stub.add_response("head_object", {"ContentLength": len(output), "ETag": '"etag"'})
+        s3_stub.add_response("get_object", {"Body": body(output)})
+    s3_stub.add_response(
+        "put_object",
+        {},
+        {
+            "Bucket": BUCKET,
+            "Key": f"personalize-output/{GROUP_ID}/{GROUP_ID}.json.out",
+            "Body": b'{"input": {"itemId": "i1"}, "output": {"usersList": ["u1", "u2"]}}\n'
+            b'{"input": {"itemId": "i2"}, "output": {"usersList": ["u3"]}}\n',
+        },
+    )
+
+    event = {"Records": [{"s3": {"object": {"key": f"personalize-shard-output/{GROUP_ID}-shard-1/x.json.out"}}}]}
+    module.merge_handler(event, None)
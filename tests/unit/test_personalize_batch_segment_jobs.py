@@ -0,0 +1,61 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent.parent
+HANDLER_PATH = ROOT / "assets" / "lambda" / "genai_personalize_batch_segment_jobs" / "personalize_batch_segment_jobs.py"
+
+
+@pytest.fixture
+def module(monkeypatch):
+    monkeypatch.setenv("BUCKET_NAME", "bucket")
+    spec = importlib.util.spec_from_file_location("personalize_batch_segment_jobs", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def job(i):
+    return {
+        "batchSegmentJobArn": f"arn:job/{i}",
+        "jobName": f"job-{i}",
+        "status": "ACTIVE",
+        "creationDateTime": f"2024-01-{i:02d}T00:00:00+00:00",
+    }
+
+
+def index_of(*numbers):
+    return {"jobs": {job(i)["batchSegmentJobArn"]: job(i) for i in numbers}}
+
+
+def test_pages_resume_after_their_cursor_when_jobs_are_added(module):
+    index = index_of(1, 2, 3, 4)
+    first = module.query_index(index, {"max-results": 2})
+    # a refresh by another session indexes a newer job before the next page is requested
+    index["jobs"]["arn:job/5"] = job(5)
+    second = module.query_index(index, {"max-results": 2, "next-token": first["nextToken"]})
+
+    assert [j["jobName"] for j in first["batchSegmentJobs"]] == ["job-4", "job-3"]
+    assert [j["jobName"] for j in second["batchSegmentJobs"]] == ["job-2", "job-1"]
+    assert second["nextToken"] is None
+
+
+def test_token_of_another_sort_is_rejected(module):
+    first = module.query_index(index_of(1, 2, 3), {"max-results": 1})
+
+    with pytest.raises(ValueError, match="next-token"):
+        module.query_index(index_of(1, 2, 3), {"max-results": 1, "ascending": True, "next-token": first["nextToken"]})
+
+
+@pytest.mark.parametrize("ascending, expected", [("false", "job-2"), ("true", "job-1"), (False, "job-2")])
+def test_ascending_is_parsed_strictly(module, ascending, expected):
+    page = module.query_index(index_of(1, 2), {"ascending": ascending})
+
+    assert page["batchSegmentJobs"][0]["jobName"] == expected
+
+
+@pytest.mark.parametrize("params", [{"ascending": "no"}, {"max-results": 0}, {"max-results": -1}])
+def test_invalid_parameters_are_rejected(module, params):
+    with pytest.raises(ValueError):
+        module.query_index(index_of(1, 2), params)
@@ -0,0 +1,127 @@
+import importlib.util
+import io
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from aws_helper import AwsHelper
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+ROOT = Path(__file__).parent.parent.parent
+HANDLER_PATH = ROOT / "assets" / "lambda" / "genai_personalize_recommendations" / "personalize_recommendations.py"
+BUCKET = "bucket"
+
+
+def load_handler(monkeypatch, **environment):
+    # the module reads its settings at import, like a cold start
+    monkeypatch.setenv("BUCKET_NAME", BUCKET)
+    for name, value in environment.items():
+        monkeypatch.setenv(name, value)
+    spec = importlib.util.spec_from_file_location("personalize_recommendations", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def post(module, user_ids, num_results=2):
+    event = {
+        "requestContext": {"http": {"method": "POST"}},
+        "body": json.dumps({"user-ids": user_ids, "num-results": num_results}),
+    }
+    response = module.lambda_handler(event, None)
+    assert response["statusCode"] == 200
+    return json.loads(response["body"])
+
+
+@pytest.fixture
+def local_runtime(monkeypatch, tmp_path):
+    path = tmp_path / "recommendations.json"
+    path.write_text(json.dumps({"u1": ["i1", "i2", "i3"], "u2": ["i2"]}))
+    module = load_handler(monkeypatch, PERSONALIZE_RUNTIME="local", LOCAL_RECOMMENDATIONS_PATH=str(path))
+    calls = []
+    get_recommendations = module.LocalPersonalizeRuntime.get_recommendations
+
+    def counting(self, campaignArn, userId, numResults=25, **kwargs):
+        calls.append(userId)
+        return get_recommendations(self, campaignArn, userId, numResults, **kwargs)
+
+    monkeypatch.setattr(module.LocalPersonalizeRuntime, "get_recommendations", counting)
+    return module, calls
+
+
+def test_cached_recommendations_are_reused(local_runtime):
+    module, calls = local_runtime
+
+    first = post(module, "u1,u2")
+    second = post(module, "u1")
+
+    assert [item["itemId"] for item in first["recommendations"]["u1"]] == ["i1", "i2"]
+    assert second["recommendations"]["u1"] == first["recommendations"]["u1"]
+    assert second["cachedUsers"] == ["u1"]
+    assert calls == ["u1", "u2"]
+
+
+def test_expired_recommendations_are_fetched_again(local_runtime, monkeypatch):
+    module, calls = local_runtime
+    now = [1000.0]
+    monkeypatch.setattr(module.time, "time", lambda: now[0])
+
+    post(module, "u1")
+    now[0] += module.CACHE_TTL_SECONDS + 1
+    response = post(module, "u1")
+
+    assert response["cachedUsers"] == []
+    assert calls == ["u1", "u1"]
+
+
+def test_cache_evicts_least_recently_used(local_runtime, monkeypatch):
+    module, calls = local_runtime
+    monkeypatch.setattr(module, "MAX_CACHED_RECOMMENDATIONS", 1)
+
+    post(module, "u1")
+    post(module, "u2")
+    post(module, "u1")
+
+    assert len(module.RECOMMENDATIONS_CACHE) == 1
+    assert calls == ["u1", "u2", "u1"]
+
+
+def test_batch_fallback_reads_merged_output_only(monkeypatch):
+    module = load_handler(monkeypatch, CAMPAIGN_ARN="None", PERSONALIZE_RUNTIME="aws")
+    merged_key = "personalize-output/group/group.json.out"
+    output = b"\n".join(
+        json.dumps({"input": {"itemId": item_id}, "output": {"usersList": ["u1", "u2"]}}).encode()
+        for item_id in ("i1", "i2")
+    )
+
+    with Stubber(AwsHelper().get_client("s3")) as s3_stub:
+        s3_stub.add_response(
+            "list_objects_v2",
+            {
+                "Contents": [
+                    {"Key": merged_key, "LastModified": datetime(2024, 1, 1, tzinfo=timezone.utc)},
+                    # newer, but partial outputs of a shard group written before shards moved out
+                    {
+                        "Key": "personalize-output/old-shard-0/old-shard-0.json.out",
+                        "LastModified": datetime(2024, 1, 2, tzinfo=timezone.utc),
+                    },
+                    {
+                        "Key": "personalize-output/group/_SUCCESS",
+                        "LastModified": datetime(2024, 1, 3, tzinfo=timezone.utc),
+                    },
+                ]
+            },
+            {"Bucket": BUCKET, "Prefix": module.BATCH_OUTPUT_PREFIX},
+        )
+        s3_stub.add_response(
+            "get_object",
+            {"Body": StreamingBody(io.BytesIO(output), len(output))},
+            {"Bucket": BUCKET, "Key": merged_key},
+        )
+
+        response = post(module, "u2")
+
+    assert response["source"] == f"batch:{merged_key}"
+    assert [item["itemId"] for item in response["recommendations"]["u2"]] == ["i1", "i2"]
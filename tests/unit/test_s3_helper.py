@@ -0,0 +1,192 @@
+import io
+import threading
+import time
+
+import pytest
+from aws_helper import AwsHelper, S3Helper, S3MultipartWriter, iterConcurrently
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+BUCKET = "bucket"
+KEY = "exports/segment.jsonl"
+ETAG = '"0123456789abcdef"'
+
+
+@pytest.fixture
+def s3_stub():
+    client = AwsHelper().get_client("s3")
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def page(keys, nextToken=None):
+    response = {"Contents": [{"Key": key} for key in keys], "IsTruncated": nextToken is not None}
+    if nextToken:
+        response["NextContinuationToken"] = nextToken
+    return response
+
+
+def test_file_names_match_allowed_suffixes(s3_stub):
+    s3_stub.add_response(
+        "list_objects_v2",
+        page(["docs/a.pdf", "docs/B.PDF", "docs/c.txt", "docs/d.pdf.bak", "docs/notapdf", "docs/e.csv"]),
+        {"Bucket": BUCKET, "Prefix": "docs/"},
+    )
+
+    fileNames = S3Helper.getFileNames(BUCKET, "docs/", maxPages=5, allowedFileTypes=["pdf", "csv"])
+
+    assert fileNames == ["docs/a.pdf", "docs/B.PDF", "docs/e.csv"]
+
+
+def test_file_names_stop_at_max_pages(s3_stub):
+    s3_stub.add_response("list_objects_v2", page(["a.pdf"], "t1"), {"Bucket": BUCKET, "Prefix": ""})
+    s3_stub.add_response(
+        "list_objects_v2", page(["b.pdf"], "t2"), {"Bucket": BUCKET, "Prefix": "", "ContinuationToken": "t1"}
+    )
+
+    # the third page is never requested, the stubber would fail on an unexpected call
+    assert S3Helper.getFileNames(BUCKET, "", maxPages=2, allowedFileTypes=["pdf"]) == ["a.pdf", "b.pdf"]
+
+
+def test_closing_early_stops_the_producers():
+    produced = []
+    lock = threading.Lock()
+
+    def producer():
+        for i in range(100):
+            time.sleep(0.01)
+            with lock:
+                produced.append(i)
+            yield i
+
+    start = time.perf_counter()
+    values = iterConcurrently([producer() for _ in range(4)], maxWorkers=2)
+    next(values)
+    values.close()
+
+    # draining all four producers on two workers would take two seconds
+    assert time.perf_counter() - start < 0.5
+    time.sleep(0.1)
+    with lock:
+        total = len(produced)
+    time.sleep(0.1)
+    assert len(produced) == total < 100
+
+
+def test_producers_wait_for_a_slow_consumer():
+    produced = []
+
+    def producer():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    values = iterConcurrently([producer()], maxWorkers=1, maxBuffered=4)
+    next(values)
+    time.sleep(0.3)
+
+    # the value handed out, the buffered ones and the one waiting for room
+    assert len(produced) <= 6
+    assert list(values) == list(range(1, 100))
+
+
+def test_file_names_are_listed_per_shard(s3_stub):
+    root = page(["data/a.csv", "data/readme.md"])
+    root["CommonPrefixes"] = [{"Prefix": "data/2023/"}, {"Prefix": "data/2024/"}]
+    s3_stub.add_response("list_objects_v2", root, {"Bucket": BUCKET, "Prefix": "data/", "Delimiter": "/"})
+    s3_stub.add_response(
+        "list_objects_v2",
+        page(["data/2023/b.CSV", "data/2023/b.tmp"], "t1"),
+        {"Bucket": BUCKET, "Prefix": "data/2023/"},
+    )
+    s3_stub.add_response(
+        "list_objects_v2",
+        page(["data/2023/c.csv"]),
+        {"Bucket": BUCKET, "Prefix": "data/2023/", "ContinuationToken": "t1"},
+    )
+    s3_stub.add_response("list_objects_v2", page(["data/2024/d.csv"]), {"Bucket": BUCKET, "Prefix": "data/2024/"})
+
+    # a single worker lists the shards in order, so the stubbed responses are consumed deterministically
+    fileNames = list(S3Helper.iterFileNames(BUCKET, "data/", ["csv"], maxWorkers=1))
+
+    assert fileNames == ["data/a.csv", "data/2023/b.CSV", "data/2023/c.csv", "data/2024/d.csv"]
+
+
+def stub_ranged_reads(s3_stub, data, chunkSize):
+    s3_stub.add_response("head_object", {"ContentLength": len(data), "ETag": ETAG}, {"Bucket": BUCKET, "Key": KEY})
+    for start in range(0, len(data), chunkSize):
+        chunk = data[start : start + chunkSize]
+        s3_stub.add_response(
+            "get_object",
+            {"Body": StreamingBody(io.BytesIO(chunk), len(chunk))},
+            {"Bucket": BUCKET, "Key": KEY, "Range": f"bytes={start}-{start + len(chunk) - 1}", "IfMatch": ETAG},
+        )
+
+
+def test_lines_split_across_ranges_are_joined(s3_stub):
+    data = b"first line\r\nsecond line\nlast"
+    stub_ranged_reads(s3_stub, data, chunkSize=8)
+
+    assert list(S3Helper.iterLinesFromS3(BUCKET, KEY, chunkSize=8)) == ["first line", "second line", "last"]
+
+
+def test_characters_split_across_ranges_are_decoded(s3_stub):
+    data = "aé€\nb".encode()
+    # every range ends inside a multi-byte character
+    stub_ranged_reads(s3_stub, data, chunkSize=2)
+
+    assert list(S3Helper.iterLinesFromS3(BUCKET, KEY, chunkSize=2)) == ["aé€", "b"]
+
+
+def test_small_objects_are_written_with_a_single_put(s3_stub):
+    s3_stub.add_response("put_object", {}, {"Bucket": BUCKET, "Key": KEY, "Body": b'{"a": 1}\n{"a": 2}\n'})
+
+    assert S3Helper.writeJSONLinesStream([{"a": 1}, {"a": 2}], BUCKET, KEY) == 18
+
+
+def stub_first_part(s3_stub):
+    s3_stub.add_response("create_multipart_upload", {"UploadId": "upload"}, {"Bucket": BUCKET, "Key": KEY})
+    s3_stub.add_response(
+        "upload_part",
+        {"ETag": '"part-1"'},
+        {"Bucket": BUCKET, "Key": KEY, "UploadId": "upload", "PartNumber": 1, "Body": ANY},
+    )
+
+
+def test_large_objects_are_written_in_parts(s3_stub):
+    stub_first_part(s3_stub)
+    s3_stub.add_response(
+        "upload_part",
+        {"ETag": '"part-2"'},
+        {"Bucket": BUCKET, "Key": KEY, "UploadId": "upload", "PartNumber": 2, "Body": b"tail"},
+    )
+    s3_stub.add_response(
+        "complete_multipart_upload",
+        {},
+        {
+            "Bucket": BUCKET,
+            "Key": KEY,
+            "UploadId": "upload",
+            "MultipartUpload": {
+                "Parts": [{"ETag": '"part-1"', "PartNumber": 1}, {"ETag": '"part-2"', "PartNumber": 2}]
+            },
+        },
+    )
+
+    with S3MultipartWriter(BUCKET, KEY, partSize=S3MultipartWriter.MIN_PART_SIZE) as s3File:
+        s3File.write(b"x" * S3MultipartWriter.MIN_PART_SIZE)
+        # the final part may be smaller than the minimum part size
+        s3File.write(b"tail")
+
+    assert s3File.bytesWritten == S3MultipartWriter.MIN_PART_SIZE + 4
+
+
+def test_failed_write_aborts_the_upload(s3_stub):
+    stub_first_part(s3_stub)
+    s3_stub.add_response("abort_multipart_upload", {}, {"Bucket": BUCKET, "Key": KEY, "UploadId": "upload"})
+
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter(BUCKET, KEY) as s3File:
+            s3File.write(b"x" * S3MultipartWriter.MIN_PART_SIZE * 2)
+            raise RuntimeError("record could not be serialized")
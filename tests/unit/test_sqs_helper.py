@@ -0,0 +1,40 @@
+import pytest
+from aws_helper import AwsHelper, SQSBatchProducer, SQSHelper
+from botocore.exceptions import ClientError
+from botocore.stub import ANY, Stubber
+
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/123456789012/queue"
+
+
+@pytest.fixture
+def sqs_stub():
+    client = AwsHelper().get_client("sqs")
+    with Stubber(client) as stubber:
+        yield stubber
+
+
+def test_flush_raises_error_of_finished_batch(sqs_stub):
+    sqs_stub.add_client_error("send_message_batch", service_error_code="AccessDenied")
+    sqs_stub.add_response("send_message_batch", {"Successful": [], "Failed": []})
+    producer = SQSBatchProducer(QUEUE_URL, maxWaitSeconds=60, maxInFlight=1)
+    for i in range(2 * SQSBatchProducer.MAX_BATCH_ENTRIES):
+        # the second batch is submitted once the first one has failed
+        producer.send({"i": i})
+
+    with pytest.raises(ClientError):
+        producer.close()
+
+
+def test_failed_entries_are_reported(sqs_stub):
+    sqs_stub.add_response(
+        "send_message_batch",
+        {
+            "Successful": [{"Id": "1", "MessageId": "m1", "MD5OfMessageBody": "x"}],
+            "Failed": [{"Id": "0", "SenderFault": True, "Code": "InvalidMessageContents"}],
+        },
+        {"QueueUrl": QUEUE_URL, "Entries": ANY},
+    )
+
+    failed = SQSHelper.postMessages(QUEUE_URL, [{"i": 0}, {"i": 1}])
+
+    assert [failure["Id"] for failure in failed] == ["0"]
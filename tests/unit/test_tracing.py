@@ -0,0 +1,50 @@
+import pytest
+import tracing
+
+INCOMING_TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+INCOMING_SPAN_ID = "b7ad6b7169203331"
+
+
+@pytest.fixture
+def exporter():
+    exporter = tracing.InMemoryExporter()
+    previous = tracing.setExporter(exporter)
+    yield exporter
+    tracing.setExporter(previous)
+
+
+def api_event(headers=None):
+    return {"requestContext": {"http": {"method": "GET"}}, "routeKey": "GET /items", "headers": headers or {}}
+
+
+def test_handler_spans_continue_incoming_trace(exporter):
+    @tracing.tracedHandler
+    def handler(event, context):
+        with tracing.startSpan("load items"):
+            with tracing.startSpan("read catalog"):
+                pass
+        return {"statusCode": 200, "body": "[]", "headers": {"Content-Type": "application/json"}}
+
+    response = handler(api_event({"Traceparent": f"00-{INCOMING_TRACE_ID}-{INCOMING_SPAN_ID}-01"}), None)
+
+    spans = {span.name: span for span in exporter.getFinishedSpans(INCOMING_TRACE_ID)}
+    root, child, grandchild = spans[f"lambda {handler.__module__}"], spans["load items"], spans["read catalog"]
+    assert root.parentId == INCOMING_SPAN_ID
+    assert child.parentId == root.spanId
+    assert grandchild.parentId == child.spanId
+    assert root.attributes["http.status_code"] == 200
+
+    headers = response["headers"]
+    assert headers["Content-Type"] == "application/json"
+    assert headers[tracing.TRACE_ID_HEADER] == INCOMING_TRACE_ID
+    assert headers[tracing.TRACEPARENT_HEADER] == f"00-{INCOMING_TRACE_ID}-{root.spanId}-01"
+    assert headers["Server-Timing"] == f"lambda;dur={root.durationMs}"
+
+
+def test_non_proxy_response_is_returned_unchanged(exporter):
+    @tracing.tracedHandler
+    def handler(event, context):
+        return {"items": []}
+
+    assert handler(api_event(), None) == {"items": []}
+    assert len(exporter.getFinishedSpans()) == 1